@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 
-import cv2, sys, time
+import cv2, sys, time, os
 
+from frames import VideoReader, FrameCache # Frame source
 import read
+from detections import DetectionIndex # Valid annotated boxes of each frame
 
 import logging
 logging.basicConfig(level = logging.INFO, # Messages on terminal
@@ -10,7 +12,7 @@ logging.basicConfig(level = logging.INFO, # Messages on terminal
                     datefmt = '%H:%M:%S')
 
 
-def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, limbo=True):
+def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, limbo=True, frame_cache=False, frame_scale=1.0):
     
     final_frame = initial_frame+num_frames-1
     if num_frames < 1:
@@ -26,21 +28,33 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, limbo=True):
 
     data_path = paths['data_path']
     videos_path = paths['videos_path']
+    output_path = paths['output_path']
 
     # Video to load
     video_file = '30min_day'+str(day)+'_cam'+str(camera)+'_20fps_960x540.MP4'
     video_name = 'Day '+str(day)+' Camera '+str(camera)
         
-    cap = cv2.VideoCapture(videos_path+video_file) # Capture object to read video
+    cache_path = None
+    index_file = None
+    cache = None
+    if os.path.isdir(output_path): # Caches kept next to the output
+        cache_path = read.get_cache_path(output_path)
+        index_file = cache_path+'FrameIndex_day'+str(day)+'_cam'+str(camera)+'.npz'
+        if frame_cache: # Decoded frames are kept for the next runs
+            cache = FrameCache(cache_path+'Frames_day'+str(day)+'_cam'+str(camera), initial_frame, final_frame, scale=frame_scale, video_file=videos_path+video_file)
+    cap = VideoReader(videos_path+video_file, index_file=index_file, frame_cache=cache) # Object to read video
     if not cap.isOpened(): # Exit if video not opened
         logging.info('Could not open the video\n')
         sys.exit()
-    cap.set(cv2.CAP_PROP_POS_FRAMES, initial_frame) # Set the first frame to read
+    if not cap.seek(initial_frame): # Set the first frame to read
+        logging.info('Unable to read the video file\n')
+        sys.exit()
     logging.info(f'Selected video: {video_name}\n')
     
     # Read annotations
     logging.info('Getting annotations ...\n')
-    det_full, cam_full, lost_full = read.read_annotations(path=data_path, day=day, initial_frame=initial_frame, num_frames=num_frames)
+    det_full, cam_full, lost_full = read.read_annotations(path=data_path, day=day, initial_frame=initial_frame, num_frames=num_frames, cache_path=cache_path)
+    detection_index = DetectionIndex(det=det_full, cam=cam_full, lost=lost_full, camera=camera, limbo=limbo)
 
     frame_index = initial_frame
     
@@ -55,13 +69,14 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, limbo=True):
         if not ret: # Exit if reading failure
             logging.info('Unable to read the video file\n')
             break
+        frame = frame.copy() # Cached frames are read-only
         
         # Print frame number on image
         cv2.putText(frame, 'Frame:', (25,25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, blue, 2)
         cv2.putText(frame, str(frame_index), (25,50), cv2.FONT_HERSHEY_SIMPLEX, 0.6, blue, 2)
         
         # Read bounding boxes from the frame
-        annotations, centers, num_part = read_detections(det=det_full, cam=cam_full, lost=lost_full, camera=camera, frame_index=frame_index-initial_frame)
+        annotations, centers, num_part = read_detections(detection_index=detection_index, frame_index=frame_index-initial_frame)
 
         # Print number of people annotated
         cv2.putText(frame, 'People:', (875,25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, blue, 2)
@@ -107,50 +122,14 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, limbo=True):
     logging.info(f'{frame_index-initial_frame} frames processed ({initial_frame}-{frame_index-1})\n')
 
 
-def read_detections(det, cam, lost, camera, frame_index):
-    
-    det = det[frame_index]
-    cam = cam[frame_index]
-    lost = lost[frame_index]
-    
-    if limbo:
-        l = (82, 72.5)
-    else:
-        l = (0,0)
-
+def read_detections(detection_index, frame_index):
+    boxes, participants = detection_index.get(frame_index)
     detections = {}
     centers = {}
-    num_part = 0
-
-    for i, num_cam in enumerate(cam):
-        if (num_cam == camera) and (lost[i] == 0): # If the person is annotated on the right camera and is not lost
-            detection = (det[1+i*7], det[2+i*7], det[3+i*7], det[4+i*7]) # Coordinates of bboxes.
-            center = get_center(box=detection)
-            if good_box(box=detection, center=center, limbo=l): # Check if valid box
-                detections[i] = detection
-                centers[i] = center
-                num_part += 1
-        
-    return detections, centers, num_part
-
-def good_box(box, center, limbo):
-    limbo = limbo
-    if (box != (0,0,0,0)) and (limbo[0] <= center[0] < 960-limbo[0]) and (limbo[1] <= center[1] < 540-limbo[1]): # If box inside permitted region
-        approved = True
-    else:
-        approved = False 
-    return approved
-
-def get_center(box):
-    x1 = box[0]
-    y1 = box[1]
-    x2 = box[2]
-    y2 = box[3]
-        
-    xc = (x1+x2)/2
-    yc = (y1+y2)/2
-    center = (xc, yc)
-    return center
+    for i, box in zip(participants, boxes):
+        detections[int(i)] = tuple(box) # Coordinates of bboxes
+        centers[int(i)] = ((box[0]+box[2])/2, (box[1]+box[3])/2)
+    return detections, centers, len(detections)
 
 
 if __name__ == '__main__':
@@ -160,12 +139,13 @@ if __name__ == '__main__':
         camera = int(sys.argv[2])
         initial_frame = int(sys.argv[3])
         num_frames = int(sys.argv[4])
+        options = read.read_options(sys.argv[5:], {'frame_cache': False, 'frame_scale': 1.0})
     except:
         print('Parameters not given correctly\n')
-        print('Usage:\n\tpython3 annotations.py day camera initial_frame num_frames\n')
+        print('Usage:\n\tpython3 annotations.py day camera initial_frame num_frames [--frame-cache] [--frame-scale scale]\n')
         print('Example:\n\tpython3 annotations.py 2 3 700 300\n')
         sys.exit()
 
     paths = read.read_paths()
 
-    main(paths, day, camera, initial_frame, num_frames, limbo)
\ No newline at end of file
+    main(paths, day, camera, initial_frame, num_frames, limbo, **options)
\ No newline at end of file
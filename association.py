@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+MAX_DENSE = 2500 # Track/detection pairs over which only the overlapping pairs are assigned
+
+
+def get_iou(a, b):
+    # IoU between every pair of boxes (x1,y1,x2,y2) of two sets: ... x A x 4 and ... x B x 4 give ... x A x B (0 for empty boxes)
+    a = np.asarray(a, dtype=np.float64)[..., :, None, :]
+    b = np.asarray(b, dtype=np.float64)[..., None, :, :]
+    w_intsec = np.maximum(0, np.minimum(a[..., 2], b[..., 2])-np.maximum(a[..., 0], b[..., 0]))
+    h_intsec = np.maximum(0, np.minimum(a[..., 3], b[..., 3])-np.maximum(a[..., 1], b[..., 1]))
+    s_intsec = w_intsec*h_intsec
+    s_a = (a[..., 2]-a[..., 0])*(a[..., 3]-a[..., 1])
+    s_b = (b[..., 2]-b[..., 0])*(b[..., 3]-b[..., 1])
+    union = s_a+s_b-s_intsec
+    return np.where(union > 0, s_intsec/np.where(union > 0, union, 1), 0)
+
+def assign_detections(tracks, detections, iou_th, max_dense=MAX_DENSE):
+    # Detections assigned to the last boxes of the tracks maximizing the total IoU; assigned pairs under 'iou_th' percent of IoU are left unmatched
+    tracks = np.asarray(tracks, dtype=np.float64).reshape(-1, 4)
+    detections = np.asarray(detections, dtype=np.float64).reshape(-1, 4)
+    if (len(tracks)*len(detections) <= max_dense) or (iou_th <= 0): # Small frames, or pairs without overlap can be matched
+        return assign_iou(get_iou(tracks, detections).astype(np.float32), iou_th=iou_th)
+    rows, cols, values = assign_sparse(tracks, detections)
+    return get_matches(rows, cols, values, num_tracks=len(tracks), num_detections=len(detections), iou_th=iou_th)
+
+def assign_iou(iou_mat, iou_th):
+    # Dense assignment from an IoU matrix (tracks x detections) already computed
+    rows, cols = linear_sum_assignment(-iou_mat) # Sorted by track
+    return get_matches(rows, cols, iou_mat[rows, cols], num_tracks=iou_mat.shape[0], num_detections=iou_mat.shape[1], iou_th=iou_th)
+
+def get_matches(rows, cols, values, num_tracks, num_detections, iou_th):
+    # Matches sorted by track; unmatched detections and tracks: the ones not assigned, then the ones assigned under the threshold
+    assigned_tracks = np.zeros(num_tracks, dtype=bool)
+    assigned_tracks[rows] = True
+    assigned_detections = np.zeros(num_detections, dtype=bool)
+    assigned_detections[cols] = True
+    low = values < iou_th/100
+
+    matches = np.stack([rows[~low], cols[~low]], axis=1)
+    unmatched_detections = np.concatenate([np.nonzero(~assigned_detections)[0], cols[low]])
+    unmatched_tracks = np.concatenate([np.nonzero(~assigned_tracks)[0], rows[low]])
+    return matches, unmatched_detections, unmatched_tracks
+
+def assign_sparse(tracks, detections):
+    # Assignment restricted to overlapping pairs: each connected component of the overlaps is solved on its own
+    i, j = get_overlapping_pairs(tracks, detections)
+    values = get_iou(tracks[i][:, None, :], detections[j][:, None, :])[:, 0, 0].astype(np.float32)
+    keep = values > 0
+    i, j, values = i[keep], j[keep], values[keep]
+    if len(i) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    num_tracks = len(tracks)
+    num_nodes = num_tracks+len(detections) # Tracks, then detections
+    graph = coo_matrix((np.ones(len(i)), (i, num_tracks+j)), shape=(num_nodes, num_nodes))
+    num_components, labels = connected_components(graph, directed=False)
+    component = labels[i] # Component of each pair
+    track_count = np.bincount(labels[:num_tracks], minlength=num_components)
+    detection_count = np.bincount(labels[num_tracks:], minlength=num_components)
+
+    # Components of a single pair need no assignment
+    single = (track_count[component] == 1) & (detection_count[component] == 1)
+    rows, cols, assigned = [i[single]], [j[single]], [values[single]]
+    order = np.argsort(component[~single], kind='stable')
+    i, j, values, component = i[~single][order], j[~single][order], values[~single][order], component[~single][order]
+    bounds = np.flatnonzero(np.diff(component))+1
+    for first, last in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(component)]])):
+        if first == last:
+            continue
+        t, ti = np.unique(i[first:last], return_inverse=True)
+        d, di = np.unique(j[first:last], return_inverse=True)
+        iou_mat = np.zeros((len(t), len(d)), dtype=np.float32)
+        iou_mat[ti, di] = values[first:last]
+        r, c = linear_sum_assignment(-iou_mat)
+        rows.append(t[r])
+        cols.append(d[c])
+        assigned.append(iou_mat[r, c])
+
+    rows, cols, assigned = np.concatenate(rows), np.concatenate(cols), np.concatenate(assigned)
+    order = np.argsort(rows)
+    return rows[order], cols[order], assigned[order]
+
+def get_overlapping_pairs(a, b):
+    # Pairs (i, j) of boxes of 'a' and 'b' that may intersect: sweep over the boxes of 'b' sorted by their left side
+    if (len(a) == 0) or (len(b) == 0):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    order = np.argsort(b[:, 0], kind='stable')
+    x1 = b[order, 0]
+    max_width = max(0, (b[:, 2]-b[:, 0]).max())
+    first = np.searchsorted(x1, a[:, 0]-max_width, side='right') # Boxes of 'b' ending after the left side of the box of 'a'
+    last = np.searchsorted(x1, a[:, 2], side='left') # Boxes of 'b' starting before the right side of the box of 'a'
+    counts = np.maximum(last-first, 0)
+    i = np.repeat(np.arange(len(a)), counts)
+    starts = np.repeat(first, counts)
+    steps = np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts, counts)
+    return i, order[starts+steps]
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+import sys, os, glob, time, numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import read
+from frames import load_index # Seek index of the videos
+from ground_truth import ground_truth
+from participants_history import participants_history
+import tracker, hungarian
+import tracker_evaluation, hungarian_evaluation
+import tracker_ids_study, hungarian_ids_study
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+# Seconds per frame of each kind of job when there are no previous runs to estimate it
+DEFAULT_COSTS = {'index': 0.001, 'prepare': 0.002, 'tracker': 0.05, 'hungarian': 0.002, 'evaluation': 0.005, 'ids_study': 0.001}
+
+
+def main(paths, methods=['tracker'], days=[2], cameras=[3], params=[0], initial_frame=0, num_frames=36000, processes=0):
+
+    final_frame = initial_frame+num_frames-1
+    if num_frames < 1:
+        logging.info('Number of frames needs to be higher than 0\n')
+        sys.exit()
+    if final_frame > 35999:
+        if initial_frame > 35999:
+            logging.info('Invalid initial frame (0-35999)\n')
+            sys.exit()
+        else:
+            final_frame = 35999
+            num_frames = final_frame+1-initial_frame
+    if any(method not in ('tracker', 'hungarian') for method in methods):
+        logging.info('Invalid method (tracker or hungarian)\n')
+        sys.exit()
+
+    output_path = paths['output_path']
+    if not os.path.isdir(output_path):
+        logging.info('Output directory does not exist\n')
+        sys.exit()
+
+    # Directories and files shared by the jobs are created before starting the processes
+    prepare_output(paths=paths, methods=methods, days=days)
+
+    jobs = get_jobs(paths=paths, methods=methods, days=days, cameras=cameras, params=params, initial_frame=initial_frame, num_frames=num_frames)
+    stale = get_stale_jobs(jobs)
+    logging.info(f'{len(jobs)} jobs, {len(stale)} to run ({len(jobs)-len(stale)} up to date)\n')
+
+    ti = time.time() # Start timer
+    failed = schedule(paths=paths, jobs=jobs, stale=stale, processes=processes if processes > 0 else os.cpu_count())
+    logging.info(f'Batch completed in {time.time()-ti} seconds, {len(failed)} jobs failed or skipped\n')
+
+
+def prepare_output(paths, methods, days):
+    output_path = paths['output_path']
+    for name in ['ground_truth/', 'participants_history/']+[method+'/' for method in methods]:
+        if not os.path.isdir(output_path+name):
+            os.mkdir(output_path+name)
+    cache_path = read.get_cache_path(output_path)
+    for day in days:
+        read.load_annotations_cache(path=paths['data_path'], day=day, cache_path=cache_path)
+
+def get_jobs(paths, methods, days, cameras, params, initial_frame, num_frames):
+    # Jobs of the grid in dependency order: each job only depends on jobs before it
+    output_path = paths['output_path']
+    cache_path = output_path+'cache/'
+    window = str(initial_frame)+'-'+str(initial_frame+num_frames-1)
+    annotations = [paths['data_path']+name for name in ('DATA.csv', 'CAMERA.csv', 'LOST.csv')]
+    jobs = []
+    for day in days:
+        for camera in cameras:
+            video = 'day'+str(day)+'_cam'+str(camera)
+            prepare = get_job(name='prepare_'+video, kind='prepare', method=None, day=day, camera=camera, param=None, initial_frame=initial_frame, num_frames=num_frames,
+                              inputs=annotations,
+                              outputs=[output_path+'ground_truth/GroundTruth_'+video+'_limbo.csv', output_path+'participants_history/ParticipantsHistory_'+video+'_'+window+'_limbo.csv'],
+                              deps=[])
+            jobs.append(prepare)
+            run_deps = [prepare['name']]
+            if 'tracker' in methods: # Seek index of the video, read by the runs of the tracker
+                index = get_job(name='index_'+video, kind='index', method=None, day=day, camera=camera, param=None, initial_frame=initial_frame, num_frames=num_frames,
+                                inputs=[paths['videos_path']+'30min_'+video+'_20fps_960x540.MP4'], outputs=[cache_path+'FrameIndex_'+video+'.npz'], deps=[])
+                jobs.append(index)
+                run_deps.append(index['name'])
+
+            for method in methods:
+                for param in params:
+                    prefix = output_path+method+'/'
+                    name = method+'_'+video+'_'+str(param)
+                    suffix = video+'_'+str(param)+'_'+window
+                    run = get_job(name='run_'+name, kind=method, method=method, day=day, camera=camera, param=param, initial_frame=initial_frame, num_frames=num_frames,
+                                  inputs=annotations, outputs=[prefix+'Results_'+suffix+'.trk'], deps=run_deps)
+                    evaluation = get_job(name='evaluation_'+name, kind='evaluation', method=method, day=day, camera=camera, param=param, initial_frame=initial_frame, num_frames=num_frames,
+                                         inputs=run['outputs']+prepare['outputs'][:1], outputs=[prefix+'Evaluation_'+suffix+'.csv'], deps=[run['name'], prepare['name']])
+                    ids_study = get_job(name='ids_study_'+name, kind='ids_study', method=method, day=day, camera=camera, param=param, initial_frame=initial_frame, num_frames=num_frames,
+                                        inputs=run['outputs']+prepare['outputs'][:2], outputs=[prefix+'IDInfo_'+suffix+'.csv'], deps=[run['name'], prepare['name']])
+                    jobs += [run, evaluation, ids_study]
+
+    for job in jobs:
+        job['cost'] = estimate_cost(paths=paths, job=job)
+    return jobs
+
+def get_job(name, kind, method, day, camera, param, initial_frame, num_frames, inputs, outputs, deps):
+    # Description of a job, made only of basic types
+    return {'name': name,
+            'kind': kind, # index, prepare, tracker, hungarian, evaluation or ids_study
+            'method': method,
+            'day': day,
+            'camera': camera,
+            'param': param,
+            'initial_frame': initial_frame,
+            'num_frames': num_frames,
+            'inputs': inputs, # Files the outputs are computed from (the job runs again if they change)
+            'outputs': outputs,
+            'deps': deps} # Names of the jobs that have to finish before it starts
+
+def estimate_cost(paths, job):
+    # Expected seconds of a job, from the run times saved by previous runs of the same kind
+    kind = job['kind']
+    per_frame = DEFAULT_COSTS[kind]
+    if kind in ('tracker', 'hungarian', 'evaluation'):
+        prefix = 'EvalTime' if kind == 'evaluation' else 'Time'
+        pattern = paths['output_path']+(job['method'] or kind)+'/'+prefix+'_day*_cam*_'+str(job['param'])+'_*-*.csv'
+        rates = []
+        for name in glob.glob(pattern):
+            try:
+                first, last = [int(f) for f in name[:-4].split('_')[-1].split('-')]
+                rates.append(float(np.loadtxt(name, ndmin=1)[0])/(last+1-first))
+            except ValueError: # Other files with the same prefix
+                continue
+        if rates:
+            per_frame = float(np.median(rates))
+        elif kind == 'tracker': # Hypotheses are kept for N frames
+            per_frame *= job['param']+1
+    return per_frame*job['num_frames']
+
+def is_up_to_date(job):
+    # Outputs exist and are newer than the inputs
+    if not all(os.path.isfile(name) for name in job['outputs']):
+        return False
+    inputs = [os.path.getmtime(name) for name in job['inputs'] if os.path.isfile(name)]
+    return (not inputs) or (min(os.path.getmtime(name) for name in job['outputs']) >= max(inputs))
+
+def get_stale_jobs(jobs):
+    # Jobs to run: outputs missing or older than the inputs, or inputs that are going to be computed again
+    stale = set()
+    producers = {} # Output file -> name of the job writing it
+    for job in jobs:
+        if any(producers.get(name) in stale for name in job['inputs']) or not is_up_to_date(job):
+            stale.add(job['name'])
+        for name in job['outputs']:
+            producers[name] = job['name']
+    return stale
+
+def get_ranks(jobs, stale):
+    # Cost of the longest chain of jobs to run starting at each job
+    ranks = {}
+    children = {}
+    for job in jobs:
+        for dep in job['deps']:
+            children.setdefault(dep, []).append(job['name'])
+    for job in reversed(jobs):
+        cost = job['cost'] if job['name'] in stale else 0
+        ranks[job['name']] = cost+max([ranks[child] for child in children.get(job['name'], [])], default=0)
+    return ranks
+
+def schedule(paths, jobs, stale, processes):
+    # Run the stale jobs on a process pool, longest chains first, as soon as their dependencies finish
+    ranks = get_ranks(jobs=jobs, stale=stale)
+    pending = {job['name']: job for job in jobs if job['name'] in stale}
+    done = set(job['name'] for job in jobs if job['name'] not in stale)
+    failed = set()
+    running = {} # Future -> job name
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        while pending or running:
+            # Jobs depending on a failed one are not run
+            dropped = True
+            while dropped:
+                dropped = False
+                for name, job in list(pending.items()):
+                    if any(dep in failed for dep in job['deps']):
+                        logging.info(f'Skipping {name}: a dependency failed\n')
+                        failed.add(name)
+                        del pending[name]
+                        dropped = True
+
+            ready = [job for job in pending.values() if all(dep in done for dep in job['deps'])]
+            for job in sorted(ready, key=lambda job: ranks[job['name']], reverse=True)[:processes-len(running)]:
+                logging.info(f'Starting {job["name"]} (estimated {job["cost"]:.0f} s)\n')
+                running[pool.submit(run_job, paths, job)] = job['name']
+                del pending[job['name']]
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    done.add(name)
+                    logging.info(f'Finished {name}\n')
+                except BaseException as e:
+                    failed.add(name)
+                    logging.info(f'Job {name} failed: {e!r}\n')
+    return failed
+
+def run_job(paths, job):
+    day, camera, param = job['day'], job['camera'], job['param']
+    initial_frame, num_frames = job['initial_frame'], job['num_frames']
+    try:
+        if job['kind'] == 'index':
+            load_index(video_file=job['inputs'][0], index_file=job['outputs'][0])
+            os.utime(job['outputs'][0]) # The index is kept if the video did not change
+        elif job['kind'] == 'prepare':
+            # Files read by several jobs of the same video
+            ground_truth(paths=paths, day=day, camera=camera, limbo=True)
+            for f in sorted(range(-1, num_frames, 1000), reverse=True): # Windows of the ID studies
+                if f > 0:
+                    participants_history(paths=paths, day=day, camera=camera, initial_frame=initial_frame, num_frames=f+1, limbo=True)
+            participants_history(paths=paths, day=day, camera=camera, initial_frame=initial_frame, num_frames=num_frames, limbo=True)
+        elif job['kind'] == 'tracker':
+            tracker.main(paths, day, camera, initial_frame, num_frames, param)
+        elif job['kind'] == 'hungarian':
+            hungarian.main(paths, day, camera, initial_frame, num_frames, param)
+        elif job['kind'] == 'evaluation':
+            evaluation = tracker_evaluation if job['method'] == 'tracker' else hungarian_evaluation
+            evaluation.main(paths, day, camera, initial_frame, num_frames, param)
+        elif job['kind'] == 'ids_study':
+            ids_study = tracker_ids_study if job['method'] == 'tracker' else hungarian_ids_study
+            ids_study.main(paths, day, camera, initial_frame, num_frames, param)
+    except SystemExit: # The scripts exit on errors
+        raise RuntimeError(job['name']+' exited')
+    missing = [name for name in job['outputs'] if not os.path.isfile(name)]
+    if missing:
+        raise RuntimeError('Outputs not written: '+', '.join(missing))
+
+def get_list(arg):
+    return [int(value) for value in arg.split(',')]
+
+if __name__ == '__main__':
+
+    try:
+        methods = sys.argv[1].split(',')
+        days = get_list(sys.argv[2])
+        cameras = get_list(sys.argv[3])
+        params = get_list(sys.argv[4])
+        initial_frame = int(sys.argv[5])
+        num_frames = int(sys.argv[6])
+        options = read.read_options(sys.argv[7:], {'processes': 0})
+    except:
+        print('Parameters not given correctly\n')
+        print('Usage:\n\tpython3 batch.py methods days cameras params initial_frame num_frames [--processes n]\n')
+        print('Where methods is tracker and/or hungarian, and params the N_pruning or IoU threshold values (comma separated lists)\n')
+        print('Example:\n\tpython3 batch.py tracker 1,2,3 1,2,3 0,1,2 0 36000\n')
+        sys.exit()
+
+    paths = read.read_paths()
+
+    main(paths, methods, days, cameras, params, initial_frame, num_frames, **options)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import sys, os, json, time, socket, platform, numpy as np
+
+import read
+import synthetic # Synthetic scenes
+import tracker, hungarian, tracker_evaluation, hungarian_evaluation
+from batch import get_list
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+# Stages of the tracker spent inside MHT.run
+MHT_STAGES = ['histograms', 'gating', 'conflicts', 'mwis', 'pruning']
+
+
+def main(bench_path, targets, N_values, lengths, day=2, camera=3, iou_th=10, seed=0, occlusions=2.0, exits=1.0, repeat=1, baseline='', tolerance=1.5):
+    # Times of the tracker (MHT.run and MWIS), the Hungarian baseline and the evaluations on synthetic scenes of every size
+    if not os.path.isdir(bench_path):
+        os.makedirs(bench_path)
+
+    cases = []
+    for num_frames in lengths:
+        for num_targets in targets:
+            scenario_path = bench_path+'T'+str(num_targets)+'_F'+str(num_frames)+'_S'+str(seed)+'/'
+            paths = synthetic.main(scenario_path, num_targets=num_targets, num_frames=num_frames, day=day, camera=camera, seed=seed, occlusions=occlusions, exits=exits)
+            scene = {'targets': num_targets, 'frames': num_frames}
+
+            times = best_of(repeat, lambda: {'hungarian': timed(hungarian.main, paths, day, camera, 0, num_frames, iou_th)})
+            times.update(best_of(repeat, lambda: {'hungarian_evaluation': timed(hungarian_evaluation.main, paths, day, camera, 0, num_frames, iou_th)}))
+            cases.append(dict(scene, N=None, times=times))
+
+            for N in N_values:
+                times = best_of(repeat, lambda: run_tracker(paths, day, camera, num_frames, N))
+                times.update(best_of(repeat, lambda: {'tracker_evaluation': timed(tracker_evaluation.main, paths, day, camera, 0, num_frames, N)}))
+                cases.append(dict(scene, N=N, times=times))
+            log_cases(cases[-len(N_values)-1:])
+
+    report = {'host': socket.gethostname(),
+              'python': platform.python_version(),
+              'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'options': {'day': day, 'camera': camera, 'iou_th': iou_th, 'seed': seed, 'occlusions': occlusions, 'exits': exits, 'repeat': repeat},
+              'cases': cases,
+              'scaling': get_scaling(cases)}
+    for fit in report['scaling']:
+        logging.info(f'{fit["metric"]} ~ {fit["axis"]}^{fit["exponent"]:.2f} ({fit["fixed"]})')
+    if baseline:
+        report['regressions'] = compare(cases, baseline=baseline, tolerance=tolerance)
+
+    report_file = bench_path+'Benchmark_'+time.strftime('%Y%m%d-%H%M%S')+'.json'
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=1)
+    logging.info(f'Benchmark saved to: {report_file}\n')
+    return report
+
+
+def timed(function, *args):
+    ti = time.perf_counter()
+    function(*args)
+    return time.perf_counter()-ti
+
+def best_of(repeat, run):
+    # Lowest time of each metric over the repetitions
+    best = {}
+    for r in range(repeat):
+        for metric, seconds in run().items():
+            best[metric] = min(seconds, best.get(metric, seconds))
+    return best
+
+def run_tracker(paths, day, camera, num_frames, N):
+    total = timed(lambda: tracker.main(paths, day, camera, 0, num_frames, N, checkpoint_interval=0, timing=True))
+    stages_file = paths['output_path']+'tracker/Stages_day'+str(day)+'_cam'+str(camera)+'_'+str(N)+'_0-'+str(num_frames-1)+'.json'
+    with open(stages_file) as f:
+        stages = json.load(f)['stages']
+    return {'tracker': total,
+            'mht_run': sum(stages[name]['total'] for name in MHT_STAGES if name in stages),
+            'mwis': stages['mwis']['total'] if 'mwis' in stages else 0}
+
+def log_cases(cases):
+    for case in cases:
+        name = f'{case["targets"]} targets, {case["frames"]} frames'+('' if case['N'] is None else f', N={case["N"]}')
+        logging.info(name+': '+', '.join(f'{metric} {seconds:.3f} s' for metric, seconds in case['times'].items())+'\n')
+
+def get_scaling(cases, min_time=0.05):
+    # Exponent of the time of each metric against the number of targets and the sequence length, with the other parameters fixed (not fitted on times under 'min_time' seconds)
+    fits = []
+    for axis, others in (('targets', ('frames', 'N')), ('frames', ('targets', 'N'))):
+        groups = {}
+        for case in cases:
+            groups.setdefault(tuple(case[key] for key in others), []).append(case)
+        for key, group in groups.items():
+            if len(set(case[axis] for case in group)) < 2:
+                continue
+            for metric in group[0]['times']:
+                if max(case['times'][metric] for case in group) < min_time:
+                    continue
+                x = np.log([case[axis] for case in group])
+                t = np.log([max(case['times'][metric], 1e-6) for case in group])
+                fits.append({'metric': metric, 'axis': axis, 'fixed': dict(zip(others, key)), 'exponent': float(np.polyfit(x, t, 1)[0])})
+    return fits
+
+def compare(cases, baseline, tolerance, min_time=0.05):
+    # Metrics slower than 'tolerance' times the same case of the baseline report (times under 'min_time' seconds are noise)
+    with open(baseline) as f:
+        previous = {(case['targets'], case['frames'], case['N']): case['times'] for case in json.load(f)['cases']}
+    regressions = []
+    for case in cases:
+        times = previous.get((case['targets'], case['frames'], case['N']), {})
+        for metric, seconds in case['times'].items():
+            if (metric in times) and (seconds > min_time) and (seconds > tolerance*times[metric]):
+                regressions.append({'targets': case['targets'], 'frames': case['frames'], 'N': case['N'], 'metric': metric, 'baseline': times[metric], 'time': seconds})
+                logging.info(f'Regression: {metric} with {case["targets"]} targets, {case["frames"]} frames, N={case["N"]}: {times[metric]:.3f} s -> {seconds:.3f} s')
+    logging.info(f'{len(regressions)} regressions against {baseline}\n')
+    return regressions
+
+if __name__ == '__main__':
+
+    try:
+        bench_path = os.path.join(sys.argv[1], '')
+        options = read.read_options(sys.argv[2:], {'targets': '2,4,8', 'n': '0,1', 'lengths': '200,400', 'day': 2, 'camera': 3, 'iou_th': 10, 'seed': 0, 'occlusions': 2.0, 'exits': 1.0, 'repeat': 1, 'baseline': '', 'tolerance': 1.5})
+        targets = get_list(options.pop('targets'))
+        N_values = get_list(options.pop('n'))
+        lengths = get_list(options.pop('lengths'))
+    except:
+        print('Parameters not given correctly\n')
+        print('Usage:\n\tpython3 benchmark.py bench_path [--targets list] [--n list] [--lengths list] [--repeat r] [--baseline report] [--tolerance ratio]\n')
+        print('Example:\n\tpython3 benchmark.py /tmp/bench/ --targets 2,4,8,16 --n 0,1,2 --lengths 500,1000 --baseline /tmp/bench/Benchmark_20240101-120000.json\n')
+        sys.exit()
+
+    main(bench_path, targets, N_values, lengths, **options)
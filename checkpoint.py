@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import os, pickle, threading
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+
+class Checkpointer:
+    '''
+    Snapshots of a run written from a background thread, to resume it if it is interrupted
+    '''
+    def __init__(self, file_prefix):
+        self.state_file = file_prefix+'.ckpt' # Last complete state
+        self.log_file = file_prefix+'.log' # Lists that only grow: new items of each checkpoint
+        self.sent = {} # Items of each list already given to the writing thread
+        self.log_size = 0 # Bytes of the log referenced by the last complete state
+        self.thread = None
+        self.error = None
+
+    def exists(self):
+        return os.path.isfile(self.state_file) and os.path.isfile(self.log_file)
+
+    def save(self, state, logs, ready=None):
+        # The checkpoint is skipped if the previous one is still being written
+        if (self.thread is not None) and self.thread.is_alive():
+            return False
+        if self.error is not None:
+            raise self.error
+        # Serialized here, as the objects keep changing while the thread writes them
+        segment = {name: items[self.sent.get(name, 0):] for name, items in logs.items()}
+        state_data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        log_data = pickle.dumps(segment, protocol=pickle.HIGHEST_PROTOCOL)
+        for name, items in logs.items():
+            self.sent[name] = len(items)
+        self.thread = threading.Thread(target=self.write, args=(state_data, log_data, ready), daemon=True)
+        self.thread.start()
+        return True
+
+    def write(self, state_data, log_data, ready):
+        try:
+            mode = 'r+b' if os.path.isfile(self.log_file) else 'wb'
+            with open(self.log_file, mode) as f:
+                f.truncate(self.log_size) # Segment of an interrupted checkpoint
+                f.seek(self.log_size)
+                f.write(log_data)
+                f.flush()
+                os.fsync(f.fileno())
+                log_size = f.tell()
+            if ready is not None: # Wait for other files the state refers to
+                ready()
+            with open(self.state_file+'.part', 'wb') as f:
+                pickle.dump({'log_size': log_size, 'state': state_data}, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self.state_file+'.part', self.state_file)
+            self.log_size = log_size
+        except Exception as e:
+            self.error = e
+
+    def load(self):
+        # State and lists of the last complete checkpoint
+        with open(self.state_file, 'rb') as f:
+            checkpoint = pickle.load(f)
+        self.log_size = checkpoint['log_size']
+        logs = {}
+        with open(self.log_file, 'rb') as f:
+            while f.tell() < self.log_size:
+                for name, items in pickle.load(f).items():
+                    logs.setdefault(name, []).extend(items)
+        self.sent = {name: len(items) for name, items in logs.items()}
+        logging.info(f'Checkpoint loaded from: {self.state_file}\n')
+        return pickle.loads(checkpoint['state']), logs
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def remove(self):
+        # Checkpoints are not needed once the run is finished
+        self.wait()
+        for name in [self.state_file, self.log_file]:
+            if os.path.isfile(name):
+                os.remove(name)
+        self.sent = {}
+        self.log_size = 0
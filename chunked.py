@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+import cv2, sys, time, numpy as np, os, shutil, tempfile
+
+from multiprocessing import Pool
+from scipy.optimize import linear_sum_assignment
+
+import read
+import track_store # Sparse tracks files
+import tracker, hungarian
+from frames import VideoReader, load_index # Frame source
+from association import get_iou # IoU between sets of boxes
+from mht import compute_color_histogram # Same histograms the MHT scores with
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+
+def main(paths, method='tracker', day=2, camera=3, initial_frame=0, num_frames=36000, param=0, chunk_size=3000, overlap=100, processes=0, iou_th=0.5, color_weight=0.5, color_hist_bins=4):
+
+    final_frame = initial_frame+num_frames-1
+    if num_frames < 1:
+        logging.info('Number of frames needs to be higher than 0\n')
+        sys.exit()
+    if final_frame > 35999:
+        if initial_frame > 35999:
+            logging.info('Invalid initial frame (0-35999)\n')
+            sys.exit()
+        else:
+            final_frame = 35999
+            num_frames = final_frame+1-initial_frame
+    if method not in ('tracker', 'hungarian'):
+        logging.info('Invalid method (tracker or hungarian)\n')
+        sys.exit()
+    if not (0 < overlap < chunk_size):
+        logging.info('Overlap needs to be higher than 0 and lower than the chunk size\n')
+        sys.exit()
+
+    data_path = paths['data_path']
+    videos_path = paths['videos_path']
+    output_path = paths['output_path']
+    if not os.path.isdir(output_path):
+        logging.info('Output directory does not exist\n')
+        sys.exit()
+
+    video_file = videos_path+'30min_day'+str(day)+'_cam'+str(camera)+'_20fps_960x540.MP4'
+    video_name = 'Day '+str(day)+' Camera '+str(camera)
+    logging.info(f'Selected video: {video_name}\n')
+
+    # Files shared by all the chunks are created before starting the processes
+    cache_path = read.get_cache_path(output_path)
+    index_file = cache_path+'FrameIndex_day'+str(day)+'_cam'+str(camera)+'.npz'
+    read.load_annotations_cache(path=data_path, day=day, cache_path=cache_path)
+    load_index(video_file=video_file, index_file=index_file)
+    res_path = output_path+method+'/'
+    if not os.path.isdir(res_path):
+        os.mkdir(res_path)
+    res_file = res_path+'Results_day'+str(day)+'_cam'+str(camera)+'_'+str(param)
+
+    # The chunks write their outputs to a temporary directory (sharing the caches), so they are not taken as runs of their windows
+    chunk_path = tempfile.mkdtemp(prefix='chunks_day'+str(day)+'_cam'+str(camera)+'_', dir=output_path)+'/'
+    os.symlink(os.path.abspath(cache_path), chunk_path+'cache')
+    chunk_paths = dict(paths, output_path=chunk_path)
+    chunk_file = chunk_path+method+'/Results_day'+str(day)+'_cam'+str(camera)+'_'+str(param)
+
+    windows = get_windows(initial_frame=initial_frame, final_frame=final_frame, chunk_size=chunk_size, overlap=overlap)
+    logging.info(f'Running {method} on {len(windows)} chunks ...\n')
+    ti = time.time() # Start timer
+    with Pool(processes if processes > 0 else None) as pool:
+        errors = pool.starmap(run_chunk, [(chunk_paths, method, day, camera, first, last+1-first, param) for first, last in windows])
+    failed = [(window, error) for window, error in zip(windows, errors) if error is not None]
+    for (first, last), error in failed:
+        logging.info(f'Chunk {first}-{last} failed: {error}\n')
+    if failed:
+        shutil.rmtree(chunk_path)
+        logging.info('Chunks not stitched\n')
+        sys.exit()
+    logging.info(f'Chunks completed in {time.time()-ti} seconds\n')
+
+    # Join the results of the chunks keeping the identity of the targets
+    logging.info('Stitching chunks ...\n')
+    readers = []
+    for first, last in windows:
+        chunk_name = chunk_file+'_'+str(first)+'-'+str(last)+'.trk'
+        if not os.path.isfile(chunk_name):
+            logging.info(f'Results of the chunk {first}-{last} not found\n')
+            shutil.rmtree(chunk_path)
+            sys.exit()
+        readers.append(track_store.TrackReader(chunk_name))
+    video = VideoReader(video_file, index_file=index_file)
+    records = stitch(readers=readers, windows=windows, video=video, iou_th=iou_th, color_weight=color_weight, bins=color_hist_bins)
+    video.release()
+    shutil.rmtree(chunk_path)
+
+    results_file = res_file+'_'+str(initial_frame)+'-'+str(final_frame)+'.trk'
+    track_store.write_tracks(file_name=results_file, records=records, initial_frame=initial_frame, num_frames=num_frames)
+
+    tf = time.time() # End timer
+    logging.info(f'Elapsed time: {tf-ti} seconds\n')
+    time_file = res_path+'Time_day'+str(day)+'_cam'+str(camera)+'_'+str(param)+'_'+str(initial_frame)+'-'+str(final_frame)+'_chunked.csv'
+    np.savetxt(time_file, [tf-ti], delimiter=',')
+
+
+def run_chunk(paths, method, day, camera, initial_frame, num_frames, param):
+    # Error of the chunk, None if it finished (the scripts exit on errors, which would stop the worker process)
+    try:
+        if method == 'tracker':
+            tracker.main(paths, day, camera, initial_frame, num_frames, param)
+        else:
+            hungarian.main(paths, day, camera, initial_frame, num_frames, param)
+    except SystemExit:
+        return 'stopped by an error'
+    except Exception as e:
+        return repr(e)
+    return None
+
+def get_windows(initial_frame, final_frame, chunk_size, overlap):
+    # Windows (first, last) of 'chunk_size' frames covering [initial_frame, final_frame], each one sharing 'overlap' frames with the next
+    windows = []
+    first = initial_frame
+    while True:
+        last = min(first+chunk_size-1, final_frame)
+        windows.append((first, last))
+        if last == final_frame:
+            return windows
+        first = last-overlap+1
+
+def stitch(readers, windows, video, iou_th, color_weight, bins):
+    # Records of the chunks, each one up to the middle of its overlap with the next one, with the IDs of the first chunk where a target appears
+    records = []
+    identities = {} # Track ID in the previous chunk -> ID in the results
+    next_id = 0
+    for k, reader in enumerate(readers):
+        first, last = windows[k]
+        start = first if k == 0 else (first+windows[k-1][1])//2+1
+        end = last if k == len(readers)-1 else (windows[k+1][0]+last)//2
+
+        matches = {}
+        if k > 0:
+            matches = match_tracks(prev=readers[k-1], new=reader, first=first, last=windows[k-1][1], video=video, iou_th=iou_th, color_weight=color_weight, bins=bins)
+            logging.info(f'{len(matches)} tracks continued on the chunk {first}-{last}\n')
+        new_identities = {}
+        for track in np.unique(reader.records['track']).tolist():
+            if track in matches:
+                new_identities[track] = identities[matches[track]]
+            else: # New target
+                new_identities[track] = next_id
+                next_id += 1
+
+        rows = np.array(reader.get_window(initial_frame=start, num_frames=end+1-start))
+        rows['track'] = [new_identities[track] for track in rows['track'].tolist()]
+        records.append(rows)
+        identities = new_identities
+    return np.concatenate(records)
+
+def match_tracks(prev, new, first, last, video, iou_th, color_weight, bins):
+    # Tracks of the new chunk following the same target as a track of the previous one over their overlap [first, last]
+    num_frames = last+1-first
+    boxes_a, present_a = prev.read_window(initial_frame=first, num_frames=num_frames)
+    boxes_b, present_b = new.read_window(initial_frame=first, num_frames=num_frames)
+    tracks_a = np.unique(prev.get_window(initial_frame=first, num_frames=num_frames)['track'])
+    tracks_b = np.unique(new.get_window(initial_frame=first, num_frames=num_frames)['track'])
+    if (len(tracks_a) == 0) or (len(tracks_b) == 0):
+        return {}
+
+    # Box agreement: mean IoU over the frames where any of the two tracks is present
+    iou_mat = get_iou(boxes_a, boxes_b)
+    both = present_a[:, :, None] & present_b[:, None, :]
+    either = present_a[:, :, None] | present_b[:, None, :]
+    agreement = np.where(both, iou_mat, 0).sum(axis=0)/np.maximum(either.sum(axis=0), 1)
+
+    # Appearance: distance between color histograms of the targets close to the middle of the overlap
+    hists_a, hists_b = get_color_histograms(video=video, first=first, tracks=[(boxes_a, present_a), (boxes_b, present_b)], bins=bins)
+    distance = np.zeros(agreement.shape)
+    for i, hist_a in enumerate(hists_a):
+        for j, hist_b in enumerate(hists_b):
+            if (hist_a is not None) and (hist_b is not None):
+                distance[i, j] = cv2.compareHist(hist_a, hist_b, cv2.HISTCMP_BHATTACHARYYA)
+
+    rows, cols = linear_sum_assignment(-(agreement-color_weight*distance))
+    return {int(tracks_b[j]): int(tracks_a[i]) for i, j in zip(rows, cols) if agreement[i, j] >= iou_th}
+
+def get_color_histograms(video, first, tracks, bins):
+    # Histogram of each track on the frame of the overlap where it is present closest to the middle
+    middle = tracks[0][1].shape[0]//2
+    needed = {} # Frame -> (side, track, box)
+    hists = []
+    for side, (boxes, present) in enumerate(tracks):
+        hists.append([None]*present.shape[1])
+        for t in range(present.shape[1]):
+            frames = np.nonzero(present[:, t])[0]
+            f = int(frames[np.argmin(np.abs(frames-middle))])
+            needed.setdefault(f, []).append((side, t, boxes[f, t]))
+
+    if not video.seek(first):
+        logging.info('Unable to read the video file, stitching without color histograms\n')
+        return hists
+    for f in range(max(needed)+1):
+        ret, frame = video.read()
+        if not ret:
+            logging.info('Unable to read the video file, stitching without color histograms\n')
+            break
+        for side, t, box in needed.get(f, []):
+            hists[side][t] = compute_color_histogram(frame=frame, box=box, bins=bins)
+    return hists
+
+if __name__ == '__main__':
+
+    try:
+        method = sys.argv[1]
+        day = int(sys.argv[2])
+        camera = int(sys.argv[3])
+        initial_frame = int(sys.argv[4])
+        num_frames = int(sys.argv[5])
+        param = int(sys.argv[6])
+        options = read.read_options(sys.argv[7:], {'chunk_size': 3000, 'overlap': 100, 'processes': 0})
+    except:
+        print('Parameters not given correctly\n')
+        print('Usage:\n\tpython3 chunked.py method day camera initial_frame num_frames param [--chunk-size frames] [--overlap frames] [--processes n]\n')
+        print('Where method is tracker (param: N_pruning) or hungarian (param: IoU threshold)\n')
+        print('Example:\n\tpython3 chunked.py tracker 2 3 0 36000 0 --chunk-size 3000 --overlap 100\n')
+        sys.exit()
+
+    paths = read.read_paths()
+
+    main(paths, method, day, camera, initial_frame, num_frames, param, **options)
@@ -4,6 +4,12 @@ CLEAR multi target tracking metric evaluation.
 import numpy as np
 import math
 import munkres
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+NOT_PRESENT = -2  # match of an object not present in the frame
+MAX_BLOCK_PAIRS = 2 ** 20  # ground truth/measurement pairs whose distances are computed at once
 
 
 class ClearMetrics(object):
@@ -33,9 +39,15 @@ class ClearMetrics(object):
                   clear.get_mismatches_count(),
                   clear.get_object_count(),
                   clear.get_matches_count()]
+    # the same sequence as arrays and presence masks
+    groundtruth = np.array([[2, 3, 6], [3, 2, 6], [4, 0, 6]])[:, :, None]
+    measurements = np.array([[1, 3, 8, 0, 0], [2, 3, 0, 6, 0], [0, 4, 0, 6, 8]])[:, :, None]
+    measurements_present = np.array([[1, 1, 1, 0, 0], [1, 1, 0, 1, 0], [1, 1, 0, 1, 1]], dtype=bool)
+    clear = ClearMetrics(groundtruth, measurements, 1.5, np.ones((3, 3), dtype=bool), measurements_present)
     """
 
-    def __init__(self, groundtruth, measurements, thresh):
+    def __init__(self, groundtruth, measurements, thresh, groundtruth_present=None, measurements_present=None,
+                 frames=None):
         """
         Initialize ClearMetrics.
         @param groundtruth:     [frame nr]    [target nr]
@@ -43,30 +55,58 @@ class ClearMetrics(object):
                                                           - ndarray for input data with dimensionality n
                                                           - number for 1D input data
                                                           - None means target is not present
+                                or ndarray, shape=num frames, num targets, n (with groundtruth_present)
         @param measurements:    [frame nr]    [target nr]
                                 dict/list     list        ndarray, shape=(n,) or number or None
+                                or ndarray, shape=num frames, num targets, n (with measurements_present)
         @param thresh: float, maximum distance of a measurement from ground truth to be considered as
                               true positive
+        @param groundtruth_present: ndarray, shape=num frames, num targets, bool - target is present
+        @param measurements_present: ndarray, shape=num frames, num targets, bool - target is present
+        @param frames: ndarray, shape=num frames - frame numbers of the rows of the arrays, by default 0..num frames-1
         """
         self.groundtruth = groundtruth
         self.measurements = measurements
         self.thresh = thresh
+        self._array_frames = None
+
+        if (groundtruth_present is None) or (measurements_present is None):
+            # dict/list input, converted to arrays
+            frames = np.array(self.get_frames(), dtype=np.int64)
+            frames = frames[frames < len(measurements)]
+            self._gt, self._gt_present = self._stack_frames([groundtruth[frame] for frame in frames])
+            self._measurements, self._measurements_present = self._stack_frames(
+                [measurements[frame] for frame in frames])
+            self._gt_count = np.array([len(groundtruth[frame]) for frame in frames], dtype=np.int64)
+            self.frames = frames  # frame numbers of the rows of the evaluation results
+        else:
+            frames = np.arange(len(measurements)) if frames is None else np.asarray(frames, dtype=np.int64)
+            # frames evaluated in order, up to the number of frames of the measurements
+            rows = np.argsort(frames, kind='stable')
+            self._array_frames = frames[rows]
+            rows = rows[frames[rows] < len(measurements)]
+            self._gt = np.asarray(groundtruth)[rows]
+            self._gt_present = np.asarray(groundtruth_present, dtype=bool)[rows]
+            self._measurements = np.asarray(measurements)[rows]
+            self._measurements_present = np.asarray(measurements_present, dtype=bool)[rows]
+            self._gt_count = np.full(len(rows), self._gt.shape[1], dtype=np.int64)
+            self.frames = frames[rows]  # frame numbers of the rows of the evaluation results
 
         # following members hold evaluation results:
 
-        # [frame nr]    [target nr]
-        # dict          list        int  - for every measurement corresponding groundtruth index
-        #                                  -1 if no match, None there was no measurement of the target
+        # [frame]       [target nr]
+        # ndarray       int  - for every measurement corresponding groundtruth index
+        #                      -1 if no match, NOT_PRESENT there was no measurement of the target
         self.measurements_matches = None
 
-        # [frame nr]    [target nr]
-        # dict          list        int  - for every ground truth target corresponding measurement index
-        #                                  -1 if no match, None target is not present in the ground truth
+        # [frame]       [target nr]
+        # ndarray       int  - for every ground truth target corresponding measurement index
+        #                      -1 if no match, NOT_PRESENT target is not present in the ground truth
         self.gt_matches = None
 
-        # [frame nr]    [target nr]
-        # dict          list        int  - for every ground truth target distance to matched measurement
-        #                                  -1 if no match or grount truth not defined
+        # [frame]       [target nr]
+        # ndarray       float - for every ground truth target distance to matched measurement
+        #                       -1 if no match or grount truth not defined
         self.gt_distances = None
 
     def match_sequence(self):
@@ -77,19 +117,22 @@ class ClearMetrics(object):
             self.measurements_matches
             self.gt_matches
             self.gt_distances
+        The rows of the results are the evaluated frames, in order.
         """
-        prev_gt_matches = [-1] * len(self.groundtruth[self.get_frames()[0]])
-        prev_measurement_matches = [-1] * len(self.measurements[self.get_frames()[0]])
-        self.gt_matches = {}
-        self.gt_distances = {}
-        self.measurements_matches = {}
-        for frame in self.get_frames():
-            if frame >= len(self.measurements):
-                break
-            self.gt_matches[frame], self.gt_distances[frame], self.measurements_matches[frame] = \
-                self._match_frame(frame, prev_gt_matches, prev_measurement_matches)
-            prev_gt_matches = self.gt_matches[frame]
-            prev_measurement_matches = self.measurements_matches[frame]
+        num_frames, num_gt = self._gt_present.shape
+        self.gt_matches = np.full((num_frames, num_gt), -1, dtype=np.int64)
+        self.gt_distances = np.full((num_frames, num_gt), -1, dtype=np.float64)
+        self.measurements_matches = np.full(self._measurements_present.shape, -1, dtype=np.int64)
+        prev_gt_matches = np.full(num_gt, -1, dtype=np.int64)
+        block = max(1, MAX_BLOCK_PAIRS // max(1, num_gt * self._measurements_present.shape[1]))
+        for first in range(0, num_frames, block):
+            last = min(first + block, num_frames)
+            # candidates can only be lost when previous matches are excluded
+            sq_distance, sq_distance_undefined, shared = self._get_sq_distance_matrix(first, last)
+            for i in range(first, last):
+                self._match_frame(i, prev_gt_matches, sq_distance[i - first], sq_distance_undefined[i - first],
+                                  shared[i - first])
+                prev_gt_matches = self.gt_matches[i]
 
     def get_fp_count(self):
         """
@@ -97,10 +140,7 @@ class ClearMetrics(object):
         @return: FP count
         @rtype: int
         """
-        count = 0
-        for matches in self.measurements_matches.values():
-            count += matches.count(-1)
-        return count
+        return int(np.count_nonzero(self.measurements_matches == -1))
 
     def get_fn_count(self):
         """
@@ -108,10 +148,7 @@ class ClearMetrics(object):
         @return: FN count
         @rtype: int
         """
-        count = 0
-        for matches in self.gt_matches.values():
-            count += matches.count(-1)
-        return count
+        return int(np.count_nonzero(self.gt_matches == -1))
 
     def get_mismatches_count(self):
         """
@@ -121,18 +158,10 @@ class ClearMetrics(object):
         @return: number of mismatches in the sequence
         @rtype: int
         """
-        frames = sorted(self.groundtruth.keys())
-        last_matches = np.array(self.gt_matches[frames[0]])
-        mismatches = 0
-        for frame in frames[1:]:
-            if frame >= len(self.measurements):
-                break
-            matches = np.array(self.gt_matches[frame])
-            mask_match_in_both_frames = (matches != -1) & (last_matches != -1)
-            mismatches += np.count_nonzero(
-                matches[mask_match_in_both_frames] != last_matches[mask_match_in_both_frames])
-            last_matches = matches
-        return mismatches
+        last_matches = self.gt_matches[:-1]
+        matches = self.gt_matches[1:]
+        mask_match_in_both_frames = (matches != -1) & (last_matches != -1)
+        return int(np.count_nonzero(matches[mask_match_in_both_frames] != last_matches[mask_match_in_both_frames]))
 
     def get_object_count(self):
         """
@@ -140,13 +169,7 @@ class ClearMetrics(object):
         @return: number of gt objects
         @rtype: int
         """
-        object_count = 0
-        for frame in self.get_frames():
-            if frame >= len(self.measurements):
-                break
-            targets = self.groundtruth[frame]
-            object_count += len(targets)# - targets.count(None)  # TODO np.array([]) empty arrays?
-        return object_count
+        return int(self._gt_count.sum())  # TODO objects not present are counted
 
     def get_matches_count(self):
         """
@@ -154,9 +177,8 @@ class ClearMetrics(object):
         @return: number of matches
         @rtype: int
         """
-        distances = np.array([dists for dists in self.gt_distances.values()])
-        matches_mask = distances != -1
-        return distances[matches_mask].size
+        matches_mask = self.gt_distances != -1
+        return self.gt_distances[matches_mask].size
 
     def get_motp(self):
         """
@@ -165,9 +187,8 @@ class ClearMetrics(object):
         @return: MOTP score
         @rtype: float
         """
-        distances = np.array([dists for dists in self.gt_distances.values()])
-        matches_mask = distances != -1
-        return distances[matches_mask].mean()
+        matches_mask = self.gt_distances != -1
+        return self.gt_distances[matches_mask].mean()
 
     def get_mota(self):
         """
@@ -179,88 +200,161 @@ class ClearMetrics(object):
         return 1 - (self.get_fp_count() + self.get_fn_count() + self.get_mismatches_count()) / \
                float(self.get_object_count())
 
-    def _get_sq_distance_matrix(self, frame):
+    def _get_sq_distance_matrix(self, first, last):
         """
-        Compute squared distances between ground truth and measurements objects.
-        Distance is np.nan when gt or measurement is not defined (None).
-        @param frame: frame number
-        @type frame: int
-        @return: distance matrix (not symmetric!)
-        @rtype: np.ndarray, shape=num ground truth, num measurements
+        Compute squared distances between ground truth and measurements objects of a block of frames.
+        Distance is sq_distance_undefined of the frame when gt or measurement is not present or when it is
+        over the threshold.
+        @param first: index of the first evaluated frame of the block
+        @param last: index after the last evaluated frame of the block
+        @return: distance matrices (not symmetric!), sq_distance_undefined of each frame,
+                 frames where a ground truth object or a measurement has two candidates
+        @rtype: np.ndarray, shape=num frames, num ground truth, num measurements; np.ndarray, shape=num frames;
+                np.ndarray, shape=num frames
         """
-        n_gt = len(self.groundtruth[frame])
-        n_meas = len(self.measurements[frame])
-        distance_mat = np.zeros((n_gt, n_meas))
-        for i in range(n_gt):
-            gt_pos = self.groundtruth[frame][i]
-            for j in range(n_meas):
-                measured_pos = self.measurements[frame][j]
-                if gt_pos is None or measured_pos is None:
-                    distance_mat[i, j] = np.nan
-                else:
-                    distance_mat[i, j] = np.sum((measured_pos - gt_pos) ** 2)
-        return distance_mat
+        num_frames = last - first
+        # only the pairs of objects present in the frame
+        frame, gt, measured = np.nonzero(self._gt_present[first:last, :, None] &
+                                         self._measurements_present[first:last, None, :])
+        pair_distance = np.sum((self._measurements[first + frame, measured] - self._gt[first + frame, gt]) ** 2,
+                               axis=1).astype(np.float64)
+
+        max_distance = np.full(num_frames, np.nan)  # no pairs, as np.nanmax of all np.nan
+        if len(frame):
+            starts = np.searchsorted(frame, np.arange(num_frames))
+            with_pairs = np.bincount(frame, minlength=num_frames) > 0
+            max_distance[with_pairs] = np.maximum.reduceat(pair_distance, starts[with_pairs])
+        sq_distance_undefined = np.array([math.ceil(value) + 1 for value in max_distance], dtype=np.float64)
 
-    def _match_frame(self, frame, prev_gt_matches, prev_measurement_matches):
+        candidate = pair_distance <= (self.thresh ** 2)
+        frame, gt, measured, pair_distance = frame[candidate], gt[candidate], measured[candidate], pair_distance[candidate]
+        distance_mat = np.empty(self._gt_present[first:last].shape + (self._measurements_present.shape[1],))
+        distance_mat[:] = sq_distance_undefined[:, None, None]
+        distance_mat[frame, gt, measured] = pair_distance
+
+        shared = np.zeros(num_frames, dtype=bool)
+        for objects in (gt, measured):
+            order = np.lexsort((objects, frame))
+            same = (np.diff(frame[order]) == 0) & (np.diff(objects[order]) == 0)
+            shared[frame[order][1:][same]] = True
+        return distance_mat, sq_distance_undefined, shared
+
+    @staticmethod
+    def _stack_frames(frames):
+        """
+        Stack the positions of the objects of every frame.
+        @param frames: list of lists of ndarray, number or None
+        @return: positions, presence mask
+        @rtype: np.ndarray, shape=num frames, num objects, dimensionality; np.ndarray, shape=num frames, num objects
+        """
+        num_objects = max([len(positions) for positions in frames], default=0)
+        present = np.zeros((len(frames), num_objects), dtype=bool)
+        values = []
+        for i, positions in enumerate(frames):
+            for j, pos in enumerate(positions):
+                if pos is not None:
+                    present[i, j] = True
+                    values.append(np.asarray(pos).reshape(-1))
+        dim = values[0].size if values else 1
+        dtype = np.result_type(*set(pos.dtype for pos in values)) if values else np.float64
+        stacked = np.zeros((len(frames), num_objects, dim), dtype=dtype)
+        if values:
+            stacked[present] = np.stack(values)
+        return stacked, present
+
+    def _match_frame(self, i, prev_gt_matches, sq_distance, sq_distance_undefined, shared):
         """
         Matches measurements to ground truth for a frame.
-        @type frame: int - frame number
-        @type prev_gt_matches: list - ground truth matches for previous frame
-        @prev_measurement_matches - measurement matches for previous frame
-        @return: gt_matches - list of measurement ids to that the ground truth objects match
-                              None for gt objects not present in the frame
+        Writes row i of self.gt_matches, self.gt_distances and self.measurements_matches:
+                 gt_matches - measurement ids to that the ground truth objects match
+                              NOT_PRESENT for gt objects not present in the frame
                               -1 for FN
                  gt_distances - distances from ground truth objects to matched measured objects
-                                None for objects not found in the frame
-                 measurements_matches - list of ground truth ids to that the measured objects match
-                                        None for measured object not present in the frame
+                                -1 for objects not found in the frame
+                 measurements_matches - ground truth ids to that the measured objects match
+                                        NOT_PRESENT for measured object not present in the frame
                                         -1 for FP
-        @rtype: list, list, list
+        @type i: int - index of the evaluated frame
+        @type prev_gt_matches: ndarray - ground truth matches for previous frame
+        @type sq_distance: ndarray - squared distance matrix of the frame, modified
+        @type sq_distance_undefined: float - distance of the pairs that can not match
+        @type shared: bool - a ground truth object or a measurement had two candidates before excluding the
+                             previous matches
         """
-        sq_distance = self._get_sq_distance_matrix(frame)
-        sq_distance_undefined = math.ceil(np.nanmax(sq_distance)) + 1
-        sq_distance[np.isnan(sq_distance)] = sq_distance_undefined
-        sq_distance[sq_distance > (self.thresh ** 2)] = sq_distance_undefined
 
         # set all ground truth matches to FN or not defined
-        gt_matches = []
-        for i in range(len(self.groundtruth[frame])):
-            if self.groundtruth[frame][i] is None:
-                gt_matches.append(None)
-            else:
-                gt_matches.append(-1)
+        gt_matches = self.gt_matches[i]
+        gt_matches[~self._gt_present[i]] = NOT_PRESENT
+        gt_distances = self.gt_distances[i]
 
         # set all measurements matches to FP or not defined
-        gt_distances = [-1] * len(self.groundtruth[frame])
-        measurements_matches = []
-        for i in range(len(self.measurements[frame])):
-            if self.measurements[frame][i] is None:
-                measurements_matches.append(None)
-            else:
-                measurements_matches.append(-1)
+        measurements_matches = self.measurements_matches[i]
+        measurements_matches[~self._measurements_present[i]] = NOT_PRESENT
 
         # verify TP from previous frame
-        prev_matches = [(prev_measurement_matches[m], m) for m in prev_gt_matches if (m is not None) and (m != -1)]
-        for prev_gt, prev_m in prev_matches:
-            if sq_distance[prev_gt, prev_m] != sq_distance_undefined:
-                gt_matches[prev_gt] = prev_m
-                measurements_matches[prev_m] = prev_gt
-                gt_distances[prev_gt] = np.sqrt(sq_distance[prev_gt, prev_m])
-                # prev_gt and prev_m are excluded from further matching
-                sq_distance[prev_gt, :] = sq_distance_undefined
-                sq_distance[:, prev_m] = sq_distance_undefined
+        prev_gt = np.flatnonzero(prev_gt_matches >= 0)
+        prev_m = prev_gt_matches[prev_gt]
+        verified = sq_distance[prev_gt, prev_m] != sq_distance_undefined
+        prev_gt, prev_m = prev_gt[verified], prev_m[verified]
+        gt_matches[prev_gt] = prev_m
+        measurements_matches[prev_m] = prev_gt
+        gt_distances[prev_gt] = np.sqrt(sq_distance[prev_gt, prev_m])
+        # prev_gt and prev_m are excluded from further matching
+        sq_distance[prev_gt, :] = sq_distance_undefined
+        sq_distance[:, prev_m] = sq_distance_undefined
 
         # fill in new TP
-        m = munkres.Munkres()
-        matches = m.compute(sq_distance.tolist())
-        for m in matches:
-            if sq_distance[m[0], m[1]] == sq_distance_undefined:
-                continue
-            gt_matches[m[0]] = m[1]
-            measurements_matches[m[1]] = m[0]
-            gt_distances[m[0]] = np.sqrt(sq_distance[m[0], m[1]])
+        if shared and self._is_ambiguous(sq_distance, sq_distance_undefined):
+            # equally good matchings, munkres decides which one as it always did
+            matches = np.array(munkres.Munkres().compute(sq_distance.tolist()), dtype=np.int64).reshape(-1, 2).T
+        else:
+            matches = linear_sum_assignment(sq_distance)
+        new_gt, new_m = matches
+        new = sq_distance[new_gt, new_m] != sq_distance_undefined
+        new_gt, new_m = new_gt[new], new_m[new]
+        gt_matches[new_gt] = new_m
+        measurements_matches[new_m] = new_gt
+        gt_distances[new_gt] = np.sqrt(sq_distance[new_gt, new_m])
 
-        return gt_matches, gt_distances, measurements_matches
+    @staticmethod
+    def _is_ambiguous(sq_distance, sq_distance_undefined):
+        """
+        Check if the optimal matching of a frame is not unique.
+        Any other optimal matching leaves out a pair of the one found, so each pair is excluded in turn and the
+        matching solved again, on every group of objects connected by candidate pairs.
+        @param sq_distance: squared distance matrix, sq_distance_undefined where no match is possible
+        @return: True if another matching is as good (up to rounding errors)
+        @rtype: bool
+        """
+        gt, measured = np.nonzero(sq_distance != sq_distance_undefined)
+        num_gt, num_measured = sq_distance.shape
+        graph = coo_matrix((np.ones(len(gt)), (gt, num_gt + measured)), shape=(num_gt + num_measured,) * 2)
+        num_components, labels = connected_components(graph, directed=False)
+        component = labels[gt]
+        for label in np.flatnonzero(np.bincount(component, minlength=num_components) > 1):
+            rows = np.unique(gt[component == label])
+            cols = np.unique(measured[component == label])
+            group = sq_distance[np.ix_(rows, cols)]
+            weight, pairs = ClearMetrics._get_matching_weight(group, sq_distance_undefined)
+            tolerance = 1e-9 * sq_distance_undefined * len(pairs[0])
+            for r, c in zip(*pairs):
+                excluded = group.copy()
+                excluded[r, c] = sq_distance_undefined
+                if ClearMetrics._get_matching_weight(excluded, sq_distance_undefined)[0] >= weight - tolerance:
+                    return True
+        return False
+
+    @staticmethod
+    def _get_matching_weight(sq_distance, sq_distance_undefined):
+        """
+        Solve the matching of a distance matrix.
+        @return: weight of the matching (sq_distance_undefined - distance, summed over the matched pairs), matched pairs
+        @rtype: float, (np.ndarray, np.ndarray)
+        """
+        rows, cols = linear_sum_assignment(sq_distance)
+        matched = sq_distance[rows, cols] != sq_distance_undefined
+        rows, cols = rows[matched], cols[matched]
+        return np.sum(sq_distance_undefined - sq_distance[rows, cols]), (rows, cols)
 
     def get_frames(self):
         """
@@ -268,9 +362,11 @@ class ClearMetrics(object):
         :return: list of frame numbers
         :rtype: list
         """
+        if self._array_frames is not None:
+            return self._array_frames.tolist()
         if isinstance(self.groundtruth, dict):
             return sorted(self.groundtruth.keys())
         if isinstance(self.measurements, dict):
             return sorted(self.measurements.keys())
         else:
-            return range(len(self.groundtruth))
\ No newline at end of file
+            return range(len(self.groundtruth))
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+
+class DetectionIndex:
+    '''
+    Valid annotated boxes of one camera for every frame, in CSR format
+    '''
+    def __init__(self, det, cam, lost, camera, limbo=True):
+        num_frames, people = cam.shape
+        boxes = det.reshape(num_frames, people, 7)[:, :, 1:5] # Coordinates of bboxes (x1,y1,x2,y2)
+
+        if limbo:
+            l = (82, 72.5)
+        else:
+            l = (0,0)
+        xc = (boxes[:, :, 0]+boxes[:, :, 2])/2
+        yc = (boxes[:, :, 1]+boxes[:, :, 3])/2
+
+        valid = (cam == camera) & (lost == 0) # If the person is annotated on the right camera and is not lost
+        valid &= np.any(boxes != 0, axis=2) # Annotated box
+        valid &= (l[0] <= xc) & (xc < 960-l[0]) & (l[1] <= yc) & (yc < 540-l[1]) # If box inside permitted region
+
+        frames, ids = np.nonzero(valid) # Sorted by frame and participant
+        self.boxes = boxes[frames, ids] # Valid boxes of all frames
+        self.ids = ids # Participant of each box
+        self.offsets = np.zeros(num_frames+1, dtype=np.int64) # Boxes of frame f: offsets[f] to offsets[f+1]
+        self.offsets[1:] = np.cumsum(np.bincount(frames, minlength=num_frames))
+
+    def get(self, frame_index):
+        # Boxes and participant IDs of a frame (index relative to the annotations read)
+        first, last = self.offsets[frame_index], self.offsets[frame_index+1]
+        return self.boxes[first:last], self.ids[first:last]
+
+    def count(self, frame_index):
+        return int(self.offsets[frame_index+1]-self.offsets[frame_index])
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+import os, sys, shutil, subprocess, tempfile, importlib.util, numpy as np
+
+import read
+import hungarian # Hungarian baseline
+import track_store # Sparse tracks files
+import synthetic # Scenes in the layout of the dataset
+import clear_mot # CLEAR MOT metrics
+from detections import DetectionIndex # Valid annotated boxes of each frame
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+METRICS = ['MOTA', 'MOTP', 'FN', 'FP', 'Mismatches', 'Objects', 'Matches']
+
+
+def main(scenario_path, targets=8, frames=500, seeds=3, baseline=''):
+    # Outputs of the rewritten code against the implementations of a previous commit (the first one by default), on a synthetic scene
+    paths = synthetic.main(scenario_path, num_targets=targets, num_frames=frames)
+    baseline_path = tempfile.mkdtemp(prefix='baseline_')
+    revision = get_sources(baseline_path, revision=baseline)
+    logging.info(f'Checking against the sources of {revision}\n')
+
+    det, cam, lost = read.read_annotations(path=paths['data_path'], day=2, initial_frame=0, num_frames=frames)
+    detection_index = DetectionIndex(det=det, cam=cam, lost=lost, camera=3, limbo=True)
+
+    checks = {}
+    try:
+        checks['clear_mot'] = check_clear_mot(detection_index, num_frames=frames, seeds=seeds, baseline_path=baseline_path)
+        checks['hungarian'] = check_hungarian(paths, num_frames=frames, baseline_path=baseline_path)
+        checks['round_trip'] = check_round_trip(detection_index, num_frames=frames, baseline_path=baseline_path)
+    finally:
+        shutil.rmtree(baseline_path)
+    failed = [name for name, cases in checks.items() if not all(case['agree'] for case in cases)]
+    for name, cases in checks.items():
+        logging.info(f'{name}: {sum(case["agree"] for case in cases)} of {len(cases)} cases agree')
+    logging.info(f'{len(failed)} checks with differences\n')
+    return {'baseline': revision, 'checks': checks, 'failed': failed}
+
+
+def get_sources(path, revision=''):
+    # Files of the baseline commit used by the checks
+    repository = os.path.dirname(os.path.abspath(__file__))
+    if not revision:
+        revision = subprocess.check_output(['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd=repository, text=True).split()[0]
+    for name in ['clear_mot.py', 'hungarian.py', 'read.py']:
+        source = subprocess.check_output(['git', 'show', revision+':'+name], cwd=repository, text=True)
+        if name == 'hungarian.py': # linear_assignment was removed from sklearn, scipy solves the same problem
+            source = source.replace('from sklearn.utils.linear_assignment_ import linear_assignment\n',
+                                    'from scipy.optimize import linear_sum_assignment\n'
+                                    'def linear_assignment(cost): return np.array(linear_sum_assignment(cost), dtype=int).T\n')
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(source)
+    return revision
+
+def load_module(path, name):
+    # Module of the baseline, loaded apart from the one of the same name in the repository
+    spec = importlib.util.spec_from_file_location('baseline_'+name, os.path.join(path, name+'.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def check_clear_mot(detection_index, num_frames, seeds, baseline_path):
+    # Metrics of ClearMetrics (arrays and masks, as the evaluations use it, and lists) against the baseline munkres matcher
+    baseline = load_module(baseline_path, 'clear_mot')
+    gt_boxes, gt_present = get_ground_truth(detection_index, num_frames)
+    cases = []
+    for seed in range(seeds):
+        boxes, present = perturb(gt_boxes, gt_present, np.random.RandomState(seed))
+        clears = [baseline.ClearMetrics(to_lists(gt_boxes, gt_present), to_lists(boxes, present), 10),
+                  clear_mot.ClearMetrics(gt_boxes, boxes, 10, gt_present, present),
+                  clear_mot.ClearMetrics(to_lists(gt_boxes, gt_present), to_lists(boxes, present), 10)]
+        matches = [get_matches(clear) for clear in clears] # Same matches in every frame, not only the same totals
+        expected, arrays, lists = [get_metrics(clear) for clear in clears]
+        case = {'name': 'perturbed_s'+str(seed), 'baseline': expected, 'arrays': arrays, 'lists': lists,
+                'agree': same_metrics(arrays, expected) and same_metrics(lists, expected) and
+                         np.array_equal(matches[1], matches[0]) and np.array_equal(matches[2], matches[0])}
+        if not case['agree']:
+            logging.info(f'clear_mot {case["name"]}: baseline {expected}, arrays {arrays}, lists {lists}')
+        cases.append(case)
+    return cases
+
+def check_hungarian(paths, num_frames, baseline_path, thresholds=(10, 25, 50)):
+    # CSV of the baseline Hungarian tracker (one run per threshold, in its own process) against the tracks file of the
+    # rewritten one (all the thresholds in one pass) converted to CSV
+    baseline_output = os.path.join(baseline_path, 'output', '')
+    output = os.path.join(baseline_path, 'rewritten', '')
+    os.mkdir(baseline_output)
+    os.mkdir(output)
+    for th in thresholds:
+        subprocess.run([sys.executable, '-c', f'import hungarian; hungarian.main({dict(paths, output_path=baseline_output)!r}, 2, 3, 0, {num_frames}, {th})'],
+                       cwd=baseline_path, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    hungarian.main(dict(paths, output_path=output), day=2, camera=3, initial_frame=0, num_frames=num_frames, iou_th=list(thresholds))
+
+    cases = []
+    for th in thresholds:
+        name = 'Results_day2_cam3_'+str(th)+'_0-'+str(num_frames-1)
+        csv_name = output+'hungarian/'+name+'.csv'
+        track_store.sparse_to_wide(file_name=output+'hungarian/'+name+'.trk', csv_name=csv_name)
+        case = {'name': 'iou_'+str(th), 'agree': same_file(csv_name, baseline_output+'hungarian/'+name+'.csv')}
+        if not case['agree']:
+            logging.info(f'hungarian {case["name"]}: {name}.csv differs from the baseline')
+        cases.append(case)
+    return cases
+
+def check_round_trip(detection_index, num_frames, baseline_path):
+    # CSV written by the baseline (Hungarian results, and ground truth tracks with a track never present) converted to a
+    # tracks file and back must be the same file
+    csv_names = sorted(os.path.join(baseline_path, 'output', 'hungarian', name) for name in os.listdir(os.path.join(baseline_path, 'output', 'hungarian'))
+                       if name.startswith('Results_'))
+    gt_boxes, gt_present = get_ground_truth(detection_index, num_frames)
+    coordinates = [[gt_boxes[f, t] if gt_present[f, t] else None for f in range(num_frames)] for t in range(gt_present.shape[1])]
+    coordinates.insert(1, [None]*num_frames)
+    csv_names.append(os.path.join(baseline_path, 'Ground_truth.csv'))
+    baseline = load_module(baseline_path, 'hungarian')
+    baseline.write_csv(file_name=csv_names[-1], solution_coordinates=coordinates)
+
+    cases = []
+    for csv_name in csv_names:
+        file_name = csv_name[:-len('.csv')]+'_round_trip.trk'
+        track_store.wide_to_sparse(csv_name=csv_name, file_name=file_name, initial_frame=0)
+        track_store.sparse_to_wide(file_name=file_name, csv_name=file_name+'.csv')
+        case = {'name': os.path.basename(csv_name), 'agree': same_file(file_name+'.csv', csv_name)}
+        if not case['agree']:
+            logging.info(f'round_trip {case["name"]}: CSV differs after the conversion to a tracks file and back')
+        cases.append(case)
+    return cases
+
+def get_ground_truth(detection_index, num_frames):
+    # Frames x participants boxes and presence of the participants seen on the camera
+    boxes = np.zeros((num_frames, synthetic.NUM_PARTICIPANTS, 4))
+    present = np.zeros((num_frames, synthetic.NUM_PARTICIPANTS), dtype=bool)
+    for f in range(num_frames):
+        frame_boxes, ids = detection_index.get(f)
+        boxes[f, ids] = frame_boxes
+        present[f, ids] = True
+    seen = present.any(axis=0)
+    return boxes[:, seen], present[:, seen]
+
+def perturb(gt_boxes, gt_present, rs, drop=0.1, switches=3, copies=2, copy_length=30):
+    # Measurements from the ground truth: boxes on integer pixels with integer noise (distances tie often), missed boxes,
+    # identity switches and copies of a track over some frames (two measurements equally close to a target, which one
+    # is matched decides the mismatches when one of them is missed)
+    num_frames, num_targets = gt_present.shape
+    boxes = np.round(gt_boxes)+rs.randint(-3, 4, gt_boxes.shape)
+    present = gt_present & (rs.rand(num_frames, num_targets) >= drop)
+    for k in range(switches): # Two targets swap their tracks from a frame on
+        f = rs.randint(num_frames)
+        a, b = rs.choice(num_targets, 2, replace=False)
+        boxes[f:, [a, b]] = boxes[f:, [b, a]]
+        present[f:, [a, b]] = present[f:, [b, a]]
+    copied_boxes = np.zeros_like(boxes)
+    copied_present = np.zeros_like(present)
+    for t in range(num_targets):
+        for k in range(copies):
+            f = rs.randint(num_frames)
+            copied_boxes[f:f+copy_length, t] = boxes[f:f+copy_length, t]
+            copied_present[f:f+copy_length, t] = present[f:f+copy_length, t] | (rs.rand(len(present[f:f+copy_length])) < 0.5)
+            present[f+copy_length//2:f+copy_length, t] &= rs.rand(len(present[f+copy_length//2:f+copy_length])) >= 0.5
+    order = rs.permutation(2*num_targets) # Copies before or after their track
+    boxes = np.concatenate([boxes, copied_boxes], axis=1)[:, order]
+    present = np.concatenate([present, copied_present & gt_present], axis=1)[:, order]
+    return boxes, present
+
+def to_lists(boxes, present):
+    # Input of the baseline: one list per frame with the box of every track or None
+    return {f: [boxes[f, t] if present[f, t] else None for t in range(present.shape[1])] for f in range(present.shape[0])}
+
+def get_matches(clear):
+    # Measurement matched to each ground truth object in every frame (-1 if none, NOT_PRESENT if the object is not present)
+    clear.match_sequence()
+    if isinstance(clear.gt_matches, dict): # Baseline
+        return np.array([[clear_mot.NOT_PRESENT if m is None else m for m in clear.gt_matches[f]] for f in sorted(clear.gt_matches)])
+    return clear.gt_matches
+
+def get_metrics(clear):
+    return [clear.get_mota(),
+            clear.get_motp(),
+            clear.get_fn_count(),
+            clear.get_fp_count(),
+            clear.get_mismatches_count(),
+            clear.get_object_count(),
+            clear.get_matches_count()]
+
+def same_file(file_name, expected):
+    with open(file_name, 'rb') as f, open(expected, 'rb') as g:
+        return f.read() == g.read()
+
+def same_metrics(metrics, expected):
+    # Counts must be equal; MOTA and MOTP up to the rounding of sums taken in another order
+    return all((a == b) or (abs(a-b) <= 1e-9*max(1, abs(b))) for a, b in zip(metrics, expected))
+
+if __name__ == '__main__':
+
+    try:
+        scenario_path = sys.argv[1]
+        options = read.read_options(sys.argv[2:], {'targets': 8, 'frames': 500, 'seeds': 3, 'baseline': ''})
+    except:
+        print('Parameters not given correctly\n')
+        print('Usage:\n\tpython3 equivalence.py scenario_path [--targets n] [--frames n] [--seeds n] [--baseline commit]\n')
+        print('Where the baseline commit is the first one of the repository by default\n')
+        print('Example:\n\tpython3 equivalence.py /tmp/check/ --targets 8 --frames 500\n')
+        sys.exit()
+
+    report = main(scenario_path, **options)
+    if report['failed']:
+        sys.exit(1)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+import cv2, os, glob, hashlib, numpy as np
+
+import read
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+
+class VideoReader:
+    '''
+    Frame source with frame-accurate random access
+    '''
+    def __init__(self, video_file, index_file=None, stride=250, frame_cache=None, max_fallback=3):
+        self.video_file = video_file
+        self.index_file = index_file # Seek index cached next to the output (None: plain OpenCV seeking)
+        self.stride = stride # Distance between indexed anchor frames
+        self.max_fallback = max_fallback # Anchors tried before resynchronizing on the frames hashes
+        self.frame_cache = frame_cache # Decoded frames cache (None: always decode)
+        self.cap = None # Capture object to read video, opened on the first cache miss
+        self.index = None
+        self.position = 0 # Index of the next frame to be returned
+        self.decoded = 0 # Index of the next frame the decoder returns
+
+    def isOpened(self):
+        if (self.frame_cache is not None) and self.frame_cache.complete:
+            return True
+        return self.get_capture().isOpened()
+
+    def read(self):
+        if (self.frame_cache is not None) and self.frame_cache.has(self.position): # No decoding needed
+            frame = self.frame_cache.get(self.position)
+            self.position += 1
+            return True, frame
+
+        if (self.decoded != self.position) and not self.seek_decoder(self.position):
+            return False, None
+        ret, frame = self.get_capture().read()
+        if ret:
+            if self.frame_cache is not None:
+                self.frame_cache.put(self.position, frame)
+            self.position += 1
+            self.decoded += 1
+        return ret, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+        if self.frame_cache is not None:
+            self.frame_cache.close()
+
+    def get_capture(self):
+        if self.cap is None:
+            self.cap = cv2.VideoCapture(self.video_file)
+        return self.cap
+
+    def seek(self, frame_index):
+        # Place the reader so the next read() returns frame 'frame_index'
+        self.position = frame_index
+        if (self.frame_cache is not None) and self.frame_cache.has(frame_index):
+            return True
+        return self.seek_decoder(frame_index)
+
+    def seek_decoder(self, frame_index):
+        if frame_index == self.decoded:
+            return True
+        if self.index_file is None: # Legacy behaviour
+            self.get_capture().set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            self.decoded = frame_index
+            return True
+
+        if self.index is None:
+            self.index = load_index(video_file=self.video_file, index_file=self.index_file, stride=self.stride)
+        if frame_index >= self.index['num_frames']:
+            return False
+
+        # Go to the closest anchor before the frame and check it is the one indexed
+        stride = int(self.index['stride'])
+        hashes = self.index['hashes']
+        if not (self.decoded < frame_index < self.decoded+stride): # Decoding forward is faster than seeking
+            anchor = max(0, frame_index-1)//stride # The anchor is read to be checked, so it must precede the frame
+            tries = 0
+            while (anchor > 0) and (tries < self.max_fallback):
+                self.get_capture().set(cv2.CAP_PROP_POS_FRAMES, anchor*stride)
+                ret, frame = self.cap.read()
+                if ret and (get_frame_hash(frame) == hashes[anchor]):
+                    self.decoded = anchor*stride+1
+                    break
+                anchor -= 1 # Inaccurate seek, try with the previous anchor
+                tries += 1
+            else:
+                if anchor > 0: # Seeking keeps missing the anchors: find the anchor among the frames decoded after an earlier seek
+                    logging.info(f'Inaccurate seeks before frame {frame_index}, resynchronizing on frame {anchor*stride}\n')
+                    if not self.resynchronize(anchor=anchor, stride=stride, hashes=hashes):
+                        anchor = 0
+                if anchor == 0: # Decode from the beginning of the video
+                    if frame_index > stride:
+                        logging.info(f'Unable to seek frame {frame_index}, decoding from the beginning of the video\n')
+                    self.get_capture().release()
+                    self.cap = cv2.VideoCapture(self.video_file)
+                    self.decoded = 0
+
+        # Decode forward up to the frame
+        while self.decoded < frame_index:
+            if not self.get_capture().grab():
+                return False
+            self.decoded += 1
+        return True
+
+    def resynchronize(self, anchor, stride, hashes):
+        # Decode from the previous anchor up to two strides, looking for the hash of the anchor frame
+        self.get_capture().set(cv2.CAP_PROP_POS_FRAMES, (anchor-1)*stride)
+        for i in range(2*stride):
+            ret, frame = self.cap.read()
+            if not ret:
+                return False
+            if get_frame_hash(frame) == hashes[anchor]:
+                self.decoded = anchor*stride+1
+                return True
+        return False
+
+
+class FrameCache:
+    '''
+    Memory-mapped array with the decoded frames of a window of the video
+    '''
+    def __init__(self, file_prefix, first_frame, last_frame, scale=1.0, video_file=None):
+        self.file_prefix = file_prefix # Path and name of the video in the cache
+        self.scale = scale # Resolution factor of the stored frames
+        # Frames of other version of the video are discarded (any version is valid if the video is not available)
+        self.video_stamp = read.get_video_stamp(video_file) if (video_file is not None) and os.path.isfile(video_file) else None
+        self.part_name = None # Temporary file written by this process
+        self.first_frame = first_frame
+        self.last_frame = last_frame
+        self.frames = None
+        self.filled = None # Frames already written (only when writing the cache)
+        self.frame_size = None # (width, height) of the decoded frames
+        self.complete = False
+
+        # Look for a finished cache that covers the window
+        for name in sorted(glob.glob(glob.escape(file_prefix)+'_s'+str(scale)+'_*-*.npy')):
+            first, last = [int(f) for f in name[:-4].split('_')[-1].split('-')]
+            if (first <= first_frame) and (last >= last_frame) and ((self.video_stamp is None) or (read_stamp(name) == self.video_stamp)):
+                self.frames = np.load(name, mmap_mode='r') # Zero-copy reading
+                self.first_frame = first
+                self.last_frame = last
+                height, width = self.frames.shape[1:3]
+                self.frame_size = (int(round(width/scale)), int(round(height/scale)))
+                self.complete = True
+                logging.info(f'Reading decoded frames from: {name}\n')
+                break
+
+    def get_file_name(self):
+        return self.file_prefix+'_s'+str(self.scale)+'_'+str(self.first_frame)+'-'+str(self.last_frame)+'.npy'
+
+    def has(self, frame_index):
+        return self.complete and (self.first_frame <= frame_index <= self.last_frame)
+
+    def get(self, frame_index):
+        frame = self.frames[frame_index-self.first_frame]
+        if self.scale != 1:
+            frame = cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_LINEAR)
+        return frame
+
+    def put(self, frame_index, frame):
+        if self.complete or not (self.first_frame <= frame_index <= self.last_frame):
+            return
+        if self.frames is None: # First decoded frame: create the file
+            height, width = frame.shape[:2]
+            self.frame_size = (width, height)
+            shape = (self.last_frame-self.first_frame+1, int(round(height*self.scale)), int(round(width*self.scale)), 3)
+            self.part_name = self.get_file_name()+'.'+str(os.getpid())+'.part' # Runs of the same window write apart
+            self.frames = np.lib.format.open_memmap(self.part_name, mode='w+', dtype=np.uint8, shape=shape)
+            self.filled = np.zeros(shape[0], dtype=bool)
+        if self.scale != 1:
+            frame = cv2.resize(frame, self.frames.shape[2:0:-1], interpolation=cv2.INTER_AREA)
+        self.frames[frame_index-self.first_frame] = frame
+        self.filled[frame_index-self.first_frame] = True
+
+    def close(self):
+        # The cache is only kept if all the frames of the window were written
+        if self.complete or (self.frames is None):
+            return
+        self.frames.flush()
+        self.frames = None
+        if self.filled.all():
+            try:
+                if self.video_stamp is not None: # Before the frames, so they are never found unstamped
+                    write_stamp(self.get_file_name(), self.video_stamp)
+                # Runs of the same window give the same frames: the last one to finish replaces the file, readers keep their mapping
+                os.replace(self.part_name, self.get_file_name())
+                logging.info(f'Decoded frames saved to: {self.get_file_name()}\n')
+                return
+            except OSError: # Cache not saved (e.g. disk full), the frames are decoded again next time
+                logging.info(f'Unable to save the decoded frames to: {self.get_file_name()}\n')
+        if os.path.isfile(self.part_name):
+            os.remove(self.part_name)
+
+
+def read_stamp(cache_file):
+    # Video stamp saved next to a frames cache, None if missing
+    stamp_file = cache_file[:-4]+'.stamp'
+    if not os.path.isfile(stamp_file):
+        return None
+    with open(stamp_file) as f:
+        size, mtime = f.read().split()
+    return [int(size), int(mtime)]
+
+def write_stamp(cache_file, stamp):
+    part_name = cache_file[:-4]+'.stamp.'+str(os.getpid())+'.part'
+    with open(part_name, 'w') as f:
+        f.write(str(stamp[0])+' '+str(stamp[1]))
+    os.replace(part_name, cache_file[:-4]+'.stamp')
+
+
+def load_index(video_file, index_file, stride=250):
+    # Load the seek index of the video, building it if missing or outdated
+    stat = os.stat(video_file)
+    if os.path.isfile(index_file):
+        index = dict(np.load(index_file))
+        if ('hashes' in index) and (index['video_size'] == stat.st_size) and (index['video_mtime'] == stat.st_mtime) and (index['stride'] == stride):
+            return index
+    index = build_index(video_file=video_file, stride=stride)
+    np.savez(index_file, **index)
+    logging.info(f'Seek index saved to: {index_file}\n')
+    return index
+
+def build_index(video_file, stride=250):
+    # One pass over the video storing a content hash of every anchor frame
+    logging.info('Building seek index of the video ...\n')
+    cap = cv2.VideoCapture(video_file)
+    hashes = []
+    num_frames = 0
+    while cap.grab():
+        if num_frames % stride == 0:
+            ret, frame = cap.retrieve()
+            hashes.append(get_frame_hash(frame))
+        num_frames += 1
+    cap.release()
+
+    stat = os.stat(video_file)
+    index = {'stride': np.array(stride),
+             'num_frames': np.array(num_frames),
+             'hashes': np.array(hashes), # One hash per anchor frame
+             'video_size': np.array(stat.st_size),
+             'video_mtime': np.array(stat.st_mtime)}
+    logging.info(f'{num_frames} frames indexed\n')
+    return index
+
+def get_frame_hash(frame):
+    # Decoding is deterministic: only the same frame gives the same pixels
+    return hashlib.sha1(np.ascontiguousarray(frame).tobytes()).hexdigest()
@@ -3,6 +3,7 @@
 import numpy as np, sys, csv, os
 
 import read
+from detections import DetectionIndex # Valid annotated boxes of each frame
 
 import logging
 logging.basicConfig(level = logging.INFO, # Messages on terminal
@@ -32,7 +33,10 @@ def ground_truth(paths, day=2, camera=3, limbo=True):
 
     # Read annotations
     logging.info('Getting annotations ...\n')
-    det_full, cam_full, lost_full = read.read_annotations(path=data_path, day=day, initial_frame=initial_frame, num_frames=num_frames)
+    cache_path = read.get_cache_path(output_path)
+    det_full, cam_full, lost_full = read.read_annotations(path=data_path, day=day, initial_frame=initial_frame, num_frames=num_frames, cache_path=cache_path)
+    detection_index = DetectionIndex(det=det_full, cam=cam_full, lost=lost_full, camera=camera, limbo=limbo)
+    num_frames = cam_full.shape[0] # Annotations shorter than the video (synthetic scenes)
 
     gtruth = {}
     start_frame = {}
@@ -41,7 +45,7 @@ def ground_truth(paths, day=2, camera=3, limbo=True):
         if frame_index in frame_print:
             logging.info(f'Frame: {frame_index} ...')
         
-        annotations = read_detections(det=det_full, cam=cam_full, lost=lost_full, camera=camera, frame_index=frame_index, limbo=limbo)
+        annotations = read_detections(detection_index=detection_index, frame_index=frame_index)
         for i, annot in annotations.items():
             if i in gtruth.keys():
                 gtruth[i].append(annot)
@@ -65,47 +69,13 @@ def ground_truth(paths, day=2, camera=3, limbo=True):
     write_csv(file_name=gtruth_file, gtruth=gtruth)
 
 
-def read_detections(det, cam, lost, camera, frame_index, limbo):
-    
-    det = det[frame_index]
-    cam = cam[frame_index]
-    lost = lost[frame_index]
-    
-    if limbo:
-        l = (82, 72.5)
-    else:
-        l = (0,0)
-
+def read_detections(detection_index, frame_index):
+    boxes, participants = detection_index.get(frame_index)
     detections = {}
-    
-    for i, num_cam in enumerate(cam):
-        if (num_cam == camera) and (lost[i] == 0): # If the person is annotated on the right camera and is not lost
-            detection = [det[1+i*7], det[2+i*7], det[3+i*7], det[4+i*7]] # Coordinates of bboxes.
-            center = get_center(box=detection)
-            if good_box(box=detection, center=center, limbo=l): # Check if valid box
-                detections[i] = np.array(detection)
-        
+    for i, box in zip(participants, boxes):
+        detections[int(i)] = np.array(box) # Coordinates of bboxes
     return detections
 
-def good_box(box, center, limbo):
-    limbo = limbo
-    if (box != (0,0,0,0)) and (limbo[0] <= center[0] < 960-limbo[0]) and (limbo[1] <= center[1] < 540-limbo[1]): # If box inside permitted region
-        approved = True
-    else:
-        approved = False 
-    return approved
-
-def get_center(box):
-    x1 = box[0]
-    y1 = box[1]
-    x2 = box[2]
-    y2 = box[3]
-        
-    xc = (x1+x2)/2
-    yc = (y1+y2)/2
-    center = (xc, yc)
-    return center
-
 def write_csv(file_name, gtruth):
     logging.info('Writing CSV ...\n')
     csv_rows = []
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import os, fcntl, numpy as np
+
+import read
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+
+class HistogramCache:
+    '''
+    On-disk cache of the color histograms of a video, indexed by frame and box
+    Only one run at a time writes to the cache, the others running on the same video only read it
+    '''
+    def __init__(self, file_prefix, bins, max_size=500000, video_file=None):
+        self.hist_file = file_prefix+'.npy' # Memory-mapped histograms, one per row
+        self.index_file = file_prefix+'_index.npz' # Frame and box of each row
+        self.bins = bins
+        self.max_size = max_size # Maximum number of histograms kept
+        self.video_stamp = read.get_video_stamp(video_file) # Histograms of other version of the video are discarded
+        self.rows = {} # (frame, x1, y1, x2, y2) -> row
+        self.keys = []
+        self.hists = None
+
+        # Exclusive lock held until the cache is closed (or the process ends)
+        self.lock = open(file_prefix+'.lock', 'a')
+        try:
+            fcntl.flock(self.lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.writable = True
+        except OSError:
+            self.lock.close()
+            self.lock = None
+            self.writable = False
+            logging.info('Color histograms cache in use by another run, opened read-only\n')
+
+        # The index is loaded before the histograms: the rows it refers to are always in the file
+        if os.path.isfile(self.index_file) and os.path.isfile(self.hist_file):
+            index = np.load(self.index_file)
+            stamp = index['video_stamp'].tolist() if 'video_stamp' in index else None
+            if (int(index['bins']) == bins) and (stamp == self.video_stamp): # Histograms with other number of bins are discarded
+                self.keys = [tuple(key) for key in index['keys'].tolist()]
+                self.rows = {key: row for row, key in enumerate(self.keys)}
+                self.hists = np.load(self.hist_file, mmap_mode='r+' if self.writable else 'r')
+                if self.writable and (self.hists.shape[0] < max_size): # Size cap increased
+                    self.hists = self.grow(max_size)
+                logging.info(f'{len(self.keys)} color histograms in cache\n')
+
+        if (self.hists is None) and self.writable:
+            self.keys = []
+            self.rows = {}
+            self.hists = self.create(max_size)
+
+    def create(self, max_size):
+        # New file replacing the old one, so the runs reading the old one keep their mapping
+        hists = np.lib.format.open_memmap(self.hist_file+'.part', mode='w+', dtype=np.float32, shape=(max_size, self.bins**3))
+        os.replace(self.hist_file+'.part', self.hist_file)
+        return hists
+
+    def grow(self, max_size):
+        old = np.array(self.hists[:len(self.keys)])
+        self.hists = None
+        hists = self.create(max_size)
+        hists[:len(old)] = old
+        return hists
+
+    def get_key(self, frame_index, box):
+        # Histograms only depend on the pixels inside the box
+        return (int(frame_index), int(box[0]), int(box[1]), int(box[2]), int(box[3]))
+
+    def get(self, frame_index, box):
+        row = self.rows.get(self.get_key(frame_index, box))
+        if row is None:
+            return None
+        return np.array(self.hists[row])
+
+    def put(self, frame_index, box, hist):
+        if (not self.writable) or (len(self.keys) >= self.max_size): # Read-only or cache full
+            return
+        key = self.get_key(frame_index, box)
+        self.rows[key] = len(self.keys)
+        self.hists[len(self.keys)] = hist
+        self.keys.append(key)
+        if len(self.keys) == self.max_size:
+            logging.info('Color histograms cache is full\n')
+
+    def save(self):
+        # Histograms written after the last save are ignored if the index is not saved
+        if not self.writable:
+            return
+        self.hists.flush()
+        keys = np.array(self.keys, dtype=np.int32).reshape(-1, 5)
+        np.savez(self.index_file+'.part.npz', bins=np.array(self.bins), keys=keys, video_stamp=np.array(self.video_stamp))
+        os.replace(self.index_file+'.part.npz', self.index_file)
+        logging.info(f'{len(self.keys)} color histograms saved to: {self.hist_file}\n')
+
+    def close(self):
+        # Lock released for the next runs
+        self.hists = None
+        if self.lock is not None:
+            self.lock.close()
+            self.lock = None
+        self.writable = False
@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 
-import cv2, sys, time, csv, numpy as np, os
+import cv2, sys, time, numpy as np, os
 
 import read
-
-from sklearn.utils.linear_assignment_ import linear_assignment
-from scipy.optimize import linear_sum_assignment
+import track_store # Sparse tracks files
+from detections import DetectionIndex # Valid annotated boxes of each frame
+from association import assign_detections, assign_iou, get_iou, MAX_DENSE # IoU association of detections to tracks
 
 import logging
 logging.basicConfig(level = logging.INFO, # Messages on terminal
@@ -13,19 +13,37 @@ logging.basicConfig(level = logging.INFO, # Messages on terminal
                     datefmt = '%H:%M:%S')
 
 
-class Track():
-    def __init__(self, initial_box, missing_frames):
-        self.coordinates = [None]*missing_frames + [initial_box]
-
-    def update(self, box):
-        self.coordinates.append(box)
-    
-    def get_coordinates(self):
-        return self.coordinates
+class ActiveTracks():
+    '''
+    Tracks matched on the last frame and their boxes: a track without a match on a frame is not continued
+    '''
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64) # In increasing order
+        self.boxes = np.zeros((0, 4))
+        self.detections = np.zeros(0, dtype=np.int64) # Detection of the last frame giving each box
+        self.count = 0 # Tracks created
+
+    def update(self, matches, unmatched_detections, detections):
+        # Matched tracks continue with their detections (matches are sorted by track) and unmatched detections start new tracks
+        new_ids = np.arange(self.count, self.count+len(unmatched_detections))
+        self.count += len(unmatched_detections)
+        self.ids = np.concatenate([self.ids[matches[:, 0]], new_ids])
+        self.detections = np.concatenate([matches[:, 1], unmatched_detections])
+        self.boxes = detections[self.detections]
+
+    def get_records(self, frame_index):
+        records = np.zeros(len(self.ids), dtype=track_store.TRACK_RECORD)
+        records['frame'] = frame_index
+        records['track'] = self.ids
+        records['box'] = self.boxes
+        return records
 
 
 def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, iou_th=10):
-    
+    # 'iou_th' can be a list: the thresholds are run in lockstep over the same detections, with one results file each.
+    # The Time and Speed files of each threshold get its share of the pass: total time and frame time divided by the number of thresholds
+    iou_ths = list(iou_th) if isinstance(iou_th, (list, tuple)) else [iou_th]
+
     final_frame = initial_frame+num_frames-1
     if num_frames < 1:
         logging.info('Number of frames needs to be higher than 0\n')
@@ -57,16 +75,21 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, iou_th=10):
 
     # Read annotations
     logging.info('Getting annotations ...\n')
-    det_full, cam_full, lost_full = read.read_annotations(path=data_path, day=day, initial_frame=initial_frame, num_frames=num_frames)
+    cache_path = read.get_cache_path(output_path)
+    det_full, cam_full, lost_full = read.read_annotations(path=data_path, day=day, initial_frame=initial_frame, num_frames=num_frames, cache_path=cache_path)
+    detection_index = DetectionIndex(det=det_full, cam=cam_full, lost=lost_full, camera=camera, limbo=True)
 
-    res_file = hung_path+'Results_day'+str(day)+'_cam'+str(camera)+'_'+str(iou_th)
-    speed_file = hung_path+'Speed_day'+str(day)+'_cam'+str(camera)+'_'+str(iou_th)
-    runtime_file = hung_path+'Time_day'+str(day)+'_cam'+str(camera)+'_'+str(iou_th)
+    res_files = {th: hung_path+'Results_day'+str(day)+'_cam'+str(camera)+'_'+str(th) for th in iou_ths}
+    speed_files = {th: hung_path+'Speed_day'+str(day)+'_cam'+str(camera)+'_'+str(th) for th in iou_ths}
+    runtime_files = {th: hung_path+'Time_day'+str(day)+'_cam'+str(camera)+'_'+str(th) for th in iou_ths}
 
     logging.info('Running Hungarian algorithm ...\n')
     ti = time.time() # Start timer
 
-    tracks = [] # List of lists
+    # Results are written while tracking: tracks are never extended after a frame without a match
+    writers = {th: track_store.TrackWriter(res_files[th]+'_'+str(initial_frame)+'-'+str(final_frame)+'.trk', initial_frame=initial_frame) for th in iou_ths}
+    states = {th: ActiveTracks() for th in iou_ths}
+    previous = np.zeros((0, 4)) # Detections of the previous frame
     #########################################
     frame_print = set(np.arange(initial_frame-1, final_frame, 100)) # To print frame every 100 frames
     frame_save = set(np.arange(initial_frame-1, final_frame, 1000)) # To save results every 1000 frames
@@ -77,33 +100,21 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, iou_th=10):
         
         timer = cv2.getTickCount() # Start timer to get FPS
         # Read annotations
-        annotations = read_detections(det=det_full, cam=cam_full, lost=lost_full, camera=camera, frame_index=frame_index-initial_frame) # List of np arrays
-
-        track_boxes, ids = [], []
-        for i, track in enumerate(tracks):
-            trk_coord = track.get_coordinates()
-            box = trk_coord[len(trk_coord)-1]
-            if box is not None:
-                track_boxes.append(box)
-                ids.append(i)
-
-        matches, unmatched_detections, unmatched_tracks = assign_detections(tracks=track_boxes, detections=annotations, iou_th=iou_th)
-        #matches2, unmatched_detections2, unmatched_tracks2 = assign_detections2(tracks=track_boxes, detections=annotations, iou_th=iou_th)
-
-        if len(unmatched_detections) > 0:
-            for det_id in unmatched_detections:
-                box = annotations[det_id]
-                tracks.append(Track(initial_box=box, missing_frames=frame_index-initial_frame))
-        
-        if len(unmatched_tracks) > 0:
-            for trk_id in unmatched_tracks:
-                real_id = ids[trk_id]
-                tracks[real_id].update(None)
-
-        if matches.size > 0:
-            for trk_id, det_id in matches:
-                real_id = ids[trk_id]
-                tracks[real_id].update(annotations[det_id])
+        annotations = read_detections(detection_index=detection_index, frame_index=frame_index-initial_frame) # Array of boxes
+
+        # The boxes of the tracks of every threshold are detections of the previous frame: their IoU is computed once
+        shared = len(previous)*len(annotations) <= MAX_DENSE
+        if shared:
+            iou_mat = get_iou(previous, annotations).astype(np.float32)
+        for th in iou_ths:
+            tracks = states[th]
+            if shared:
+                matches, unmatched_detections, unmatched_tracks = assign_iou(iou_mat[tracks.detections], iou_th=th)
+            else:
+                matches, unmatched_detections, unmatched_tracks = assign_detections(tracks=tracks.boxes, detections=annotations, iou_th=th)
+            tracks.update(matches=matches, unmatched_detections=unmatched_detections, detections=annotations)
+            writers[th].write(tracks.get_records(frame_index))
+        previous = annotations
 
         fps = cv2.getTickFrequency() / (cv2.getTickCount() - timer) # Compute frames per second (FPS) of the processing
 
@@ -116,16 +127,11 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, iou_th=10):
             logging.info(f'Elapsed time: {tf-ti} seconds\n')
             logging.info(f'{frame_index-initial_frame+1} frames processed ({initial_frame}-{frame_index})\n')
             
-            #solution_coord = get_sol_coord(tracks=tracks, num_frames=frame_index-initial_frame+1)
-
-            # Save results to a .CSV file
-            #results_file = res_file+'_'+str(initial_frame)+'-'+str(frame_index)+'.csv'
-            #write_csv(file_name=results_file, solution_coordinates=solution_coord)
-
-            fps_file = speed_file+'_'+str(initial_frame)+'-'+str(frame_index)+'.csv'
-            np.savetxt(fps_file, [fps_mean], delimiter=',')
-            time_file = runtime_file+'_'+str(initial_frame)+'-'+str(frame_index)+'.csv'
-            np.savetxt(time_file, [t_tot], delimiter=',')
+            for th in iou_ths:
+                fps_file = speed_files[th]+'_'+str(initial_frame)+'-'+str(frame_index)+'.csv'
+                np.savetxt(fps_file, [fps_mean*len(iou_ths)], delimiter=',')
+                time_file = runtime_files[th]+'_'+str(initial_frame)+'-'+str(frame_index)+'.csv'
+                np.savetxt(time_file, [t_tot/len(iou_ths)], delimiter=',')
         
         frame_index += 1
 
@@ -138,174 +144,19 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, iou_th=10):
     logging.info(f'Elapsed time: {tf-ti} seconds\n')
     logging.info(f'{frame_index-initial_frame} frames processed ({initial_frame}-{frame_index-1})\n')
     
-    solution_coord = get_sol_coord(tracks=tracks, num_frames=num_frames)
-
-    # Save results to a .CSV file
-    results_file = res_file+'_'+str(initial_frame)+'-'+str(frame_index-1)+'.csv'
-    write_csv(file_name=results_file, solution_coordinates=solution_coord)
-
-    fps_file = speed_file+'_'+str(initial_frame)+'-'+str(frame_index-1)+'.csv'
-    np.savetxt(fps_file, [fps_mean], delimiter=',')
-    time_file = runtime_file+'_'+str(initial_frame)+'-'+str(frame_index-1)+'.csv'
-    np.savetxt(time_file, [t_tot], delimiter=',')
-
-
-def assign_detections(tracks, detections, iou_th):
-    iou_mat= np.zeros((len(tracks),len(detections)),dtype=np.float32)
-
-    for t, trk in enumerate(tracks):
-        for d, det in enumerate(detections):
-            iou_mat[t, d] = iou(trk, det)
-
-    matched_idx = linear_assignment(-iou_mat)
-
-    unmatched_tracks, unmatched_detections = [], []
-    for t, trk in enumerate(tracks):
-        if (t not in matched_idx[:,0]):
-            unmatched_tracks.append(t)
-
-    for d, det in enumerate(detections):
-        if (d not in matched_idx[:,1]):
-            unmatched_detections.append(d)
-
-    matches = []
-    
-    for m in matched_idx:
-        if (iou_mat[m[0], m[1]] < iou_th/100):
-            unmatched_tracks.append(m[0])
-            unmatched_detections.append(m[1])
-        else:
-            matches.append(m.reshape(1,2))
-    
-    if (len(matches) == 0):
-        matches = np.empty((0,2), dtype=int)
-    else:
-        matches = np.concatenate(matches, axis=0)
-    
-    return matches, np.array(unmatched_detections), np.array(unmatched_tracks)
-
-def assign_detections2(tracks, detections, iou_th):
-    iou_mat= np.zeros((len(tracks),len(detections)),dtype=np.float32)
-
-    for t, trk in enumerate(tracks):
-        for d, det in enumerate(detections):
-            iou_mat[t, d] = iou(trk, det)
-
-    tracks_matched, det_matched = linear_sum_assignment(-iou_mat)
-
-    unmatched_tracks, unmatched_detections = [], []
-    for t, trk in enumerate(tracks):
-        if (t not in tracks_matched):
-            unmatched_tracks.append(t)
-
-    for d, det in enumerate(detections):
-        if (d not in det_matched):
-            unmatched_detections.append(d)
-
-    matches = []
-    
-    for track in tracks_matched:
-        for det in det_matched:
-            if (iou_mat[track, det]) < (iou_th/100):
-                unmatched_tracks.append(track)
-                unmatched_detections.append(det)
-            else:
-                m = np.array([track, det])
-                matches.append(m.reshape(1,2))
-    
-    if (len(matches) == 0):
-        matches = np.empty((0,2), dtype=int)
-    else:
-        matches = np.concatenate(matches, axis=0)
-    
-    return matches, np.array(unmatched_detections), np.array(unmatched_tracks)
-
-def iou(a, b):
-    w_intsec = np.maximum (0, (np.minimum(a[2], b[2]) - np.maximum(a[0], b[0])))
-    h_intsec = np.maximum (0, (np.minimum(a[3], b[3]) - np.maximum(a[1], b[1])))
-    s_intsec = w_intsec * h_intsec
-    
-    s_a = (a[2] - a[0])*(a[3] - a[1])
-    s_b = (b[2] - b[0])*(b[3] - b[1])
+    # Index of the sparse tracks files
+    for th in iou_ths:
+        writers[th].close(num_frames=frame_index-initial_frame, num_tracks=states[th].count)
 
-    return float(s_intsec)/(s_a + s_b -s_intsec)
-
-def get_sol_coord(tracks, num_frames):
-    solution_coord = []
-
-    for track in tracks:
-        trk_coord = track.get_coordinates()
-        if len(trk_coord) != num_frames:
-            missing = num_frames-len(trk_coord)
-            trk_coord = trk_coord + [None]*missing
-        solution_coord.append(trk_coord)
-    
-    return solution_coord
-
-def read_detections(det, cam, lost, camera, frame_index):
-    
-    det = det[frame_index]
-    cam = cam[frame_index]
-    lost = lost[frame_index]
-    
-    limbo = (82, 72.5)
-    #limbo = (0,0)
-
-    detections = []
-    #num_part = 0
-
-    for i, num_cam in enumerate(cam):
-        if (num_cam == camera) and (lost[i] == 0): # If the person is annotated on the right camera and is not lost
-            detection = [det[1+i*7], det[2+i*7], det[3+i*7], det[4+i*7]] # Coordinates of bboxes.
-            center = get_center(box=detection)
-            if good_box(box=detection, center=center, limbo=limbo): # Check if valid box
-                detections.append( np.array(detection) )
-                #num_part += 1
-        
-    return detections#, num_part
-
-def good_box(box, center, limbo):
-    limbo = limbo
-    if (box != (0,0,0,0)) and (limbo[0] <= center[0] < 960-limbo[0]) and (limbo[1] <= center[1] < 540-limbo[1]): # If box inside permitted region
-        approved = True
-    else:
-        approved = False 
-    return approved
-
-def get_center(box):
-    x1 = box[0]
-    y1 = box[1]
-    x2 = box[2]
-    y2 = box[3]
-        
-    xc = (x1+x2)/2
-    yc = (y1+y2)/2
-    center = (xc, yc)
-    return center
-
-def write_csv(file_name, solution_coordinates):
-    logging.info('Writing CSV ...\n')
-    csv_rows = []
-    people = len(solution_coordinates)
-    frames = len(solution_coordinates[0])
-
-    for frame in range(frames):
-        line = []
-        for track in range(people):
-            coordinate = solution_coordinates[track][frame]
-            if coordinate is None: # If target not present in the frame, coordinates will be (-1,-1,-1,-1)
-                x1 = y1 = x2 = y2 = -1
-            else:
-                x1, y1, x2, y2 = [str(x) for x in coordinate]
-            line = line + [x1, y1, x2, y2]
-        csv_rows.append(line)
-    
-    with open(file_name, 'w') as csv_file:
-        writer = csv.writer(csv_file, lineterminator='\n')
-        writer.writerows(csv_rows)
+        fps_file = speed_files[th]+'_'+str(initial_frame)+'-'+str(frame_index-1)+'.csv'
+        np.savetxt(fps_file, [fps_mean*len(iou_ths)], delimiter=',')
+        time_file = runtime_files[th]+'_'+str(initial_frame)+'-'+str(frame_index-1)+'.csv'
+        np.savetxt(time_file, [t_tot/len(iou_ths)], delimiter=',')
 
-    logging.info(f'CSV saved to: {file_name}\n')
 
+def read_detections(detection_index, frame_index):
+    boxes, participants = detection_index.get(frame_index)
+    return boxes
 
 if __name__ == '__main__':
 
@@ -314,11 +165,11 @@ if __name__ == '__main__':
         camera = int(sys.argv[2])
         initial_frame = int(sys.argv[3])
         num_frames = int(sys.argv[4])
-        iou_th = int(sys.argv[5])
+        iou_th = [int(th) for th in sys.argv[5].split(',')]
     except:
         print('Parameters not given correctly\n')
-        print('Usage:\n\tpython3 hungarian.py day camera initial_frame num_frames iou_th\n')
-        print('Example:\n\tpython3 hungarian.py 2 3 700 300 25\n')
+        print('Usage:\n\tpython3 hungarian.py day camera initial_frame num_frames iou_th[,iou_th...]\n')
+        print('Example:\n\tpython3 hungarian.py 2 3 700 300 25\n\tpython3 hungarian.py 2 3 700 300 10,25,50\n')
         sys.exit()
 
     paths = read.read_paths()
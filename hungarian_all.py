@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import sys, time, numpy as np, os
+
+from multiprocessing import Pool
+
+import read
+import hungarian
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+
+def main(paths, initial_frame=0, num_frames=36000, iou_th=10, days=(1, 2, 3), cameras=(1, 2, 3), processes=0):
+    # Hungarian baseline of every video at once: the annotations are converted once and mapped read-only by all the processes
+    final_frame = initial_frame+num_frames-1
+    if num_frames < 1:
+        logging.info('Number of frames needs to be higher than 0\n')
+        sys.exit()
+    if final_frame > 35999:
+        if initial_frame > 35999:
+            logging.info('Invalid initial frame (0-35999)\n')
+            sys.exit()
+        else:
+            final_frame = 35999
+            num_frames = final_frame+1-initial_frame
+
+    data_path = paths['data_path']
+    output_path = paths['output_path']
+    if not os.path.isdir(output_path):
+        logging.info('Output directory does not exist\n')
+        sys.exit()
+
+    # Directories and binary annotations created before starting the processes
+    cache_path = read.get_cache_path(output_path)
+    if not os.path.isdir(output_path+'hungarian/'):
+        os.mkdir(output_path+'hungarian/')
+    videos = []
+    for day in days:
+        det, cam, lost = read.load_annotations_cache(path=data_path, day=day, cache_path=cache_path)
+        cam = cam[initial_frame:initial_frame+num_frames]
+        lost = lost[initial_frame:initial_frame+num_frames]
+        for camera in cameras:
+            annotated = int(np.count_nonzero((cam == camera) & (lost == 0))) # Work of the video
+            videos.append((annotated, day, camera))
+    videos.sort(reverse=True) # Longest first, so the last ones to start are short
+
+    logging.info(f'Running Hungarian algorithm on {len(videos)} videos ...\n')
+    ti = time.time() # Start timer
+    jobs = [(paths, day, camera, initial_frame, num_frames, iou_th) for annotated, day, camera in videos]
+    failed = 0
+    with Pool(processes if processes > 0 else min(len(jobs), os.cpu_count())) as pool:
+        for day, camera, seconds, error in pool.imap_unordered(run_video, jobs):
+            if error is None:
+                logging.info(f'Day {day} Camera {camera} finished in {seconds:.1f} seconds\n')
+            else:
+                failed += 1
+                logging.info(f'Day {day} Camera {camera} failed: {error}\n')
+    logging.info(f'{len(jobs)-failed} videos completed in {time.time()-ti} seconds\n')
+
+def run_video(job):
+    # The scripts exit on errors, which would stop the worker process
+    paths, day, camera, initial_frame, num_frames, iou_th = job
+    ti = time.time()
+    try:
+        hungarian.main(paths, day, camera, initial_frame, num_frames, iou_th)
+    except SystemExit:
+        return day, camera, time.time()-ti, 'stopped by an error'
+    except Exception as e:
+        return day, camera, time.time()-ti, repr(e)
+    return day, camera, time.time()-ti, None
+
+if __name__ == '__main__':
+
+    try:
+        initial_frame = int(sys.argv[1])
+        num_frames = int(sys.argv[2])
+        iou_th = [int(th) for th in sys.argv[3].split(',')]
+        options = read.read_options(sys.argv[4:], {'days': '1,2,3', 'cameras': '1,2,3', 'processes': 0})
+        options['days'] = [int(day) for day in options['days'].split(',')]
+        options['cameras'] = [int(camera) for camera in options['cameras'].split(',')]
+    except:
+        print('Parameters not given correctly\n')
+        print('Usage:\n\tpython3 hungarian_all.py initial_frame num_frames iou_th[,iou_th...] [--days list] [--cameras list] [--processes n]\n')
+        print('Example:\n\tpython3 hungarian_all.py 0 36000 10,25,50\n')
+        sys.exit()
+
+    paths = read.read_paths()
+
+    main(paths, initial_frame, num_frames, iou_th, **options)
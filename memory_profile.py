@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import sys, json, tracemalloc, numpy as np
+
+from telemetry import get_rss # Memory used by the process
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+# Allocations of the profiler itself are not reported
+IGNORED = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, '<frozen importlib._bootstrap>'), tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'), tracemalloc.Filter(False, '<unknown>')]
+
+
+class MemoryProfiler:
+    '''
+    Memory of the MHT structures and top allocators sampled every few frames, to find what grows on long runs
+    '''
+    def __init__(self, interval=500, top=10, traceback_frames=1):
+        self.interval = interval # Frames between samples
+        self.top = top # Allocators reported for each phase
+        self.samples = [] # Memory of each structure at every sample
+        self.phases = [] # Growth between consecutive samples and its top allocators
+        self.last_frame = None
+        tracemalloc.start(traceback_frames)
+        self.first_snapshot = self.take_snapshot()
+        self.snapshot = self.first_snapshot
+
+    def take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(IGNORED)
+
+    def sample(self, frame_index, mht, primary_trackers, force=False):
+        # Phase from the previous sample up to this frame
+        if self.last_frame is None:
+            self.last_frame = frame_index
+        elif (frame_index == self.last_frame) or ((not force) and (frame_index-self.last_frame < self.interval)):
+            return
+        snapshot = self.take_snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+        sample = {'frame': frame_index,
+                  'hypotheses': len(mht.tracks),
+                  'traced': traced,
+                  'peak': peak,
+                  'rss': get_rss(),
+                  'structures': get_structure_sizes(mht, primary_trackers)}
+        if self.samples:
+            previous = self.samples[-1]
+            self.phases.append({'first': previous['frame']+1,
+                                'last': frame_index,
+                                'growth': traced-previous['traced'],
+                                'structures': {name: size-previous['structures'][name] for name, size in sample['structures'].items()},
+                                'top': get_top_allocators(snapshot, self.snapshot, self.top)})
+        self.samples.append(sample)
+        self.snapshot = snapshot
+        self.last_frame = frame_index
+
+    def save(self, file_name, info):
+        # JSON report with the samples, the growth of each phase and the top allocators over the whole run
+        report = dict(info, interval=self.interval, samples=self.samples, phases=self.phases, top=get_top_allocators(self.snapshot, self.first_snapshot, self.top))
+        tracemalloc.stop()
+        with open(file_name, 'w') as f:
+            json.dump(report, f, indent=1)
+        if len(self.samples) > 1:
+            first, last = self.samples[0], self.samples[-1]
+            logging.info(f'Traced memory from {first["traced"]/2**20:.1f} MB to {last["traced"]/2**20:.1f} MB (peak {last["peak"]/2**20:.1f} MB), resident memory from {first["rss"]/2**20:.1f} MB to {last["rss"]/2**20:.1f} MB')
+            for name, size in last['structures'].items():
+                logging.info(f'{name}: {first["structures"][name]/2**20:.2f} MB -> {size/2**20:.2f} MB')
+            for allocator in report['top'][:3]:
+                logging.info(f'{allocator["file"]}:{allocator["line"]}: {allocator["size_diff"]/2**20:+.2f} MB in {allocator["count_diff"]:+d} blocks')
+        logging.info(f'Memory report saved to: {file_name}\n')
+
+
+def get_top_allocators(snapshot, previous, top):
+    # Source lines whose allocations grew the most between two snapshots
+    allocators = []
+    for stat in snapshot.compare_to(previous, 'lineno')[:top]:
+        frame = stat.traceback[0]
+        allocators.append({'file': frame.filename,
+                           'line': frame.lineno,
+                           'size': stat.size,
+                           'size_diff': stat.size_diff,
+                           'count': stat.count,
+                           'count_diff': stat.count_diff})
+    return allocators
+
+def get_structure_sizes(mht, primary_trackers):
+    # Bytes held by each structure; objects shared by several of them count for the first one
+    seen = set()
+    hist_stacks = [track.get_hist_stack() for track in mht.tracks]
+    sizes = {'hist_stacks': get_size(hist_stacks, seen), # Histograms are copied with each hypothesis
+             'tracks': get_size(mht.tracks, seen),
+             'track_detections': get_size(mht.track_detections, seen),
+             'coordinates': get_size(mht.coordinates, seen),
+             'primary_trackers': get_size(primary_trackers, seen)} # Python side only: the OpenCV trackers show in the resident memory
+    if mht.hist_cache is not None:
+        sizes['hist_cache'] = get_size(mht.hist_cache, seen)
+    return sizes
+
+def get_size(obj, seen):
+    # Deep size of an object in bytes, without following functions, classes or modules
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if callable(obj) or isinstance(obj, type(sys)):
+            continue
+        size += sys.getsizeof(obj)
+        if isinstance(obj, np.ndarray): # Data included unless it is a view
+            if obj.base is not None:
+                stack.append(obj.base)
+        elif isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+    return size
@@ -1,19 +1,25 @@
 #!/usr/bin/env python3
 
-import cv2, numpy as np
+import os, cv2, time, numpy as np
 
 from copy import deepcopy
 
 from weighted_graph import WeightedGraph # MWIS algorithm codes
 from hypothesis import Track # Class for each hypothesis
+from timers import StageTimer # Time of each stage
+from telemetry import get_rss # Memory used by the process
 
 import logging
 logging.basicConfig(level = logging.INFO, # Messages on terminal
                     format = '%(asctime)s %(message)s',
                     datefmt = '%H:%M:%S')
 
+# Detection of a hypothesis on a frame older than the window: previous node of the same history (-1 if none), frame (relative to the first one) and box
+HISTORY_NODE = np.dtype([('previous', '<i8'), ('frame', '<i4'), ('box', '<f8', (4,))])
+
+
 class MHT:
-    def __init__(self, params):
+    def __init__(self, params, hist_cache=None, initial_frame=0, timer=None, telemetry=None, graph_log=None, history_file=None):
         # Load parameters
         self.N = params['N_pruning']
         self.d_th = params['distance_threshold']
@@ -24,12 +30,28 @@ class MHT:
         self.lost_time_th = params['lost_time_threshold']
         self.lost_time_weight = params['lost_time_weight']
         self.bins = params['color_hist_bins']
+        self.hist_cache = hist_cache # Color histograms computed on previous runs (None: no cache)
+        self.initial_frame = initial_frame # Frame of the video where the tracking starts
+        self.timer = timer if timer is not None else StageTimer(enabled=False) # Nothing is measured by default
+        self.telemetry = telemetry # Sink for a record of each frame (None: no records)
+        self.graph_log = graph_log # List or GraphWriter where the weights and edges of each MWIS graph are kept (None: not kept)
         
-        self.track_detections = [] # Track detections over all the frames
+        self.history_file = history_file # File where frames older than the window are moved (None: all the frames are kept in memory)
+        
+        self.track_detections = [] # Track detections over the frames of the window
         self.tracks = [] # Corresponding objects Track
-        self.coordinates = [] # Coordinates for all frame detections
+        self.coordinates = [] # Coordinates for the frame detections of the window
+        self.first_index = 0 # Frame of the first column of the window
+        self.history = [] # Last node of each hypothesis in the history file (-1: no detection before the window)
+        self.keys = [] # Key of each hypothesis, kept while it is not pruned
+        self.key_count = 0
+        self.old_conflicts = {} # Keys of the hypotheses sharing a detection older than the window with each one
+        self.history_store = None # History file opened for writing
+        self.num_nodes = 0 # Nodes written to the history file
         self.frame_index = 0
         self.traject_count = 0 # Used to set an ID to each object Track
+        self.solution = [] # Tracks of the last global hypothesis, their detections and history
+        self.num_sets = 0 # Maximal independent sets explored by the last MWIS
         
     def init(self, frame, detections):
         # Initialization of tracks in the first frame
@@ -41,103 +63,268 @@ class MHT:
             self.tracks.append(Track(init_track_id=self.traject_count, init_detection=detection, init_hist=box_hist))
             self.traject_count += 1
             self.track_detections.append([''] * self.frame_index + [detection_id])
+            self.add_hypothesis(history=-1)
+        self.solution = list(zip(self.tracks, self.track_detections, self.history))
         self.frame_index += 1
 
     def run(self, frame, detections, trackers_results):
+        if self.history_file is not None: # Only the frames used by the pruning and the output are kept in memory
+            while self.first_index < self.frame_index-max(self.N, 1):
+                self.forget()
         self.coordinates.append({})
         track_count = len(self.tracks)
 
         for index, detection in detections.items():
             detection_id = str(index)
-            self.coordinates[self.frame_index][detection_id] = detection
-            box_hist = self.get_color_histogram(frame=frame, box=detection) # Color histogram
+            self.coordinates[-1][detection_id] = detection
+            with self.timer.stage('histograms'):
+                box_hist = self.get_color_histogram(frame=frame, box=detection) # Color histogram
             
-            # Update existing branches
-            for i in range(track_count):
-                # Copy the track hypothesis
-                track_tree = self.tracks[i]
-                continued_branch = deepcopy(track_tree)
-                if continued_branch.is_lost(): # If hypothesis is a lost track
-                    hist_stack = continued_branch.get_hist_stack()
-                    lost_time = continued_branch.get_lost_time()
-                    candidate, score = self.get_matching_score(new_hist=box_hist, track_stack=hist_stack, lost_time=lost_time) # Compare color histograms between the current target and the lost one
-                    if candidate: # It is candidate if color histograms are similar enough
-                        # Create new hypothesis (copy + new detection)
-                        continued_branch.update(detection=detection, hist=box_hist, score=score, trackers_lost=False)
-                        self.tracks.append(continued_branch)
-                        self.track_detections.append(self.track_detections[i] + [detection_id])
-                else: # Regular (not lost) track
-                    track_id = continued_branch.get_track_id()
-                    inside, score, trackers_lost = self.get_trackers_score(detection=detection, tracker_results=trackers_results[track_id]) # Get track score based on distances
-                    if inside: # Create new hypothesis only if, at least, one of the primary trackers are inside the gating area
-                        continued_branch.update(detection=detection, hist=box_hist, score=score, trackers_lost=trackers_lost)
-                        self.tracks.append(continued_branch)
-                        self.track_detections.append(self.track_detections[i] + [detection_id])
+            with self.timer.stage('gating'): # Hypotheses formation
+                # Update existing branches
+                for i in range(track_count):
+                    # Copy the track hypothesis
+                    track_tree = self.tracks[i]
+                    continued_branch = deepcopy(track_tree)
+                    if continued_branch.is_lost(): # If hypothesis is a lost track
+                        hist_stack = continued_branch.get_hist_stack()
+                        lost_time = continued_branch.get_lost_time()
+                        candidate, score = self.get_matching_score(new_hist=box_hist, track_stack=hist_stack, lost_time=lost_time) # Compare color histograms between the current target and the lost one
+                        if candidate: # It is candidate if color histograms are similar enough
+                            # Create new hypothesis (copy + new detection)
+                            continued_branch.update(detection=detection, hist=box_hist, score=score, trackers_lost=False)
+                            self.tracks.append(continued_branch)
+                            self.track_detections.append(self.track_detections[i] + [detection_id])
+                            self.add_hypothesis(history=self.history[i], parent=self.keys[i])
+                    else: # Regular (not lost) track
+                        track_id = continued_branch.get_track_id()
+                        inside, score, trackers_lost = self.get_trackers_score(detection=detection, tracker_results=trackers_results[track_id]) # Get track score based on distances
+                        if inside: # Create new hypothesis only if, at least, one of the primary trackers are inside the gating area
+                            continued_branch.update(detection=detection, hist=box_hist, score=score, trackers_lost=trackers_lost)
+                            self.tracks.append(continued_branch)
+                            self.track_detections.append(self.track_detections[i] + [detection_id])
+                            self.add_hypothesis(history=self.history[i], parent=self.keys[i])
             
-            # Create new branch from the detection (new target possibility)
-            self.tracks.append(Track(init_track_id=self.traject_count, init_detection=detection, init_hist=box_hist))
-            self.traject_count += 1
-            self.track_detections.append([''] * self.frame_index + [detection_id])
+                # Create new branch from the detection (new target possibility)
+                self.tracks.append(Track(init_track_id=self.traject_count, init_detection=detection, init_hist=box_hist))
+                self.traject_count += 1
+                self.track_detections.append([''] * (self.frame_index-self.first_index) + [detection_id])
+                self.add_hypothesis(history=-1)
         
         # Update the track with a dummy detection (lost target possibility)
-        for j in range(track_count):
-            self.tracks[j].update(detection=None, hist=None, score=None, trackers_lost=None)
-            self.track_detections[j].append('')
+        with self.timer.stage('gating'):
+            for j in range(track_count):
+                self.tracks[j].update(detection=None, hist=None, score=None, trackers_lost=None)
+                self.track_detections[j].append('')
             
         
-        prune_index = max(0, self.frame_index-self.N) # Index for N-scan pruning
-        conflicting_tracks = self.get_conflicting_tracks(self.track_detections) # Conflicting tracks: share an observation at any time
-        solution_ids = self.get_global_hypothesis(self.tracks, conflicting_tracks) # MWIS
-        non_solution_ids = list(set(range(len(self.tracks))) - set(solution_ids))
-        prune_ids = set()
-        solution_coordinates = [] # List of coordinates for each track
-        for solution_id in solution_ids:
-            detections = self.track_detections[solution_id]
-            track_coordinates = []
-            for i in range(len(detections)):
-                if detections[i] == '':
-                    track_coordinates.append(None)
-                else:
-                    track_coordinates.append(self.coordinates[i][detections[i]])
-            solution_coordinates.append(track_coordinates) # Get the coordinates (bboxes) of the solution
-            
-            # Identify subtrees that diverge from the solution_trees at frame k-N
-            if self.N > 0:
-                d_id = self.track_detections[solution_id][prune_index]
-                if d_id != '':
-                    for non_solution_id in non_solution_ids:
-                        if d_id == self.track_detections[non_solution_id][prune_index]:
-                            prune_ids.add(non_solution_id)
+        if self.telemetry is not None: # Detections and hypotheses before pruning
+            num_detections = len(self.coordinates[-1])
+            num_hypotheses = len(self.tracks)
+            num_lost = sum(1 for track in self.tracks if track.is_lost())
+        prune_index = max(0, self.frame_index-self.N)-self.first_index # Index for N-scan pruning (in the window)
+        with self.timer.stage('conflicts'):
+            conflicting_tracks = self.get_conflicting_tracks(self.track_detections) # Conflicting tracks: share an observation at any time
+            conflicting_tracks.extend(self.get_old_conflicts())
+        with self.timer.stage('mwis'):
+            t0 = time.perf_counter()
+            solution_ids = self.get_global_hypothesis(self.tracks, conflicting_tracks) # MWIS
+            mwis_time = time.perf_counter()-t0
+        with self.timer.stage('pruning'):
+            non_solution_ids = list(set(range(len(self.tracks))) - set(solution_ids))
+            self.solution = [(self.tracks[i], self.track_detections[i], self.history[i]) for i in solution_ids]
+            prune_ids = set()
+            for solution_id in solution_ids:
+                # Identify subtrees that diverge from the solution_trees at frame k-N
+                if self.N > 0:
+                    d_id = self.track_detections[solution_id][prune_index]
+                    if d_id != '':
+                        for non_solution_id in non_solution_ids:
+                            if d_id == self.track_detections[non_solution_id][prune_index]:
+                                prune_ids.add(non_solution_id)
         
-        # Perform pruning
-        if self.N == 0:
-            prune_ids = non_solution_ids
-        for k in sorted(prune_ids, reverse=True):
-            del self.track_detections[k]
-            del self.tracks[k]
-
-        # Get the ID from each solution hypothesis
-        track_ids = []
-        for track in self.tracks:
-            track_ids.append(track.get_track_id())
-        self.traject_count = max(track_ids)+1
-
-        new_tracks = {}
-        # Identify tracks of new targets and the ones which have their
-        # primary trackers too far from the solutions, so need to be re-initialized
-        for i, track in enumerate(self.track_detections):
-            if track[len(track)-1] != '' and track[len(track)-2] == '':
-                new_id = self.tracks[i].get_track_id()
-                new_box = self.tracks[i].get_last_detection()
-                new_tracks[new_id] = new_box
-            if self.tracks[i].are_trackers_lost():
-                new_id = self.tracks[i].get_track_id()
-                new_box = self.tracks[i].get_last_detection()
-                new_tracks[new_id] = new_box
+            # Perform pruning
+            if self.N == 0:
+                prune_ids = non_solution_ids
+            for k in sorted(prune_ids, reverse=True):
+                del self.track_detections[k]
+                del self.tracks[k]
+                del self.history[k]
+                key = self.keys.pop(k)
+                for partner in self.old_conflicts.pop(key):
+                    self.old_conflicts[partner].discard(key)
+
+            # Get the ID from each solution hypothesis
+            track_ids = []
+            for track in self.tracks:
+                track_ids.append(track.get_track_id())
+            self.traject_count = max(track_ids)+1
+
+            new_tracks = {}
+            # Identify tracks of new targets and the ones which have their
+            # primary trackers too far from the solutions, so need to be re-initialized
+            for i, track in enumerate(self.track_detections):
+                if track[len(track)-1] != '' and track[len(track)-2] == '':
+                    new_id = self.tracks[i].get_track_id()
+                    new_box = self.tracks[i].get_last_detection()
+                    new_tracks[new_id] = new_box
+                if self.tracks[i].are_trackers_lost():
+                    new_id = self.tracks[i].get_track_id()
+                    new_box = self.tracks[i].get_last_detection()
+                    new_tracks[new_id] = new_box
+
+        if self.telemetry is not None:
+            self.telemetry.write({'frame': self.initial_frame+self.frame_index,
+                                  'detections': num_detections,
+                                  'hypotheses': num_hypotheses,
+                                  'lost': num_lost,
+                                  'edges': len(set(conflicting_tracks)),
+                                  'maximal_sets': self.num_sets,
+                                  'pruned': len(prune_ids),
+                                  'kept': len(self.tracks),
+                                  'mwis_time': mwis_time,
+                                  'rss': get_rss()})
         
         self.frame_index += 1
         
-        return solution_coordinates, track_ids, new_tracks
+        return track_ids, new_tracks
+
+    def add_hypothesis(self, history, parent=None):
+        # Key of a new hypothesis: a continued branch shares the detections of its parent before the window
+        key = self.key_count
+        self.key_count += 1
+        self.keys.append(key)
+        self.history.append(history)
+        if parent is None:
+            self.old_conflicts[key] = set()
+            return
+        partners = set(self.old_conflicts[parent])
+        if history != -1:
+            partners.add(parent)
+        self.old_conflicts[key] = partners
+        for partner in partners:
+            self.old_conflicts[partner].add(key)
+
+    def forget(self):
+        # Move the first frame of the window to the history file, keeping the conflicts it gives
+        detections = [track[0] for track in self.track_detections]
+        sharing = {}
+        for key, detection_id in zip(self.keys, detections):
+            if detection_id != '':
+                sharing.setdefault(detection_id, []).append(key)
+        for keys in sharing.values():
+            for key in keys:
+                self.old_conflicts[key].update(keys)
+                self.old_conflicts[key].discard(key)
+
+        # Hypotheses with the same history and detection share the node
+        nodes = {}
+        for i, detection_id in enumerate(detections):
+            if detection_id != '':
+                self.history[i] = nodes.setdefault((self.history[i], detection_id), self.num_nodes+len(nodes))
+        records = np.zeros(len(nodes), dtype=HISTORY_NODE)
+        for (previous, detection_id), node in nodes.items():
+            records[node-self.num_nodes] = (previous, self.first_index, self.coordinates[0][detection_id])
+        if self.history_store is None:
+            self.history_store = open(self.history_file, 'wb')
+        self.history_store.write(records.tobytes())
+        self.num_nodes += len(nodes)
+
+        for track in self.track_detections:
+            del track[0]
+        del self.coordinates[0]
+        self.first_index += 1
+
+    def get_old_conflicts(self):
+        # Pairs of hypotheses sharing a detection before the window
+        position = {key: i for i, key in enumerate(self.keys)}
+        conflicting_tracks = []
+        for i, key in enumerate(self.keys):
+            for partner in self.old_conflicts[key]:
+                j = position[partner]
+                if i < j:
+                    conflicting_tracks.append((i, j))
+        return conflicting_tracks
+
+    def get_state(self):
+        # Hypotheses to resume the tracking (the history file is flushed, its first nodes belong to the state)
+        if self.history_store is not None:
+            self.history_store.flush()
+        return {'tracks': self.tracks,
+                'track_detections': self.track_detections,
+                'coordinates': self.coordinates,
+                'first_index': self.first_index,
+                'history': self.history,
+                'keys': self.keys,
+                'key_count': self.key_count,
+                'old_conflicts': self.old_conflicts,
+                'num_nodes': self.num_nodes,
+                'frame_index': self.frame_index,
+                'traject_count': self.traject_count,
+                'solution': self.solution}
+
+    def set_state(self, state):
+        self.tracks = state['tracks']
+        self.track_detections = state['track_detections']
+        self.coordinates = state['coordinates']
+        self.first_index = state['first_index']
+        self.history = state['history']
+        self.keys = state['keys']
+        self.key_count = state['key_count']
+        self.old_conflicts = state['old_conflicts']
+        self.num_nodes = state['num_nodes']
+        self.frame_index = state['frame_index']
+        self.traject_count = state['traject_count']
+        self.solution = state['solution']
+        if self.history_file is not None: # Nodes written after the state are discarded
+            if self.history_store is not None:
+                self.history_store.close()
+            self.history_store = open(self.history_file, 'r+b' if os.path.isfile(self.history_file) else 'wb')
+            if os.path.getsize(self.history_file) < self.num_nodes*HISTORY_NODE.itemsize:
+                raise RuntimeError(f'History file {self.history_file} is shorter than the state to resume')
+            self.history_store.truncate(self.num_nodes*HISTORY_NODE.itemsize)
+            self.history_store.seek(0, os.SEEK_END)
+
+    def sync(self):
+        # Nodes of the last state on disk (called from the checkpoint thread)
+        if self.history_store is not None:
+            os.fsync(self.history_store.fileno())
+
+    def close(self):
+        # The history file is only needed while tracking
+        if self.history_store is not None:
+            self.history_store.close()
+            self.history_store = None
+        if (self.history_file is not None) and os.path.isfile(self.history_file):
+            os.remove(self.history_file)
+
+    def get_solution_frame(self, index):
+        # Track ID and box of each track of the last global hypothesis on a frame of the window (index relative to the first frame)
+        boxes = []
+        for track, detections, history in self.solution:
+            d_id = detections[index-self.first_index]
+            if d_id != '':
+                boxes.append((track.get_track_id(), self.coordinates[index-self.first_index][d_id]))
+        return boxes
+
+    def get_solution_history(self):
+        # Frames (relative to the first one) and boxes of each track of the last global hypothesis over all the frames
+        if self.num_nodes > 0:
+            self.history_store.flush()
+            nodes = np.fromfile(self.history_file, dtype=HISTORY_NODE, count=self.num_nodes)
+        solution_history = []
+        for track, detections, history in self.solution:
+            boxes = []
+            node = history
+            while node != -1: # Frames before the window, from the last one
+                boxes.append((int(nodes[node]['frame']), tuple(nodes[node]['box'].tolist())))
+                node = nodes[node]['previous']
+            boxes.reverse()
+            for i, d_id in enumerate(detections):
+                if d_id != '':
+                    boxes.append((self.first_index+i, self.coordinates[i][d_id]))
+            solution_history.append(boxes)
+        return solution_history
 
     def get_matching_score(self, new_hist, track_stack, lost_time):
         # Get score based on distance between color histograms and lost time
@@ -209,15 +396,16 @@ class MHT:
         return distance
 
     def get_color_histogram(self, frame, box):
-        # Compute color histograms
-        bins = self.bins
-        img = frame.copy()
-        img = img[int(box[1]):int(box[3]), int(box[0]):int(box[2])] # Get section of image bordered by bbox
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        hist = cv2.calcHist([img], [0, 1, 2], None, [bins, bins, bins], [0, 256, 0, 256, 0, 256])
-        hist = cv2.normalize(hist, hist).flatten()
-        return hist
-    
+        # Compute color histograms, or take them from the cache
+        if self.hist_cache is not None:
+            frame_number = self.initial_frame+self.frame_index
+            hist = self.hist_cache.get(frame_index=frame_number, box=box)
+            if hist is None:
+                hist = compute_color_histogram(frame=frame, box=box, bins=self.bins)
+                self.hist_cache.put(frame_index=frame_number, box=box, hist=hist)
+            return hist
+        return compute_color_histogram(frame=frame, box=box, bins=self.bins)
+
     def get_conflicting_tracks(self, track_detections):
         # Identify conflicting tracks
         conflicting_tracks = []
@@ -242,7 +430,19 @@ class MHT:
             gh_graph.add_weighted_vertex(str(index), s)
 
         gh_graph.set_edges(conflicting_tracks)
+        if self.graph_log is not None:
+            self.graph_log.append(([track.get_track_score() for track in tracks], sorted(set(conflicting_tracks))))
 
         mwis_ids = gh_graph.mwis()
+        self.num_sets = gh_graph.num_sets
         
-        return mwis_ids
\ No newline at end of file
+        return mwis_ids
+
+
+def compute_color_histogram(frame, box, bins):
+    # Color histogram of the bbox, shared with the stitching of chunks
+    img = frame[int(box[1]):int(box[3]), int(box[0]):int(box[2])] # Get section of image bordered by bbox
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    hist = cv2.calcHist([img], [0, 1, 2], None, [bins, bins, bins], [0, 256, 0, 256, 0, 256])
+    hist = cv2.normalize(hist, hist).flatten()
+    return hist
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+import os, sys, json, time, random, socket, platform, numpy as np
+
+import read
+from weighted_graph import WeightedGraph # MWIS algorithm codes
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+
+def main(sizes, densities, seeds=3, repeat=3, graphs='', max_graphs=200, baseline='', save_baseline=False, tolerance=1.5):
+    # Times of each MWIS solver on generated conflict graphs (and on graphs captured from the tracker), checking that all of them find the optimal weight
+    cases = []
+    for family, generator in GENERATORS.items():
+        for size in sizes:
+            for density in densities:
+                for seed in range(seeds):
+                    weights, edges = generator(size, density, np.random.RandomState(seed))
+                    cases.append({'name': family+'_n'+str(size)+'_d'+str(density)+'_s'+str(seed), 'weights': weights, 'edges': edges})
+    if graphs: # Only the graphs that load the solvers the most are read
+        for k, weights, edges in load_graphs(graphs, max_graphs=max_graphs):
+            cases.append({'name': 'captured_'+str(k), 'weights': weights, 'edges': edges})
+
+    results = {}
+    mismatches = 0
+    for case in cases:
+        result = run_case(case['weights'], case['edges'], repeat=repeat)
+        results[case['name']] = result
+        if not result['agree']:
+            mismatches += 1
+            logging.info(f'{case["name"]}: solvers disagree on the optimal weight: {result["weights"]}')
+    for solver in SOLVERS:
+        total = sum(result['times'][solver] for result in results.values())
+        logging.info(f'{solver}: {total:.3f} s on {len(results)} graphs')
+    logging.info(f'{mismatches} graphs with different optimal weights\n')
+
+    report = {'host': socket.gethostname(),
+              'python': platform.python_version(),
+              'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'repeat': repeat,
+              'results': results}
+    if baseline and save_baseline:
+        with open(baseline, 'w') as f:
+            json.dump(report, f, indent=1)
+        logging.info(f'Baseline saved to: {baseline}\n')
+    elif baseline:
+        report['regressions'] = compare(results, baseline=baseline, tolerance=tolerance)
+    return report
+
+
+def run_case(weights, edges, repeat):
+    # Best time of each solver over the repetitions and the weight of the set it returns
+    times = {}
+    set_weights = {}
+    for solver, solve in SOLVERS.items():
+        for r in range(repeat):
+            random.seed(r) # The pivots of Bron-Kerbosch are chosen at random
+            ti = time.perf_counter()
+            solution = solve(weights, edges)
+            seconds = time.perf_counter()-ti
+            times[solver] = min(seconds, times.get(solver, seconds))
+        set_weights[solver] = float(sum(weights[i] for i in solution))
+    best = max(set_weights.values())
+    return {'vertices': len(weights),
+            'edges': len(edges),
+            'times': times,
+            'weights': set_weights,
+            'agree': all(abs(w-best) <= 1e-9*max(1, abs(best)) for w in set_weights.values())}
+
+def compare(results, baseline, tolerance, min_time=0.01):
+    # Solvers slower than 'tolerance' times the same graph of the baseline (times under 'min_time' seconds are noise)
+    with open(baseline) as f:
+        previous = json.load(f)['results']
+    regressions = []
+    for name, result in results.items():
+        if name not in previous:
+            continue
+        for solver, seconds in result['times'].items():
+            before = previous[name]['times'].get(solver)
+            if (before is not None) and (seconds > min_time) and (seconds > tolerance*before):
+                regressions.append({'graph': name, 'solver': solver, 'baseline': before, 'time': seconds})
+        if previous[name]['weights'] and (max(result['weights'].values()) < max(previous[name]['weights'].values())-1e-9):
+            regressions.append({'graph': name, 'solver': None, 'baseline': max(previous[name]['weights'].values()), 'weight': max(result['weights'].values())})
+    for solver in SOLVERS:
+        common = [name for name in results if (name in previous) and (solver in previous[name]['times'])]
+        if common:
+            before = sum(previous[name]['times'][solver] for name in common)
+            now = sum(results[name]['times'][solver] for name in common)
+            logging.info(f'{solver}: {before:.3f} s -> {now:.3f} s ({now/max(before, 1e-9):.2f}x) on {len(common)} graphs of the baseline')
+    for regression in regressions:
+        logging.info(f'Regression: {regression}')
+    logging.info(f'{len(regressions)} regressions against {baseline}\n')
+    return regressions
+
+
+def solve_bron_kerbosch(weights, edges):
+    # Solver of the MHT: best of all the maximal independent sets
+    graph = WeightedGraph()
+    for index, weight in enumerate(weights):
+        graph.add_weighted_vertex(str(index), weight)
+    graph.set_edges(list(edges))
+    return [int(v) for v in graph.mwis()]
+
+def solve_branch_and_bound(weights, edges):
+    # Reference solver: include or exclude each vertex, bounded by the weight of the remaining candidates
+    n = len(weights)
+    neighbours = [0]*n # Bit sets
+    for i, j in edges:
+        neighbours[i] |= 1 << j
+        neighbours[j] |= 1 << i
+    order = sorted(range(n), key=lambda v: weights[v], reverse=True)
+    positive = [max(weights[v], 0) for v in range(n)]
+    best = [float('-inf'), 0]
+
+    def search(candidates, weight, chosen, start):
+        if weight > best[0]:
+            best[0], best[1] = weight, chosen
+        bound = weight+sum(positive[v] for v in order[start:] if candidates >> v & 1)
+        if bound <= best[0]:
+            return
+        while (start < n) and not (candidates >> order[start] & 1):
+            start += 1
+        if start == n:
+            return
+        v = order[start]
+        search(candidates & ~neighbours[v] & ~(1 << v), weight+weights[v], chosen | (1 << v), start+1)
+        search(candidates & ~(1 << v), weight, chosen, start+1)
+
+    search((1 << n)-1, 0.0, 0, 0)
+    return [v for v in range(n) if best[1] >> v & 1]
+
+SOLVERS = {'bron_kerbosch': solve_bron_kerbosch,
+           'branch_and_bound': solve_branch_and_bound}
+
+
+def get_weights(size, rs):
+    # Track scores: accumulated matching scores of the frames of each hypothesis
+    return rs.uniform(0.001, 5, size).tolist()
+
+def interval_graph(size, density, rs, num_frames=20):
+    # Hypotheses of a few targets spanning frame intervals; two of them conflict if they follow the same target on a common frame
+    lanes = max(1, int(round(size*(1-density)/4)))
+    lane = rs.randint(0, lanes, size)
+    start = rs.randint(0, num_frames, size)
+    end = np.minimum(start+rs.randint(1, num_frames, size), num_frames)
+    edges = [(i, j) for i in range(size) for j in range(i+1, size) if (lane[i] == lane[j]) and (start[i] < end[j]) and (start[j] < end[i])]
+    return get_weights(size, rs), edges
+
+def clustered_graph(size, density, rs, cluster_size=6, outside=0.02):
+    # Groups of hypotheses branching from the same targets: dense inside each group, a few conflicts between groups
+    cluster = np.arange(size)//cluster_size
+    edges = [(i, j) for i in range(size) for j in range(i+1, size) if rs.uniform() < (density if cluster[i] == cluster[j] else outside)]
+    return get_weights(size, rs), edges
+
+def random_graph(size, density, rs):
+    edges = [(i, j) for i in range(size) for j in range(i+1, size) if rs.uniform() < density]
+    return get_weights(size, rs), edges
+
+GENERATORS = {'interval': interval_graph,
+              'clustered': clustered_graph,
+              'random': random_graph}
+
+
+class GraphWriter:
+    '''
+    Graphs of the global hypotheses appended to a file as the tracker builds them: number of vertices and edges, weights and edges of each one
+    '''
+    def __init__(self, file_name, append=False):
+        self.file_name = file_name
+        self.file = open(file_name, 'ab' if append else 'wb')
+        self.count = 0
+
+    def append(self, graph):
+        # Same call as a list, so the MHT can keep the graphs in either
+        weights = np.asarray(graph[0], dtype='<f8')
+        edges = np.asarray(graph[1], dtype='<i4').reshape(-1, 2)
+        self.file.write(np.array([len(weights), len(edges)], dtype='<i4').tobytes()+weights.tobytes()+edges.tobytes())
+        self.count += 1
+
+    def tell(self):
+        return self.file.tell()
+
+    def flush(self):
+        self.file.flush()
+
+    def truncate(self, size):
+        # Drop the graphs after the first 'size' bytes (frames processed again when a run is resumed)
+        self.file.flush()
+        self.file.truncate(min(size, os.path.getsize(self.file_name))) # Graphs not flushed before an interruption are lost
+
+    def close(self):
+        self.file.close()
+        logging.info(f'{self.count} MWIS graphs saved to: {self.file_name}\n')
+
+
+def save_graphs(file_name, graphs):
+    # Graphs of the global hypotheses of a run: weights and edges of all of them, with the offsets of each graph
+    weights = [np.asarray(w, dtype=np.float64) for w, e in graphs]
+    edges = [np.asarray(e, dtype=np.int32).reshape(-1, 2) for w, e in graphs]
+    np.savez(file_name,
+             weights=np.concatenate(weights) if weights else np.zeros(0),
+             weight_offsets=np.cumsum([0]+[len(w) for w in weights]),
+             edges=np.concatenate(edges) if edges else np.zeros((0, 2), dtype=np.int32),
+             edge_offsets=np.cumsum([0]+[len(e) for e in edges]))
+    logging.info(f'{len(graphs)} MWIS graphs saved to: {file_name}\n')
+
+def load_graphs(file_name, max_graphs=None):
+    # Index in the run, weights and edges of the graphs of a file (only the 'max_graphs' with most vertices if given)
+    if file_name.endswith('.npz'): # Saved by save_graphs
+        data = np.load(file_name)
+        wo, eo = data['weight_offsets'], data['edge_offsets']
+        sizes = np.diff(wo)
+        selected = get_largest(sizes, max_graphs)
+        return [(k, data['weights'][wo[k]:wo[k+1]].tolist(), [tuple(e) for e in data['edges'][eo[k]:eo[k+1]].tolist()]) for k in selected]
+
+    # Written by GraphWriter: the headers are read first, then only the selected graphs
+    file_size = os.path.getsize(file_name)
+    offsets = []
+    sizes = []
+    with open(file_name, 'rb') as f:
+        while f.tell()+8 <= file_size:
+            num_weights, num_edges = np.fromfile(f, dtype='<i4', count=2)
+            offsets.append(f.tell())
+            sizes.append((int(num_weights), int(num_edges)))
+            f.seek(8*num_weights+8*num_edges, os.SEEK_CUR)
+        if (len(offsets) > 0) and (offsets[-1]+8*sum(sizes[-1]) > file_size): # Last graph of an interrupted run
+            offsets.pop()
+            sizes.pop()
+        graphs = []
+        for k in get_largest([num_weights for num_weights, num_edges in sizes], max_graphs):
+            f.seek(offsets[k])
+            weights = np.fromfile(f, dtype='<f8', count=sizes[k][0])
+            edges = np.fromfile(f, dtype='<i4', count=2*sizes[k][1]).reshape(-1, 2)
+            graphs.append((k, weights.tolist(), [tuple(e) for e in edges.tolist()]))
+    return graphs
+
+def get_largest(sizes, max_graphs):
+    # Indexes of the 'max_graphs' largest graphs (all if None), in their order in the run
+    if max_graphs is None:
+        return list(range(len(sizes)))
+    return sorted(sorted(range(len(sizes)), key=lambda k: sizes[k], reverse=True)[:max_graphs])
+
+if __name__ == '__main__':
+
+    try:
+        options = read.read_options(sys.argv[1:], {'sizes': '10,20,30', 'densities': '0.1,0.3,0.6', 'seeds': 3, 'repeat': 3, 'graphs': '', 'max_graphs': 200, 'baseline': '', 'save_baseline': False, 'tolerance': 1.5})
+        sizes = [int(value) for value in options.pop('sizes').split(',')]
+        densities = [float(value) for value in options.pop('densities').split(',')]
+        if options['save_baseline'] and not options['baseline']:
+            raise ValueError('--save-baseline needs --baseline')
+    except:
+        print('Parameters not given correctly\n')
+        print('Usage:\n\tpython3 mwis_benchmark.py [--sizes list] [--densities list] [--seeds n] [--repeat r] [--graphs file] [--max-graphs n] [--baseline file [--save-baseline]] [--tolerance ratio]\n')
+        print('Where the graphs file is saved by the tracker with --capture-graphs\n')
+        print('Example:\n\tpython3 mwis_benchmark.py --sizes 10,20,30 --baseline MWIS_baseline.json --save-baseline\n\tpython3 mwis_benchmark.py --sizes 10,20,30 --baseline MWIS_baseline.json\n')
+        sys.exit()
+
+    main(sizes, densities, **options)
@@ -49,7 +49,7 @@ def participants_history(paths, day=2, camera=3, initial_frame=0, num_frames=360
 
     # Read ground truth
     logging.info('Getting ground truth ...\n')
-    gtruth_full = read.read_ground_truth(filename=gt_name, initial_frame=initial_frame, num_frames=num_frames)
+    gtruth_full = read.read_ground_truth(filename=gt_name, initial_frame=initial_frame, num_frames=num_frames, cache_path=read.get_cache_path(output_path))
 
     people = int(len(gtruth_full[0])/4)
     present = {}
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+import cv2, random, numpy as np
+
+import read
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+
+class PrimaryTrackers:
+    '''
+    KCF, MedianFlow and MIL trackers of each target (live tracking)
+    '''
+    def __init__(self, recording=False):
+        self.multi_tracker = cv2.MultiTracker_create() # Object MultiTracker
+        self.targets_tracked = [] # Target ID of each group of three trackers
+        self.frame_count = 0 # Frames processed since the initialization
+        self.recording = recording # Keep trackers outputs to replay them
+        self.events = [] # Initializations: (frame, target ID, replacing ID or -1, box)
+        self.results = [] # Trackers outputs of each frame: (target IDs, boxes)
+
+    def init(self, frame, detections):
+        # Initialization of primary trackers for each target in the first frame
+        for key, box in detections.items():
+            self.add_target(frame=frame, key=key, box=box, renamed=-1)
+
+    def update(self, frame):
+        # Update primary trackers for the current frame
+        self.frame_count += 1
+        ret, multitracker_results = self.multi_tracker.update(frame)
+        # Turn results from primary trackers into a dictionary for MHT
+        trackers_results = change_track_boxes(init_boxes=multitracker_results, indexes=self.targets_tracked)
+        if self.recording:
+            self.results.append((list(trackers_results.keys()), list(trackers_results.values())))
+        return trackers_results
+
+    def add(self, frame, new_tracks, ids):
+        # Update primary trackers when they're lost or there are new targets
+        for key, box in new_tracks.items():
+            renamed = -1
+            if key in ids: # If an existing tracker needs to be updated
+                renamed = random.randint(50,500) # Change ID
+            self.add_target(frame=frame, key=key, box=box, renamed=renamed)
+
+    def add_target(self, frame, key, box, renamed):
+        if renamed != -1:
+            i = self.targets_tracked.index(key)
+            self.targets_tracked[i] = renamed
+        self.targets_tracked.append(key) # Append corresponding ID
+        self.events.append((self.frame_count, key, renamed, tuple(box)))
+
+        # Append new trackers for the target
+        new_box = (box[0], box[1], box[2]-box[0], box[3]-box[1]) # From (x1,y1,x2,y2) to (x1,y1,width,height)
+        self.multi_tracker.add(cv2.TrackerKCF_create(), frame, new_box)
+        self.multi_tracker.add(cv2.TrackerMedianFlow_create(), frame, new_box)
+        self.multi_tracker.add(cv2.TrackerMIL_create(), frame, new_box)
+
+    def get_state(self):
+        # Trackers can not be saved, but they can be rebuilt from their initializations. Each one depends on every frame since it was
+        # added, so they are run again from the first frame: resuming costs a pass of decoding and tracking (without the MHT) up to the state
+        return {'frame_count': self.frame_count, 'events': list(self.events)}
+
+    def resume(self, state, open_video, initial_frame):
+        self.__init__(recording=self.recording)
+        rebuild_trackers(trackers=self, open_video=open_video, initial_frame=initial_frame, events=group_events(state['events']), last_frame=state['frame_count'])
+
+    def save(self, file_name, initial_frame, video_stamp=None):
+        # Save the recording to a compressed binary file
+        offsets = np.zeros(len(self.results)+1, dtype=np.int64) # Rows of each frame in the results arrays
+        offsets[1:] = np.cumsum([len(keys) for keys, boxes in self.results])
+        result_ids = np.array([key for keys, boxes in self.results for key in keys], dtype=np.int32)
+        result_boxes = np.array([box for keys, boxes in self.results for box in boxes], dtype=np.float64).reshape(-1, 3, 4)
+        np.savez_compressed(file_name,
+                            initial_frame=np.array(initial_frame),
+                            video_stamp=np.array(read.get_video_stamp(None) if video_stamp is None else video_stamp, dtype=np.int64),
+                            offsets=offsets,
+                            result_ids=result_ids,
+                            result_boxes=result_boxes,
+                            event_frames=np.array([e[0] for e in self.events], dtype=np.int32),
+                            event_keys=np.array([e[1] for e in self.events], dtype=np.int32),
+                            event_renamed=np.array([e[2] for e in self.events], dtype=np.int32),
+                            event_boxes=np.array([e[3] for e in self.events], dtype=np.float64).reshape(-1, 4))
+        logging.info(f'Primary trackers recording saved to: {file_name}\n')
+
+
+class ReplayTrackers:
+    '''
+    Primary trackers fed back from a recording, switching to live tracking when the MHT diverges from it
+    '''
+    def __init__(self, file_name, initial_frame, open_video):
+        rec = np.load(file_name)
+        if int(rec['initial_frame']) != initial_frame:
+            raise ValueError(f'Recording {file_name} starts at frame {int(rec["initial_frame"])}')
+        self.offsets = rec['offsets']
+        self.result_ids = rec['result_ids']
+        self.result_boxes = rec['result_boxes']
+        self.events = group_events(zip(rec['event_frames'], rec['event_keys'], rec['event_renamed'], rec['event_boxes'])) # Initializations of each frame
+        self.initial_frame = initial_frame
+        self.open_video = open_video # Function returning a new VideoReader to rebuild live trackers
+        self.frame_count = 0
+        self.live = None # Live trackers once the recording can not be used anymore
+        logging.info(f'Replaying primary trackers from: {file_name}\n')
+
+    def init(self, frame, detections):
+        recorded = [(key, tuple(box)) for key, renamed, box in self.events.get(0, [])]
+        if recorded != [(key, tuple(box)) for key, box in detections.items()]:
+            self.go_live(last_frame=-1)
+            self.live.init(frame=frame, detections=detections)
+
+    def update(self, frame):
+        if self.live is not None:
+            return self.live.update(frame)
+        self.frame_count += 1
+        if self.frame_count >= len(self.offsets): # End of the recording
+            self.go_live(last_frame=self.frame_count-1)
+            return self.live.update(frame)
+
+        first, last = self.offsets[self.frame_count-1], self.offsets[self.frame_count]
+        trackers_results = {}
+        for key, boxes in zip(self.result_ids[first:last], self.result_boxes[first:last]):
+            trackers_results[int(key)] = [tuple(box) for box in boxes]
+        return trackers_results
+
+    def add(self, frame, new_tracks, ids):
+        if self.live is not None:
+            return self.live.add(frame=frame, new_tracks=new_tracks, ids=ids)
+        # Initializations must be the ones recorded, otherwise the trackers outputs would change
+        recorded = [(key, renamed != -1, box) for key, renamed, box in self.events.get(self.frame_count, [])]
+        if recorded != [(key, key in ids, tuple(box)) for key, box in new_tracks.items()]:
+            logging.info(f'MHT diverged from the recording on frame {self.initial_frame+self.frame_count}, switching to live tracking\n')
+            self.go_live(last_frame=self.frame_count-1)
+            self.live.update(frame)
+            self.live.add(frame=frame, new_tracks=new_tracks, ids=ids)
+
+    def get_state(self):
+        return {'frame_count': self.frame_count, 'live': None if self.live is None else self.live.get_state()}
+
+    def resume(self, state, open_video, initial_frame):
+        self.frame_count = state['frame_count']
+        self.live = None
+        if state['live'] is not None:
+            self.live = PrimaryTrackers()
+            self.live.resume(state=state['live'], open_video=open_video, initial_frame=initial_frame)
+
+    def go_live(self, last_frame):
+        # Rebuild the trackers state by running them with the recorded initializations up to 'last_frame'
+        self.live = PrimaryTrackers()
+        if last_frame >= 0:
+            rebuild_trackers(trackers=self.live, open_video=self.open_video, initial_frame=self.initial_frame, events=self.events, last_frame=last_frame)
+
+
+def rebuild_trackers(trackers, open_video, initial_frame, events, last_frame):
+    # Run new trackers over the video with the initializations of each frame, up to 'last_frame'
+    logging.info(f'Rebuilding primary trackers over {last_frame+1} frames ...\n')
+    cap = open_video()
+    if not cap.seek(initial_frame):
+        raise RuntimeError(f'Unable to seek frame {initial_frame} to rebuild the primary trackers')
+    for frame_count in range(last_frame+1):
+        ret, frame = cap.read()
+        if not ret:
+            cap.release()
+            raise RuntimeError(f'Unable to read frame {initial_frame+frame_count} to rebuild the primary trackers')
+        if frame_count > 0:
+            trackers.update(frame)
+        for key, renamed, box in events.get(frame_count, []):
+            trackers.add_target(frame=frame, key=key, box=box, renamed=renamed)
+    cap.release()
+
+def is_recording_valid(file_name, video_stamp):
+    # Recordings of other version of the video give other boxes (any version is valid if the video is not available)
+    rec = np.load(file_name)
+    if 'video_stamp' not in rec:
+        return False
+    return (video_stamp is None) or (rec['video_stamp'].tolist() == video_stamp)
+
+def group_events(events):
+    # Initializations of each frame from (frame, target ID, replacing ID or -1, box)
+    grouped = {}
+    for frame, key, renamed, box in events:
+        grouped.setdefault(int(frame), []).append((int(key), int(renamed), tuple(box)))
+    return grouped
+
+def change_track_boxes(init_boxes, indexes):
+    b = []
+    for box in init_boxes:
+        x1 = box[0]
+        y1 = box[1]
+        x2 = box[2]+box[0]
+        y2 = box[3]+box[1]
+        b.append((x1, y1, x2, y2))
+    boxes = {}
+    for i in indexes:
+        boxes[i] = []
+        boxes[i].append(b.pop(0))
+        boxes[i].append(b.pop(0))
+        boxes[i].append(b.pop(0))
+    return boxes
@@ -2,6 +2,8 @@
 
 import os, sys, numpy as np
 
+from track_store import TrackReader # Sparse tracks files
+
 import logging
 logging.basicConfig(level = logging.INFO, # Messages on terminal
                     format = '%(asctime)s %(message)s',
@@ -33,15 +35,57 @@ def read_paths():
 
     return paths
 
-def read_annotations(path, day, initial_frame, num_frames):
+def read_options(args, options):
+    # Optional arguments given after the positional ones: '--name value', or '--name' for flags
+    options = dict(options)
+    i = 0
+    while i < len(args):
+        key = args[i][2:].replace('-', '_')
+        if not args[i].startswith('--') or key not in options:
+            raise AssertionError(f"Unknown option: {args[i]}")
+        if isinstance(options[key], bool):
+            options[key] = True
+        else:
+            i += 1
+            options[key] = type(options[key])(args[i])
+        i += 1
+    return options
+
+def get_cache_path(output_path):
+    # Directory for the caches kept next to the output
+    cache_path = output_path+'cache/'
+    if not os.path.isdir(cache_path):
+        os.mkdir(cache_path)
+    return cache_path
+
+def get_video_stamp(video_file):
+    # Size and modification time of the video, [-1, -1] if not given
+    if video_file is None:
+        return [-1, -1]
+    stat = os.stat(video_file)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def read_annotations(path, day, initial_frame, num_frames, cache_path=None):
+    if day not in (1, 2, 3):
+        logging.info('Invalid video file\n')
+        sys.exit()
+
+    if cache_path is not None: # Slices of the binary copy of the day
+        arrays = load_annotations_cache(path=path, day=day, cache_path=cache_path)
+        det, cam, lost = [a[initial_frame:initial_frame+num_frames] for a in arrays]
+        return det, cam, lost
+
     try:
-        det = np.loadtxt(open(path+'DATA.csv', 'rb'), delimiter=',', skiprows=initial_frame, max_rows=num_frames)
-        cam = np.loadtxt(open(path+'CAMERA.csv', 'rb'), delimiter=',', skiprows=initial_frame, max_rows=num_frames)
-        lost = np.loadtxt(open(path+'LOST.csv', 'rb'), delimiter=',', skiprows=initial_frame, max_rows=num_frames)
+        det = np.loadtxt(open(path+'DATA.csv', 'rb'), delimiter=',', skiprows=initial_frame, max_rows=num_frames, ndmin=2)
+        cam = np.loadtxt(open(path+'CAMERA.csv', 'rb'), delimiter=',', skiprows=initial_frame, max_rows=num_frames, ndmin=2)
+        lost = np.loadtxt(open(path+'LOST.csv', 'rb'), delimiter=',', skiprows=initial_frame, max_rows=num_frames, ndmin=2)
     except:
         logging.info('Manual annotations not found\n')
         sys.exit()
     
+    return split_day(det=det, cam=cam, lost=lost, day=day)
+
+def split_day(det, cam, lost, day):
     # Split data
     if day == 1:
         det = det[:, 0:32*7]
@@ -55,17 +99,87 @@ def read_annotations(path, day, initial_frame, num_frames):
         det = det[:, 62*7:92*7]
         cam = cam[:, 62:92]
         lost = lost[:, 62:92]
-    else:
-        logging.info('Invalid video file\n')
-        sys.exit()
     
     return det, cam, lost
 
-def read_ground_truth(filename, initial_frame, num_frames):
+def load_annotations_cache(path, day, cache_path):
+    # Memory-mapped .npy copy of the annotations of each day, rebuilt when the CSVs change
+    sources = [path+'DATA.csv', path+'CAMERA.csv', path+'LOST.csv']
+    names = [cache_path+'Annotations_day'+str(day)+'_'+key+'.npy' for key in ('det', 'cam', 'lost')]
+    stamp_file = cache_path+'Annotations_sources.npy'
     try:
-        det = np.loadtxt(open(filename, 'rb'), delimiter=',', skiprows=initial_frame, max_rows=num_frames)
-    except:
-        logging.info('Ground truth file not found\n')
+        stamp = np.array([[os.stat(f).st_size, os.stat(f).st_mtime_ns] for f in sources], dtype=np.int64)
+    except OSError:
+        logging.info('Manual annotations not found\n')
         sys.exit()
-    
+
+    cached = os.path.isfile(stamp_file) and all(os.path.isfile(name) for name in names)
+    if not (cached and np.array_equal(np.load(stamp_file), stamp)):
+        logging.info('Converting manual annotations to binary files ...\n')
+        try:
+            full = [np.loadtxt(open(f, 'rb'), delimiter=',', ndmin=2) for f in sources]
+        except:
+            logging.info('Manual annotations not found\n')
+            sys.exit()
+        for d in (1, 2, 3):
+            for key, array in zip(('det', 'cam', 'lost'), split_day(*full, day=d)):
+                save_array(cache_path+'Annotations_day'+str(d)+'_'+key+'.npy', np.ascontiguousarray(array))
+        save_array(stamp_file, stamp)
+
+    return [np.load(name, mmap_mode='r') for name in names]
+
+def save_array(file_name, array):
+    # Readers never see a partially written file
+    part_name = file_name+'.'+str(os.getpid())+'.part'
+    with open(part_name, 'wb') as f:
+        np.save(f, array)
+    os.replace(part_name, file_name)
+
+def read_ground_truth(filename, initial_frame, num_frames, cache_path=None):
+    boxes, present = read_tracks(filename=filename, initial_frame=initial_frame, num_frames=num_frames, cache_path=cache_path)
+    det = boxes.reshape(boxes.shape[0], -1) # Original layout: 4 columns per track
     return det
+
+def read_tracks(filename, initial_frame=0, num_frames=None, cache_path=None):
+    # Wide tracks CSV (4 columns per track, -1 if absent) as a frames x tracks x 4 array and a presence mask
+    if not os.path.isfile(filename):
+        logging.info('Tracks file not found\n')
+        sys.exit()
+
+    if cache_path is None: # Read as text every time
+        boxes = load_tracks_csv(filename)
+        present = boxes[:, :, 0] != -1
+    else: # Binary copy generated on the first read, in the cache directory
+        name = cache_path+'Tracks_'+os.path.basename(os.path.dirname(os.path.abspath(filename)))+'_'+os.path.basename(filename)
+        boxes_file = name+'.npy'
+        present_file = name+'.present.npy'
+        mtime = os.path.getmtime(filename)
+        cached = all(os.path.isfile(f) and (os.path.getmtime(f) >= mtime) for f in (boxes_file, present_file))
+        if not cached:
+            logging.info(f'Converting {os.path.basename(filename)} to binary files ...\n')
+            boxes = load_tracks_csv(filename)
+            save_array(boxes_file, boxes)
+            save_array(present_file, boxes[:, :, 0] != -1)
+        boxes = np.load(boxes_file, mmap_mode='r')
+        present = np.load(present_file, mmap_mode='r')
+    if num_frames is None:
+        num_frames = boxes.shape[0]-initial_frame
+    return boxes[initial_frame:initial_frame+num_frames], present[initial_frame:initial_frame+num_frames]
+
+def load_tracks_csv(filename):
+    try:
+        det = np.loadtxt(open(filename, 'rb'), delimiter=',', ndmin=2)
+    except:
+        logging.info('Tracks file could not be read\n')
+        sys.exit()
+    return det.astype(np.float32).reshape(det.shape[0], -1, 4)
+
+def read_results(file_prefix, initial_frame, num_frames, cache_path=None):
+    # Tracking results of the window, from the sparse '.trk' file or from the legacy '.csv'
+    if os.path.isfile(file_prefix+'.trk'):
+        reader = TrackReader(file_prefix+'.trk')
+        return reader.read_window(initial_frame=initial_frame, num_frames=num_frames) # Only the rows of the window
+    return read_tracks(filename=file_prefix+'.csv', initial_frame=0, num_frames=num_frames, cache_path=cache_path)
+
+def results_exist(file_prefix):
+    return os.path.isfile(file_prefix+'.trk') or os.path.isfile(file_prefix+'.csv')
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import cv2, sys, os, json, shutil, numpy as np
+
+import read
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+# Participants of each day in the annotations files (columns of CAMERA.csv and LOST.csv)
+DAY_SLOTS = {1: (0, 32), 2: (32, 62), 3: (62, 92)}
+NUM_PARTICIPANTS = 92
+WIDTH, HEIGHT = 960, 540
+LIMBO = (82, 72.5) # Margins of the region where the boxes are valid
+
+
+def main(scenario_path, num_targets=8, num_frames=1000, day=2, camera=3, seed=0, occlusions=2.0, exits=1.0):
+    # Annotations and video of a synthetic scene, in the layout of the dataset; returns the paths to run the scripts on it
+    first, last = DAY_SLOTS[day]
+    if not (0 < num_targets <= last-first):
+        logging.info(f'Number of targets needs to be between 1 and {last-first} for the day {day}\n')
+        sys.exit()
+    if not (0 < num_frames <= 36000):
+        logging.info('Number of frames needs to be between 1 and 36000\n')
+        sys.exit()
+
+    paths = {'data_path': scenario_path+'annotations/',
+             'videos_path': scenario_path+'videos/',
+             'output_path': scenario_path+'output/'}
+    video_file = paths['videos_path']+'30min_day'+str(day)+'_cam'+str(camera)+'_20fps_960x540.MP4'
+    info_file = scenario_path+'Scenario.json'
+    scenario = {'num_targets': num_targets, 'num_frames': num_frames, 'day': day, 'camera': camera, 'seed': seed, 'occlusions': occlusions, 'exits': exits}
+    if os.path.isfile(info_file) and os.path.isfile(video_file):
+        with open(info_file) as f:
+            if json.load(f) == scenario: # Already generated
+                return paths
+
+    logging.info(f'Generating scene: {num_targets} targets, {num_frames} frames ...\n')
+    for path in paths.values():
+        if os.path.isdir(path): # Results of another scene
+            shutil.rmtree(path)
+        os.makedirs(path)
+    det, cam, lost, colors = generate(num_targets=num_targets, num_frames=num_frames, day=day, camera=camera, seed=seed, occlusions=occlusions, exits=exits)
+    np.savetxt(paths['data_path']+'DATA.csv', det, delimiter=',', fmt='%.2f')
+    np.savetxt(paths['data_path']+'CAMERA.csv', cam, delimiter=',', fmt='%d')
+    np.savetxt(paths['data_path']+'LOST.csv', lost, delimiter=',', fmt='%d')
+    render(video_file=video_file, det=det, cam=cam, lost=lost, camera=camera, colors=colors, seed=seed)
+    with open(info_file, 'w') as f:
+        json.dump(scenario, f)
+    logging.info(f'Scene saved to: {scenario_path}\n')
+    return paths
+
+
+def generate(num_targets, num_frames, day, camera, seed, occlusions, exits):
+    # Boxes moving with inertia inside the valid region; 'occlusions' and 'exits' are events per target every 1000 frames
+    rs = np.random.RandomState(seed)
+    det = np.zeros((num_frames, NUM_PARTICIPANTS, 7)) # Column 0 is not used
+    cam = np.zeros((num_frames, NUM_PARTICIPANTS), dtype=np.int64) # 0: on no camera
+    lost = np.zeros((num_frames, NUM_PARTICIPANTS), dtype=np.int64)
+    low = np.array([LIMBO[0], LIMBO[1]])
+    high = np.array([WIDTH-LIMBO[0], HEIGHT-LIMBO[1]])-1
+
+    first = DAY_SLOTS[day][0]
+    colors = {}
+    for p in range(first, first+num_targets):
+        colors[p] = rs.randint(0, 256, size=(2, 3)).tolist() # Upper and lower body
+        w = rs.uniform(45, 75)
+        h = 1.5*w
+        position = rs.uniform(low, high)
+        velocity = rs.uniform(-2, 2, size=2)
+        absent = 0 # Frames left out of the camera
+        hidden = 0 # Frames left occluded
+        for f in range(num_frames):
+            if absent > 0:
+                absent -= 1
+                if absent == 0: # Re-entry close to a side of the region
+                    side = rs.randint(4)
+                    position = rs.uniform(low, high)
+                    position[side%2] = (low if side < 2 else high)[side%2]
+                continue
+            if rs.uniform() < exits/1000:
+                absent = rs.randint(40, 400)
+                hidden = 0
+                continue
+            if (hidden == 0) and (rs.uniform() < occlusions/1000):
+                hidden = rs.randint(5, 60)
+
+            velocity = np.clip(0.95*velocity+rs.normal(0, 0.3, size=2), -3, 3)
+            position = position+velocity
+            bounce = (position < low) | (position > high)
+            velocity[bounce] *= -1
+            position = np.clip(position, low, high)
+            det[f, p, 1:5] = [position[0]-w/2, position[1]-h/2, position[0]+w/2, position[1]+h/2]
+            cam[f, p] = camera
+            if hidden > 0:
+                lost[f, p] = 1
+                hidden -= 1
+    return det.reshape(num_frames, -1), cam, lost, colors
+
+def render(video_file, det, cam, lost, camera, colors, seed):
+    # Boxes drawn over a textured background, the ones closer to the camera (lower on the image) in front
+    rs = np.random.RandomState(seed)
+    background = cv2.GaussianBlur(rs.randint(60, 200, size=(HEIGHT, WIDTH, 3)).astype(np.uint8), (15, 15), 0)
+    boxes = det.reshape(det.shape[0], -1, 7)[:, :, 1:5]
+    writer = cv2.VideoWriter(video_file, cv2.VideoWriter_fourcc(*'mp4v'), 20, (WIDTH, HEIGHT))
+    frame_print = set(np.arange(-1, det.shape[0]-1, 1000)) # To print frame every 1000 frames
+    for f in range(det.shape[0]):
+        if f in frame_print:
+            logging.info(f'Frame: {f} ...')
+        frame = background.copy()
+        visible = np.nonzero((cam[f] == camera) & (lost[f] == 0))[0]
+        for p in visible[np.argsort(boxes[f, visible, 3])]:
+            x1, y1, x2, y2 = boxes[f, p].astype(int)
+            ym = (y1+y2)//2
+            cv2.rectangle(frame, (x1, y1), (x2, ym), colors[p][0], -1)
+            cv2.rectangle(frame, (x1, ym), (x2, y2), colors[p][1], -1)
+        writer.write(frame)
+    writer.release()
+
+if __name__ == '__main__':
+
+    try:
+        scenario_path = sys.argv[1]
+        num_targets = int(sys.argv[2])
+        num_frames = int(sys.argv[3])
+        options = read.read_options(sys.argv[4:], {'day': 2, 'camera': 3, 'seed': 0, 'occlusions': 2.0, 'exits': 1.0})
+    except:
+        print('Parameters not given correctly\n')
+        print('Usage:\n\tpython3 synthetic.py scenario_path num_targets num_frames [--day d] [--camera c] [--seed s] [--occlusions rate] [--exits rate]\n')
+        print('Where rate is the number of events per target every 1000 frames\n')
+        print('Example:\n\tpython3 synthetic.py /tmp/scene/ 8 1000 --occlusions 2 --exits 1\n')
+        sys.exit()
+
+    paths = main(os.path.join(scenario_path, ''), num_targets, num_frames, **options)
+    logging.info(f'To run the scripts on the scene, set in paths.txt: data_path = {paths["data_path"]}, videos_path = {paths["videos_path"]}, output_path = {paths["output_path"]}\n')
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import os, json, resource
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+
+class TelemetrySink:
+    '''
+    One JSON line per frame with the state of the tracker
+    '''
+    def __init__(self, file_name, append=False):
+        self.file_name = file_name
+        self.file = open(file_name, 'a' if append else 'w', buffering=1<<20) # Written in large blocks
+        self.count = 0
+
+    def write(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':'))+'\n')
+        self.count += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def truncate(self, last_frame):
+        # Drop the records after 'last_frame' (frames processed again when a run is resumed) and incomplete lines
+        self.file.flush()
+        size = 0
+        with open(self.file_name, 'rb') as f:
+            for line in f:
+                try:
+                    if (not line.endswith(b'\n')) or (json.loads(line)['frame'] > last_frame):
+                        break
+                except ValueError:
+                    break
+                size += len(line)
+        self.file.truncate(size)
+
+    def close(self):
+        self.file.close()
+        logging.info(f'{self.count} telemetry records saved to: {self.file_name}\n')
+
+
+def get_rss():
+    # Resident memory of the process in bytes (peak resident memory if /proc is not available)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+def read_telemetry(file_name):
+    # Records of a telemetry file as a list of dictionaries, one per frame
+    records = {}
+    with open(file_name) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError: # Last line of an interrupted run
+                continue
+            records[record['frame']] = record # Frames repeated after resuming a run keep the last record
+    return [records[frame] for frame in sorted(records)]
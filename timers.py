@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import json, time, numpy as np
+
+from contextlib import contextmanager
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+
+class StageTimer:
+    '''
+    Time spent on each stage of every frame, summarized as percentiles over the run
+    '''
+    def __init__(self, enabled=True):
+        self.enabled = enabled # A disabled timer measures nothing
+        self.stages = [] # Stages in order of appearance
+        self.current = {} # Seconds of each stage in the frame being processed
+        self.samples = {} # Seconds of each stage in every frame
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter()-t0)
+
+    def add(self, name, seconds):
+        if name not in self.samples:
+            self.stages.append(name)
+            self.samples[name] = []
+        self.current[name] = self.current.get(name, 0)+seconds
+
+    def next_frame(self):
+        # Close the frame: stages that did not run on it count as 0
+        if not self.enabled:
+            return
+        for name in self.stages:
+            self.samples[name].append(self.current.get(name, 0))
+        self.current = {}
+
+    def get_state(self):
+        # Samples only grow, so they are saved apart (checkpoint logs)
+        return {'stages': list(self.stages), 'current': dict(self.current)}
+
+    def set_state(self, state, samples):
+        self.stages = state['stages']
+        self.samples = {name: list(samples.get(name, [])) for name in self.stages}
+        self.current = state['current']
+        self.next_frame() # Close the frame of the state
+
+    def summary(self):
+        stages = {}
+        for name in self.stages:
+            samples = np.array(self.samples[name])
+            if len(samples) == 0:
+                continue
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            counts, edges = np.histogram(samples, bins=np.logspace(-6, 2, 17)) # From 1 us to 100 s
+            stages[name] = {'frames': len(samples),
+                            'total': float(samples.sum()),
+                            'mean': float(samples.mean()),
+                            'p50': float(p50),
+                            'p95': float(p95),
+                            'p99': float(p99),
+                            'max': float(samples.max()),
+                            'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()}}
+        return stages
+
+    def save(self, file_name, info):
+        # JSON report with the run information and the statistics of each stage (seconds per frame)
+        report = dict(info, stages=self.summary())
+        with open(file_name, 'w') as f:
+            json.dump(report, f, indent=1)
+        for name, stats in report['stages'].items():
+            logging.info(f'{name}: p50 {stats["p50"]*1000:.2f} ms, p95 {stats["p95"]*1000:.2f} ms, p99 {stats["p99"]*1000:.2f} ms, total {stats["total"]:.1f} s')
+        logging.info(f'Stage timings saved to: {file_name}\n')
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+import sys, os, csv, queue, threading, numpy as np
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+# One row per box: frame of the video, track ID and coordinates (x1,y1,x2,y2)
+TRACK_RECORD = np.dtype([('frame', '<i4'), ('track', '<i4'), ('box', '<f8', (4,))])
+
+
+class TrackReader:
+    '''
+    Random access by frame to a sparse tracks file
+    '''
+    def __init__(self, file_name):
+        if os.path.getsize(file_name) > 0:
+            self.records = np.memmap(file_name, dtype=TRACK_RECORD, mode='r')
+        else:
+            self.records = np.zeros(0, dtype=TRACK_RECORD)
+
+        index_file = file_name+'.idx.npz'
+        if os.path.isfile(index_file):
+            index = np.load(index_file)
+            self.initial_frame = int(index['initial_frame'])
+            self.offsets = index['offsets']
+            self.num_tracks = int(index['num_tracks']) if 'num_tracks' in index else None
+        else: # Index not written (interrupted run): rebuild it from the records
+            frames = self.records['frame']
+            self.initial_frame = int(frames[0]) if len(frames) else 0
+            num_frames = int(frames[-1])+1-self.initial_frame if len(frames) else 0
+            self.offsets = get_offsets(frames=frames, initial_frame=self.initial_frame, num_frames=num_frames)
+            self.num_tracks = None
+        self.num_frames = len(self.offsets)-1
+
+    def get(self, frame_index):
+        # Records of a frame of the video
+        f = frame_index-self.initial_frame
+        if not (0 <= f < self.num_frames):
+            return self.records[0:0]
+        return self.records[self.offsets[f]:self.offsets[f+1]]
+
+    def get_window(self, initial_frame, num_frames):
+        # Records of the frames of a window
+        first = min(max(initial_frame-self.initial_frame, 0), self.num_frames)
+        last = min(max(initial_frame+num_frames-self.initial_frame, 0), self.num_frames)
+        return self.records[self.offsets[first]:self.offsets[last]]
+
+    def read_window(self, initial_frame, num_frames):
+        # Frames x tracks x 4 array (float32, -1 if absent) and presence mask of the tracks in the window (sorted by track ID)
+        rows = self.get_window(initial_frame=initial_frame, num_frames=num_frames)
+
+        tracks = np.unique(rows['track'])
+        columns = np.searchsorted(tracks, rows['track'])
+        frames = rows['frame']-initial_frame
+        boxes = np.full((num_frames, len(tracks), 4), -1, dtype=np.float32)
+        boxes[frames, columns] = rows['box']
+        present = np.zeros((num_frames, len(tracks)), dtype=bool)
+        present[frames, columns] = True
+        return boxes, present
+
+
+class TrackWriter:
+    '''
+    Appends records to a sparse tracks file from a background thread
+    '''
+    def __init__(self, file_name, initial_frame, offset=0):
+        self.file_name = file_name
+        self.initial_frame = initial_frame
+        if offset > 0: # Resumed run: records after the offset are written again
+            self.file = open(file_name, 'r+b')
+            self.file.truncate(offset*TRACK_RECORD.itemsize)
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(file_name, 'wb')
+        self.queue = queue.Queue() # Records waiting to be written
+        self.queued = offset # Records given to write()
+        self.count = offset # Records written (offset in the file)
+        self.written = threading.Condition() # Notified when records are written
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, records):
+        # Records must be given in frame order; a failure of the writing thread stops the run at once
+        if self.error is not None:
+            raise self.error
+        self.queued += len(records)
+        self.queue.put(records)
+
+    def run(self):
+        while True:
+            records = self.queue.get()
+            if records is None:
+                break
+            try:
+                self.file.write(records.tobytes())
+                self.file.flush() # Records on disk even if the process dies
+                with self.written:
+                    self.count += len(records)
+                    self.written.notify_all()
+            except Exception as e:
+                with self.written:
+                    self.error = e
+                    self.written.notify_all()
+                break
+
+    def wait(self, count):
+        # Block until the first 'count' records are on disk; raises if they will never be
+        with self.written:
+            self.written.wait_for(lambda: (self.count >= count) or (self.error is not None))
+        if self.error is not None:
+            raise self.error
+        os.fsync(self.file.fileno())
+
+    def close(self, num_frames, num_tracks=None):
+        # Wait for the pending records and write the frame index
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+        reader = TrackReader(self.file_name)
+        write_index(file_name=self.file_name, frames=reader.records['frame'], initial_frame=self.initial_frame, num_frames=num_frames, num_tracks=num_tracks)
+        logging.info(f'Tracks saved to: {self.file_name}\n')
+
+
+def get_offsets(frames, initial_frame, num_frames):
+    # Position of the first record of each frame (frames must be sorted)
+    return np.searchsorted(frames, initial_frame+np.arange(num_frames+1)).astype(np.int64)
+
+def get_records(solution_coordinates, initial_frame):
+    # Records from a list with the coordinates (or None) of each track in every frame
+    rows = []
+    for track, coordinates in enumerate(solution_coordinates):
+        for frame, box in enumerate(coordinates):
+            if box is not None:
+                rows.append((initial_frame+frame, track, tuple(box)))
+    records = np.array(rows, dtype=TRACK_RECORD)
+    return records[np.argsort(records['frame'], kind='stable')]
+
+def get_history_records(solution_history, initial_frame):
+    # Records from a list with the (frame, box) of each track on the frames where it is present
+    rows = []
+    for track, boxes in enumerate(solution_history):
+        for frame, box in boxes:
+            rows.append((initial_frame+frame, track, tuple(box)))
+    records = np.array(rows, dtype=TRACK_RECORD)
+    return records[np.argsort(records['frame'], kind='stable')]
+
+def get_frame_records(frame_index, boxes):
+    # Records of one frame from a list of (track ID, box)
+    records = np.zeros(len(boxes), dtype=TRACK_RECORD)
+    records['frame'] = frame_index
+    if len(boxes) > 0:
+        records['track'] = [track for track, box in boxes]
+        records['box'] = [tuple(box) for track, box in boxes]
+    return records
+
+def write_tracks(file_name, records, initial_frame, num_frames, num_tracks=None):
+    # Written apart and then moved, so an existing file is only replaced by a complete one
+    logging.info('Writing tracks ...\n')
+    records = records[np.argsort(records['frame'], kind='stable')]
+    part_name = file_name+'.'+str(os.getpid())+'.part'
+    with open(part_name, 'wb') as f:
+        f.write(records.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    write_index(file_name=part_name, frames=records['frame'], initial_frame=initial_frame, num_frames=num_frames, num_tracks=num_tracks)
+    os.replace(part_name+'.idx.npz', file_name+'.idx.npz')
+    os.replace(part_name, file_name)
+    logging.info(f'Tracks saved to: {file_name}\n')
+
+def write_index(file_name, frames, initial_frame, num_frames, num_tracks=None):
+    # 'num_tracks': tracks are numbered from 0 to num_tracks-1, the columns of the legacy CSV (None: unknown, e.g. MHT IDs)
+    offsets = get_offsets(frames=frames, initial_frame=initial_frame, num_frames=num_frames)
+    if num_tracks is None:
+        np.savez(file_name+'.idx.npz', initial_frame=np.array(initial_frame), offsets=offsets)
+    else:
+        np.savez(file_name+'.idx.npz', initial_frame=np.array(initial_frame), offsets=offsets, num_tracks=np.array(num_tracks))
+
+def sparse_to_wide(file_name, csv_name):
+    # Legacy CSV: one row per frame, 4 columns per track, -1 if the track is not present. Coordinates are written as Python floats,
+    # like write_csv did. Without the number of tracks in the index, columns follow the sorted track IDs of the records
+    reader = TrackReader(file_name)
+    records = reader.records
+    if reader.num_tracks is not None: # Column of each track given by its number, tracks never present included
+        num_tracks = reader.num_tracks
+        columns = records['track']
+    else:
+        tracks = np.unique(records['track'])
+        num_tracks = len(tracks)
+        columns = np.searchsorted(tracks, records['track'])
+    csv_rows = []
+    for f in range(reader.num_frames):
+        line = [-1]*(4*num_tracks)
+        for r in range(reader.offsets[f], reader.offsets[f+1]):
+            c = columns[r]
+            line[4*c:4*c+4] = [str(x) for x in records['box'][r].tolist()]
+        csv_rows.append(line)
+
+    with open(csv_name, 'w') as csv_file:
+        writer = csv.writer(csv_file, lineterminator='\n')
+        writer.writerows(csv_rows)
+    logging.info(f'CSV saved to: {csv_name}\n')
+
+def wide_to_sparse(csv_name, file_name, initial_frame):
+    # Sparse tracks file from a legacy CSV whose first row is 'initial_frame'
+    det = np.loadtxt(open(csv_name, 'rb'), delimiter=',', ndmin=2)
+    boxes = det.reshape(det.shape[0], -1, 4)
+    frames, tracks = np.nonzero(boxes[:, :, 0] != -1) # Sorted by frame and track
+    records = np.zeros(len(frames), dtype=TRACK_RECORD)
+    records['frame'] = initial_frame+frames
+    records['track'] = tracks
+    records['box'] = boxes[frames, tracks]
+    write_tracks(file_name=file_name, records=records, initial_frame=initial_frame, num_frames=det.shape[0], num_tracks=boxes.shape[1])
+
+
+if __name__ == '__main__':
+
+    try:
+        mode = sys.argv[1]
+        if mode == 'to_csv':
+            file_name = sys.argv[2]
+            csv_name = sys.argv[3]
+        elif mode == 'to_sparse':
+            csv_name = sys.argv[2]
+            file_name = sys.argv[3]
+            initial_frame = int(sys.argv[4])
+        else:
+            raise ValueError(mode)
+    except:
+        print('Parameters not given correctly\n')
+        print('Usage:\n\tpython3 track_store.py to_csv tracks_file csv_file\n\tpython3 track_store.py to_sparse csv_file tracks_file initial_frame\n')
+        print('Example:\n\tpython3 track_store.py to_csv Results_day2_cam3_0_700-999.trk Results_day2_cam3_0_700-999.csv\n')
+        sys.exit()
+
+    if mode == 'to_csv':
+        sparse_to_wide(file_name=file_name, csv_name=csv_name)
+    else:
+        wide_to_sparse(csv_name=csv_name, file_name=file_name, initial_frame=initial_frame)
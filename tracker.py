@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
 
-import cv2, sys, time, csv, random, numpy as np, os
+import cv2, sys, time, random, numpy as np, os
 
 from mht import MHT # MHT class
+from frames import VideoReader, FrameCache # Frame source
+from primary_trackers import PrimaryTrackers, ReplayTrackers, is_recording_valid # Primary trackers
+from hist_cache import HistogramCache # Color histograms cache
+from detections import DetectionIndex # Valid annotated boxes of each frame
+from checkpoint import Checkpointer # Resumable runs
+from timers import StageTimer # Time of each stage
+from telemetry import TelemetrySink # Per-frame records of the MHT
+from memory_profile import MemoryProfiler # Growth of the MHT structures
+from mwis_benchmark import GraphWriter # MWIS graphs for the solver benchmark
 import read
+import track_store # Sparse tracks files
 
 import logging
 logging.basicConfig(level = logging.INFO, # Messages on terminal
@@ -11,7 +21,7 @@ logging.basicConfig(level = logging.INFO, # Messages on terminal
                     datefmt = '%H:%M:%S')
 
 
-def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0):
+def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0, frame_cache=False, frame_scale=1.0, record_trackers=False, replay_trackers=False, hist_cache=False, hist_cache_size=500000, checkpoint_interval=1000, resume=False, timing=False, telemetry=False, memory_profile=0, capture_graphs=False):
 
     final_frame = initial_frame+num_frames-1
     if num_frames < 1:
@@ -24,6 +34,9 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
         else:
             final_frame = 35999
             num_frames = final_frame+1-initial_frame
+    if record_trackers and replay_trackers: # A replayed run has no live outputs to record
+        logging.info('Primary trackers can not be recorded and replayed in the same run\n')
+        sys.exit()
 
     data_path = paths['data_path']
     videos_path = paths['videos_path']
@@ -36,33 +49,50 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
     video_file = '30min_day'+str(day)+'_cam'+str(camera)+'_20fps_960x540.MP4'
     video_name = 'Day '+str(day)+' Camera '+str(camera)
 
-    cap = cv2.VideoCapture(videos_path+video_file) # Capture object to read video
+    cache_path = read.get_cache_path(output_path)
+    index_file = cache_path+'FrameIndex_day'+str(day)+'_cam'+str(camera)+'.npz'
+    if frame_cache: # Decoded frames are kept for the next runs
+        cache = FrameCache(cache_path+'Frames_day'+str(day)+'_cam'+str(camera), initial_frame, final_frame, scale=frame_scale, video_file=videos_path+video_file)
+    else:
+        cache = None
+    cap = VideoReader(videos_path+video_file, index_file=index_file, frame_cache=cache) # Object to read video
     if not cap.isOpened(): # Exit if video not opened
         logging.info('Could not open the video\n')
         sys.exit()
-    cap.set(cv2.CAP_PROP_POS_FRAMES, initial_frame) # Set the first frame to read
+    seek = cap.seek(initial_frame) # Set the first frame to read
     ret, frame = cap.read() # Read first frame
-    if not ret: # Exit if reading failure
+    if not (seek and ret): # Exit if reading failure
         logging.info('Unable to read the video file\n')
         sys.exit()
     logging.info(f'Selected video: {video_name}\n')
     
     # Read annotations
     logging.info('Getting annotations ...\n')
-    det_full, cam_full, lost_full = read.read_annotations(path=data_path, day=day, initial_frame=initial_frame, num_frames=num_frames)
+    det_full, cam_full, lost_full = read.read_annotations(path=data_path, day=day, initial_frame=initial_frame, num_frames=num_frames, cache_path=cache_path)
+    detection_index = DetectionIndex(det=det_full, cam=cam_full, lost=lost_full, camera=camera, limbo=True)
 
     # Read annotations from first frame
     frame_index = initial_frame
-    annotations0, num_part0 = read_detections(det=det_full, cam=cam_full, lost=lost_full, camera=camera, frame_index=frame_index-initial_frame)
+    annotations0, num_part0 = read_detections(detection_index=detection_index, frame_index=frame_index-initial_frame)
     logging.info(f'{num_part0} participants annotated on the frame {frame_index}\n')
     
-    # Object MultiTracker (Primary Trackers)
-    multi_tracker = cv2.MultiTracker_create()
-    boxes, targets_tracked = change_det_boxes(init_boxes=annotations0) # From (x1,y1,x2,y2) to (x1,y1,width,height)
-    for box in boxes: # Initialization of primary trackers for each target
-        multi_tracker.add(cv2.TrackerKCF_create(), frame, box)
-        multi_tracker.add(cv2.TrackerMedianFlow_create(), frame, box)
-        multi_tracker.add(cv2.TrackerMIL_create(), frame, box)
+    # Primary trackers, live or replayed from a previous run of the same window
+    trackers_file = cache_path+'Trackers_day'+str(day)+'_cam'+str(camera)+'_'+str(initial_frame)
+    if frame_cache and (frame_scale != 1): # Frames read back from a reduced resolution give other boxes
+        trackers_file = trackers_file+'_s'+str(frame_scale)
+    trackers_file = trackers_file+'.npz'
+    video_stamp = read.get_video_stamp(videos_path+video_file) if os.path.isfile(videos_path+video_file) else None
+    finished_cache = cache if (cache is not None) and cache.complete else None # Only the main reader writes the cache
+    open_video = lambda: VideoReader(videos_path+video_file, index_file=index_file, frame_cache=finished_cache) # To rebuild trackers
+    replay = replay_trackers and os.path.isfile(trackers_file)
+    if replay and not is_recording_valid(trackers_file, video_stamp=video_stamp):
+        logging.info(f'Recording {trackers_file} is from other version of the video, tracking live\n')
+        replay = False
+    if replay:
+        primary_trackers = ReplayTrackers(trackers_file, initial_frame=initial_frame, open_video=open_video)
+    else:
+        primary_trackers = PrimaryTrackers(recording=record_trackers)
+    primary_trackers.init(frame=frame, detections=annotations0) # Initialization of primary trackers for each target
         
     # MHT
     tracking_params = {'N_pruning': N_pruning, # Index for pruning
@@ -76,7 +106,30 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
                 'lost_time_threshold': 25, # Time of loss threshold for Re-ID
                 'lost_time_weight': 0.25, # Time of loss weight on the lost tracks scoring
                 'color_hist_bins': 4} # Number of bins per histogram
-    mht = MHT(tracking_params) # Object MHT initialized
+    if hist_cache: # Color histograms kept for the next runs
+        hist_name = cache_path+'Histograms_day'+str(day)+'_cam'+str(camera)
+        if frame_cache and (frame_scale != 1): # Frames read back from a reduced resolution give other histograms
+            hist_name = hist_name+'_s'+str(frame_scale)
+        histograms = HistogramCache(hist_name, bins=tracking_params['color_hist_bins'], max_size=hist_cache_size, video_file=videos_path+video_file)
+    else:
+        histograms = None
+    stage_timer = StageTimer(enabled=timing) # Per-stage timings report
+    profiler = MemoryProfiler(interval=memory_profile) if memory_profile > 0 else None # Memory sampled every 'memory_profile' frames
+    trk_path = output_path+'tracker/'
+    if not os.path.isdir(trk_path):
+        os.mkdir(trk_path)
+    if telemetry: # Records of a resumed run are added to the ones of the interrupted run, up to its checkpoint
+        sink = TelemetrySink(trk_path+'Telemetry_day'+str(day)+'_cam'+str(camera)+'_'+str(N_pruning)+'_'+str(initial_frame)+'-'+str(final_frame)+'.jsonl', append=resume)
+    else:
+        sink = None
+    if capture_graphs: # Graphs written as they are built, those of a resumed run after the ones of the interrupted run
+        graph_file = trk_path+'Graphs_day'+str(day)+'_cam'+str(camera)+'_'+str(N_pruning)+'_'+str(initial_frame)+'-'+str(final_frame)+'.graphs'
+        graphs = GraphWriter(graph_file, append=resume)
+    else:
+        graphs = None
+    # Detections older than the window of the pruning are moved to a file, the whole history of the last global hypothesis is read back at the end
+    history_file = trk_path+'History_day'+str(day)+'_cam'+str(camera)+'_'+str(N_pruning)+'_'+str(initial_frame)+'-'+str(final_frame)+'.bin'
+    mht = MHT(tracking_params, hist_cache=histograms, initial_frame=initial_frame, timer=stage_timer, telemetry=sink, graph_log=graphs, history_file=history_file) # Object MHT initialized
     logging.info('Running MHT ...\n')
     ti = time.time() # Start timer
     logging.info(f'Frame: {frame_index} ...')
@@ -84,15 +137,54 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
 
     ids = [] # ID's of targets tracked at each frame
     fps_acc = 0 # Processing speed
-    
-    trk_path = output_path+'tracker/'
-    if not os.path.isdir(trk_path):
-        os.mkdir(trk_path)
 
     res_file = trk_path+'Results_day'+str(day)+'_cam'+str(camera)+'_'+str(tracking_params['N_pruning'])
     speed_file = trk_path+'Speed_day'+str(day)+'_cam'+str(camera)+'_'+str(tracking_params['N_pruning'])
     runtime_file = trk_path+'Time_day'+str(day)+'_cam'+str(camera)+'_'+str(tracking_params['N_pruning'])
 
+    # Results are written while tracking, frames older than k-N as given by the global hypothesis of frame k (final for N = 0, a later
+    # global hypothesis may still change them for N > 0). At the end the file is replaced by the whole history of the last global hypothesis
+    results_file = res_file+'_'+str(initial_frame)+'-'+str(final_frame)+'.trk'
+    committed = initial_frame-1 # Last frame written
+    records = 0 # Records written
+    graph_size = 0 # Bytes of graphs written
+
+    # Checkpoints of the run (MHT hypotheses, primary trackers and results written)
+    checkpointer = Checkpointer(trk_path+'Checkpoint_day'+str(day)+'_cam'+str(camera)+'_'+str(tracking_params['N_pruning'])+'_'+str(initial_frame)+'-'+str(final_frame))
+    if resume and checkpointer.exists() and os.path.isfile(results_file):
+        state, logs = checkpointer.load()
+        mht.set_state(state['mht'])
+        stage_timer.set_state(state['stage_timer'], samples=logs)
+        primary_trackers.resume(state['trackers'], open_video=open_video, initial_frame=initial_frame)
+        random.setstate(state['random'])
+        frame_index = state['frame_index']
+        committed = state['committed']
+        records = state['records']
+        graph_size = state['graph_size']
+        ids = state['ids']
+        num_part0 = state['num_part0']
+        fps_acc = state['fps_acc']
+        ti = time.time()-state['elapsed']
+        cap.seek(frame_index+1)
+        logging.info(f'Resuming from frame {frame_index+1}\n')
+    else:
+        if resume:
+            logging.info('No checkpoint to resume from\n')
+        checkpointer.remove() # Checkpoints of a previous run
+    if sink is not None: # Records of the frames after the checkpoint (all of them without one) are written again
+        sink.truncate(last_frame=frame_index)
+    if graphs is not None:
+        graphs.truncate(size=graph_size)
+    writer = track_store.TrackWriter(results_file, initial_frame=initial_frame, offset=records)
+
+    def sync_files(records):
+        # Files a checkpoint refers to on disk: the records written up to its frame and the MHT history
+        writer.wait(records)
+        mht.sync()
+
+    if profiler is not None:
+        profiler.sample(frame_index=frame_index, mht=mht, primary_trackers=primary_trackers)
+
     frame_index += 1
     #########################################
     frame_print = set(np.arange(initial_frame-1, final_frame, 100)) # To print frame every 100 frames
@@ -100,7 +192,8 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
 
     # Process video and track objects
     while cap.isOpened() and (frame_index <= final_frame) and (frame_index <= 35999):
-        ret, frame = cap.read() # Read new frame
+        with stage_timer.stage('decode'):
+            ret, frame = cap.read() # Read new frame
         if not ret: # Exit if reading failure
             break
 
@@ -109,7 +202,8 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
 
         timer = cv2.getTickCount() # Start timer to get FPS
         # Read annotations
-        annotations, num_part = read_detections(det=det_full, cam=cam_full, lost=lost_full, camera=camera, frame_index=frame_index-initial_frame)
+        with stage_timer.stage('annotations'):
+            annotations, num_part = read_detections(detection_index=detection_index, frame_index=frame_index-initial_frame)
         
         if num_part < num_part0:
             logging.info(f'Number of annotations changed from {num_part0} to {num_part} on frame {frame_index}\n')
@@ -118,28 +212,22 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
             logging.info(f'Number of annotations changed from {num_part0} to {num_part} on frame {frame_index}\n')
             num_part0 = num_part
 
-        # Update primary trackers for the current frame
-        ret, multitracker_results = multi_tracker.update(frame)
-        # Turn results from primary trackers into a dictionary for MHT
-        trackers_results = change_track_boxes(init_boxes=multitracker_results, indexes=targets_tracked)
+        # Update primary trackers for the current frame, results as a dictionary for MHT
+        with stage_timer.stage('primary_trackers'):
+            trackers_results = primary_trackers.update(frame)
         
         # Run MHT with annotations (detections) and tracker results
-        solution_coord, track_ids, new_tracks = mht.run(frame=frame, detections=annotations, trackers_results=trackers_results)
+        track_ids, new_tracks = mht.run(frame=frame, detections=annotations, trackers_results=trackers_results)
+        with stage_timer.stage('output'):
+            while committed < frame_index-tracking_params['N_pruning']:
+                committed += 1
+                writer.write(track_store.get_frame_records(frame_index=committed, boxes=mht.get_solution_frame(committed-initial_frame)))
         
         # Update primary trackers when they're lost or there are new targets
-        if len(new_tracks) != 0:
-            for key in new_tracks.keys():
-                if key in ids: # If an existing tracker needs to be updated
-                    i = targets_tracked.index(key)
-                    targets_tracked[i] = random.randint(50,500) # Change ID
-                targets_tracked.append(key) # Append corresponding ID
-
-                # Append new trackers for the target
-                box = new_tracks[key]
-                new_box = (box[0], box[1], box[2]-box[0], box[3]-box[1])
-                multi_tracker.add(cv2.TrackerKCF_create(), frame, new_box)
-                multi_tracker.add(cv2.TrackerMedianFlow_create(), frame, new_box)
-                multi_tracker.add(cv2.TrackerMIL_create(), frame, new_box)
+        with stage_timer.stage('primary_trackers'):
+            primary_trackers.add(frame=frame, new_tracks=new_tracks, ids=ids)
+        if profiler is not None:
+            profiler.sample(frame_index=frame_index, mht=mht, primary_trackers=primary_trackers)
 
         ids = track_ids # Update track ID's
 
@@ -147,6 +235,26 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
         
         fps_acc += fps
 
+        if (checkpoint_interval > 0) and ((frame_index-initial_frame+1) % checkpoint_interval == 0):
+            state = {'mht': mht.get_state(),
+                     'trackers': primary_trackers.get_state(),
+                     'random': random.getstate(),
+                     'frame_index': frame_index,
+                     'committed': committed,
+                     'records': writer.queued,
+                     'ids': ids,
+                     'num_part0': num_part0,
+                     'fps_acc': fps_acc,
+                     'elapsed': time.time()-ti,
+                     'stage_timer': stage_timer.get_state(),
+                     'graph_size': graphs.tell() if graphs is not None else 0}
+            if sink is not None: # Records up to the checkpoint in the file
+                sink.flush()
+            if graphs is not None:
+                graphs.flush()
+            with stage_timer.stage('checkpoint'):
+                checkpointer.save(state, logs=stage_timer.samples, ready=lambda records=writer.queued: sync_files(records))
+
         if frame_index in frame_save: # Save results
             tf = time.time() # End timer
             t_tot = tf-ti        
@@ -154,17 +262,15 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
             logging.info(f'Elapsed time: {tf-ti} seconds\n')
             logging.info(f'{frame_index-initial_frame+1} frames processed ({initial_frame}-{frame_index})\n')
 
-            # Save results to a .CSV file
-            #results_file = res_file+'_'+str(initial_frame)+'-'+str(frame_index)+'.csv'
-            #write_csv(file_name=results_file, solution_coordinates=solution_coord)
-
             fps_file = speed_file+'_'+str(initial_frame)+'-'+str(frame_index)+'.csv'
             np.savetxt(fps_file, [fps_mean], delimiter=',')
             time_file = runtime_file+'_'+str(initial_frame)+'-'+str(frame_index)+'.csv'
             np.savetxt(time_file, [t_tot], delimiter=',')
 
+        stage_timer.next_frame()
         frame_index += 1
 
+    cap.release()
     tf = time.time() # End timer
     t_tot = tf-ti
 
@@ -174,103 +280,53 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
     logging.info(f'Elapsed time: {t_tot} seconds\n')
     logging.info(f'{frame_index-initial_frame} frames processed ({initial_frame}-{frame_index-1})\n')
     
-    # Save results to a .CSV file
-    results_file = res_file+'_'+str(initial_frame)+'-'+str(frame_index-1)+'.csv'
-    write_csv(file_name=results_file, solution_coordinates=solution_coord)
+    # Save the last frames of the solution and the index of the sparse tracks file
+    while committed < frame_index-1:
+        committed += 1
+        writer.write(track_store.get_frame_records(frame_index=committed, boxes=mht.get_solution_frame(committed-initial_frame)))
+    checkpointer.wait() # A checkpoint being written may still wait for the records file
+    writer.close(num_frames=frame_index-initial_frame)
+    # Tracks of the last global hypothesis over all the frames, numbered in its order (same tracks as the columns of the legacy CSV)
+    records = track_store.get_history_records(mht.get_solution_history(), initial_frame=initial_frame)
+    track_store.write_tracks(file_name=results_file, records=records, initial_frame=initial_frame, num_frames=frame_index-initial_frame, num_tracks=len(mht.solution))
+    mht.close()
+    checkpointer.remove() # Run finished
+    if frame_index-1 != final_frame: # End of the video reached before the final frame
+        name = res_file+'_'+str(initial_frame)+'-'+str(frame_index-1)+'.trk'
+        os.replace(results_file, name)
+        os.replace(results_file+'.idx.npz', name+'.idx.npz')
 
     fps_file = speed_file+'_'+str(initial_frame)+'-'+str(frame_index-1)+'.csv'
     np.savetxt(fps_file, [fps_mean], delimiter=',')
     time_file = runtime_file+'_'+str(initial_frame)+'-'+str(frame_index-1)+'.csv'
     np.savetxt(time_file, [t_tot], delimiter=',')
 
-
-def read_detections(det, cam, lost, camera, frame_index):
-    
-    det = det[frame_index]
-    cam = cam[frame_index]
-    lost = lost[frame_index]
-
-    limbo = (82, 72.5)
-    #limbo = (0,0)
-
+    if record_trackers: # Save primary trackers outputs for later replays
+        primary_trackers.save(file_name=trackers_file, initial_frame=initial_frame, video_stamp=video_stamp)
+    if histograms is not None:
+        histograms.save()
+        histograms.close()
+    if sink is not None:
+        sink.close()
+    if graphs is not None:
+        graphs.close()
+        if frame_index-1 != final_frame:
+            os.replace(graph_file, trk_path+'Graphs_day'+str(day)+'_cam'+str(camera)+'_'+str(tracking_params['N_pruning'])+'_'+str(initial_frame)+'-'+str(frame_index-1)+'.graphs')
+    if profiler is not None:
+        profiler.sample(frame_index=frame_index-1, mht=mht, primary_trackers=primary_trackers, force=True)
+        profiler.save(file_name=trk_path+'Memory_day'+str(day)+'_cam'+str(camera)+'_'+str(tracking_params['N_pruning'])+'_'+str(initial_frame)+'-'+str(frame_index-1)+'.json',
+                      info={'day': day, 'camera': camera, 'N_pruning': tracking_params['N_pruning'], 'initial_frame': initial_frame, 'final_frame': frame_index-1})
+    if timing:
+        stage_timer.save(file_name=trk_path+'Stages_day'+str(day)+'_cam'+str(camera)+'_'+str(tracking_params['N_pruning'])+'_'+str(initial_frame)+'-'+str(frame_index-1)+'.json',
+                   info={'day': day, 'camera': camera, 'N_pruning': tracking_params['N_pruning'], 'initial_frame': initial_frame, 'final_frame': frame_index-1})
+
+
+def read_detections(detection_index, frame_index):
+    boxes, participants = detection_index.get(frame_index)
     detections = {}
-    num_part = 0
-    for i, num_cam in enumerate(cam):
-        if (num_cam == camera) and (lost[i] == 0): # If the person is annotated on the right camera and is not lost
-            detection = (det[1+i*7], det[2+i*7], det[3+i*7], det[4+i*7]) # Coordinates of bboxes.
-            center = get_center(box=detection)
-            if good_box(box=detection, center=center, limbo=limbo): # Check if valid box
-                detections[num_part] = detection
-                num_part += 1
-        
-    return detections, num_part
-
-def good_box(box, center, limbo):
-    limbo = limbo
-    if (box != (0,0,0,0)) and (limbo[0] <= center[0] < 960-limbo[0]) and (limbo[1] <= center[1] < 540-limbo[1]): # If box inside permitted region
-        approved = True
-    else:
-        approved = False 
-    return approved
-
-def get_center(box):
-    x1 = box[0]
-    y1 = box[1]
-    x2 = box[2]
-    y2 = box[3]
-        
-    xc = (x1+x2)/2
-    yc = (y1+y2)/2
-    center = (xc, yc)
-    return center
-
-def change_det_boxes(init_boxes):
-    boxes = []
-    targets_tracked = []
-    for i, box in init_boxes.items():
-        boxes.append((box[0], box[1], box[2]-box[0], box[3]-box[1]))
-        targets_tracked.append(i)
-    return boxes, targets_tracked
-
-def change_track_boxes(init_boxes, indexes):
-    b = []
-    for box in init_boxes:
-        x1 = box[0]
-        y1 = box[1]
-        x2 = box[2]+box[0]
-        y2 = box[3]+box[1]
-        b.append((x1, y1, x2, y2))
-    boxes = {}
-    for i in indexes:
-        boxes[i] = []
-        boxes[i].append(b.pop(0))
-        boxes[i].append(b.pop(0))
-        boxes[i].append(b.pop(0))
-    return boxes
-
-def write_csv(file_name, solution_coordinates):
-    logging.info('Writing CSV ...\n')
-    csv_rows = []
-    people = len(solution_coordinates)
-    frames = len(solution_coordinates[0])
-
-    for frame in range(frames):
-        line = []
-        for track in range(people):
-            coordinate = solution_coordinates[track][frame]
-            if coordinate is None: # If target not present in the frame, coordinates will be (-1,-1,-1,-1)
-                x1 = y1 = x2 = y2 = -1
-            else:
-                x1, y1, x2, y2 = [str(x) for x in coordinate]
-            line = line + [x1, y1, x2, y2]
-        csv_rows.append(line)
-    
-    with open(file_name, 'w') as csv_file:
-        writer = csv.writer(csv_file, lineterminator='\n')
-        writer.writerows(csv_rows)
-
-    logging.info(f'CSV saved to: {file_name}\n')
-
+    for i, box in enumerate(boxes):
+        detections[i] = tuple(box) # Coordinates of bboxes
+    return detections, len(detections)
 
 if __name__ == '__main__':
     
@@ -280,12 +336,13 @@ if __name__ == '__main__':
         initial_frame = int(sys.argv[3])
         num_frames = int(sys.argv[4])
         N_pruning = int(sys.argv[5])
+        options = read.read_options(sys.argv[6:], {'frame_cache': False, 'frame_scale': 1.0, 'record_trackers': False, 'replay_trackers': False, 'hist_cache': False, 'hist_cache_size': 500000, 'checkpoint_interval': 1000, 'resume': False, 'timing': False, 'telemetry': False, 'memory_profile': 0, 'capture_graphs': False})
     except:
         print('Parameters not given correctly\n')
-        print('Usage:\n\tpython3 tracker.py day camera initial_frame num_frames N_pruning\n')
+        print('Usage:\n\tpython3 tracker.py day camera initial_frame num_frames N_pruning [--frame-cache] [--frame-scale scale] [--record-trackers] [--replay-trackers] [--hist-cache] [--hist-cache-size size] [--checkpoint-interval frames] [--resume] [--timing] [--telemetry] [--memory-profile frames] [--capture-graphs]\n')
         print('Example:\n\tpython3 tracker.py 2 3 700 300 0\n')
         sys.exit()
 
     paths = read.read_paths()
 
-    main(paths, day, camera, initial_frame, num_frames, N_pruning)
\ No newline at end of file
+    main(paths, day, camera, initial_frame, num_frames, N_pruning, **options)
\ No newline at end of file
@@ -42,27 +42,14 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
     filename = trk_path+'Evaluation_day'+str(day)+'_cam'+str(camera)+'_'+str(N_pruning)
 
     ti = time.time() # Start timer
-    results, erase = get_results(path=trk_path, day=day, camera=camera, N_pruning=N_pruning, initial_frame=initial_frame, num_frames=num_frames)
-    ground_truth = get_ground_truth(paths=paths, day=day, camera=camera, initial_frame=initial_frame, num_frames=num_frames)
-    
-    meas = results
-    gtruth = ground_truth
-    for e_frame in erase:
-        del meas[e_frame]
-        del gtruth[e_frame]
+    boxes, present, erase = get_results(path=trk_path, day=day, camera=camera, N_pruning=N_pruning, initial_frame=initial_frame, num_frames=num_frames, cache_path=read.get_cache_path(output_path))
+    gt_boxes, gt_present = get_ground_truth(paths=paths, day=day, camera=camera, initial_frame=initial_frame, num_frames=num_frames)
+    frames = np.flatnonzero(present.any(axis=1)) # Frames with results
 
     eval_info = {}
-    # Evaluation of the tracker with the dictionaries
+    # Evaluation of the tracker with the arrays of boxes
     logging.info('Evaluating tracking results ...\n')
-    clear = clear_mot.ClearMetrics(gtruth, meas, 10) # Distance threshold for a measurement to be considered a true positive
-    clear.match_sequence() # Perform the evaluation
-    evaluation = [clear.get_mota(),
-                clear.get_motp(),
-                clear.get_fn_count(),
-                clear.get_fp_count(),
-                clear.get_mismatches_count(),
-                clear.get_object_count(),
-                clear.get_matches_count()]
+    evaluation = get_evaluation(gt_boxes=gt_boxes[frames], gt_present=gt_present[frames], boxes=boxes[frames], present=present[frames], frames=frames)
 
     logging.info('Evaluation finished\n')
     logging.info(f'Results:\nMOTA: {evaluation[0]}, MOTP: {evaluation[1]}, FN: {evaluation[2]}, FP: {evaluation[3]}\nMismatches: {evaluation[4]}, Objects: {evaluation[5]}, Matches: {evaluation[6]}\n')
@@ -77,36 +64,20 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
     for frame in sub_frames:
         if (frame > 0):
             #results, e = get_results(path=trk_path, day=day, camera=camera, N_pruning=N_pruning, initial_frame=initial_frame, num_frames=frame+1)
-            meas = results
-            gtruth = ground_truth
-
-            for e_frame in sorted(gtruth.keys(), reverse=True):
-                if (e_frame > frame):
-                    del gtruth[e_frame]
-                    del meas[e_frame]
-                else:
-                    break
+            frames = frames[frames <= frame]
 
             for e_frame in erase:
                 er = e_frame-initial_frame
-                if er < max(gtruth.keys()):
-                    del meas[er]
-                    del gtruth[er]
-            
-            meas = clean_dictionary(dic=meas)
-            gtruth = clean_dictionary(dic=gtruth)
-            
+                if er < frames.max():
+                    frames = frames[frames != er]
+
+            # Tracks present in the frames evaluated
+            gt_tracks = gt_present[frames].any(axis=0)
+            tracks = present[frames].any(axis=0)
+
             logging.info('Evaluating tracking results ...\n')
-            clear = clear_mot.ClearMetrics(gtruth, meas, 10) # Distance threshold for a measurement to be considered a true positive
-            clear.match_sequence() # Perform the evaluation
+            evaluation = get_evaluation(gt_boxes=gt_boxes[frames][:, gt_tracks], gt_present=gt_present[frames][:, gt_tracks], boxes=boxes[frames][:, tracks], present=present[frames][:, tracks], frames=frames)
             tf = time.time() # End timer
-            evaluation = [clear.get_mota(),
-                        clear.get_motp(),
-                        clear.get_fn_count(),
-                        clear.get_fp_count(),
-                        clear.get_mismatches_count(),
-                        clear.get_object_count(),
-                        clear.get_matches_count()]
 
             logging.info('Evaluation finished\n')
             logging.info(f'Results:\nMOTA: {evaluation[0]}, MOTP: {evaluation[1]}, FN: {evaluation[2]}, FP: {evaluation[3]}\nMismatches: {evaluation[4]}, Objects: {evaluation[5]}, Matches: {evaluation[6]}\n')
@@ -131,83 +102,36 @@ def get_ground_truth(paths, day, camera, initial_frame, num_frames):
     
     # Read ground truth
     logging.info('Getting ground truth ...\n')
-    det_full = read.read_ground_truth(filename=gt_name, initial_frame=initial_frame, num_frames=num_frames)
-
-    frame_print = set(np.arange(-1, num_frames-1, 100)) # To print frame every 100 frames
-    gtruth = {}
-    for frame in range(num_frames):
-        if frame in frame_print:
-            logging.info(f'Frame: {initial_frame+frame} ...')
-
-        gtruth[frame] = []
-        det = det_full[frame]
-                
-        people = int(len(det)/4)
-        for i in range(people):
-            if det[4*i] != -1:
-                detection = [det[4*i], det[4*i+1], det[4*i+2], det[4*i+3]]
-                gtruth[frame].append(np.array(detection))
-            else:
-                gtruth[frame].append(None)
-
-    gtruth = clean_dictionary(dic=gtruth)
-
-    return gtruth
-
-def clean_dictionary(dic):
-    people = len(dic[0])
-    valid = np.zeros([people])
-    for lis in dic.values():
-        for person in range(people):
-            if lis[person] is not None:
-                valid[person] += 1
-
-    erase = []
-    for person in range(people):
-        if valid[person] == 0:
-            erase.append(person)
-    for e_person in sorted(erase, reverse=True):
-        for lis in dic.values():
-            del lis[e_person]
-
-    return dic
-
-def get_results(path, day, camera, N_pruning, initial_frame, num_frames):
-    trk_name = path+'Results_day'+str(day)+'_cam'+str(camera)+'_'+str(N_pruning)+'_'+str(initial_frame)+'-'+str(num_frames+initial_frame-1)+'.csv'
-    if not os.path.isfile(trk_name):
+    boxes, present = read.read_tracks(filename=gt_name, initial_frame=initial_frame, num_frames=num_frames, cache_path=read.get_cache_path(paths['output_path']))
+
+    tracks = present.any(axis=0) # Participants never present in the window are left out
+
+    return boxes[:, tracks], present[:, tracks]
+
+def get_results(path, day, camera, N_pruning, initial_frame, num_frames, cache_path=None):
+    trk_name = path+'Results_day'+str(day)+'_cam'+str(camera)+'_'+str(N_pruning)+'_'+str(initial_frame)+'-'+str(num_frames+initial_frame-1)
+    if not read.results_exist(trk_name):
         logging.info('Results file does not exist\n')
         sys.exit()
     
     # Read results
     logging.info('Getting tracking results ...\n')
-    try:
-        det_full = np.loadtxt(open(trk_name, 'rb'), delimiter=',')
-    except:
-        logging.info('Tracking results file not found\n')
-        sys.exit()
+    boxes, present = read.read_results(file_prefix=trk_name, initial_frame=initial_frame, num_frames=num_frames, cache_path=cache_path)
+
+    erase = np.flatnonzero(~present.any(axis=1)) # Frames without results
+    return boxes, present, erase
 
-    frame_print = set(np.arange(-1, num_frames-1, 100)) # To print frame every 100 frames
-    results = {}
-    erase = []
-    for frame in range(num_frames):
-        if frame in frame_print:
-            logging.info(f'Frame: {initial_frame+frame} ...')
-        
-        results[frame] = []
-        det = det_full[frame]
-
-        people = int(len(det)/4)
-        erase_frame = True
-        for i in range(people):
-            if det[4*i] != -1:
-                detection = [det[4*i], det[4*i+1], det[4*i+2], det[4*i+3]]
-                results[frame].append(np.array(detection))
-                erase_frame = False
-            else:
-               results[frame].append(None)
-        if erase_frame:
-            erase.append(frame)
-    return results, erase
+def get_evaluation(gt_boxes, gt_present, boxes, present, frames):
+    # CLEAR MOT metrics of the frames given, with their frame numbers
+    clear = clear_mot.ClearMetrics(gt_boxes, boxes, 10, gt_present, present, frames) # Distance threshold for a measurement to be considered a true positive
+    clear.match_sequence() # Perform the evaluation
+    return [clear.get_mota(),
+            clear.get_motp(),
+            clear.get_fn_count(),
+            clear.get_fp_count(),
+            clear.get_mismatches_count(),
+            clear.get_object_count(),
+            clear.get_matches_count()]
 
 def write_csv(file_name, info):
     logging.info('Writing output CSV ...\n')
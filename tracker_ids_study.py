@@ -49,13 +49,14 @@ def main(paths, day=2, camera=3, initial_frame=0, num_frames=36000, N_pruning=0)
     # Read ground truth
     logging.info('Getting ground truth ...\n')
     gt_name = gt_path+'GroundTruth_day'+str(day)+'_cam'+str(camera)+'_limbo.csv'
-    gtruth_full = read.read_ground_truth(filename=gt_name, initial_frame=initial_frame, num_frames=num_frames)
+    gtruth_full = read.read_ground_truth(filename=gt_name, initial_frame=initial_frame, num_frames=num_frames, cache_path=read.get_cache_path(output_path))
 
     # Read results
-    r_name = trk_path+'Results_day'+str(day)+'_cam'+str(camera)+'_'+str(N_pruning)+'_'+str(initial_frame)+'-'+str(final_frame)+'.csv'
+    r_name = trk_path+'Results_day'+str(day)+'_cam'+str(camera)+'_'+str(N_pruning)+'_'+str(initial_frame)+'-'+str(final_frame)
     logging.info('Getting tracking results ...\n')
     try:
-        results_full = np.loadtxt(open(r_name, 'rb'), delimiter=',')
+        boxes, present = read.read_results(file_prefix=r_name, initial_frame=initial_frame, num_frames=num_frames, cache_path=read.get_cache_path(output_path))
+        results_full = boxes.reshape(boxes.shape[0], -1) # 4 columns per track
     except:
         logging.info('Tracking results file not found\n')
         sys.exit()
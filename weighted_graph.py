@@ -11,6 +11,7 @@ class WeightedGraph(Graph):
     def __init__(self, graph_dict=None):
         Graph.__init__(self, graph_dict)
         self.__weights = {}
+        self.num_sets = 0 # Maximal independent sets found by the last call to mwis()
 
     def mwis(self):
         """Determine the maximum weighted independent set."""
@@ -19,6 +20,7 @@ class WeightedGraph(Graph):
         complement = self.complement()
         ind_sets = []
         self.bron_kerbosch3(complement, ind_sets)
+        self.num_sets = len(ind_sets)
 
         # Find the maximum weighted set
         max_weight = min(self.__weights.values())
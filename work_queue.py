@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+import sys, os, json, time, socket
+
+from multiprocessing import Process, Queue
+from queue import Empty
+
+import read
+import batch # Jobs of a sweep
+
+import logging
+logging.basicConfig(level = logging.INFO, # Messages on terminal
+                    format = '%(asctime)s %(message)s',
+                    datefmt = '%H:%M:%S')
+
+# Subdirectories of the queue: job descriptions, claims of running jobs, finished and failed jobs, clock files of the workers
+STATES = ['jobs', 'claims', 'done', 'failed', 'clock']
+
+
+class WorkQueue:
+    '''
+    Jobs of sweeps shared through a directory, drained by workers on any host without a central service
+    '''
+    def __init__(self, queue_path, heartbeat=30, timeout=300):
+        self.queue_path = queue_path
+        self.heartbeat = heartbeat # Seconds between updates of the claim of a running job
+        self.timeout = timeout # Seconds without heartbeat before a claim is considered abandoned
+        self.worker = socket.gethostname()+'_'+str(os.getpid())
+        for state in STATES:
+            os.makedirs(queue_path+state, exist_ok=True)
+
+    def get_file(self, state, name):
+        return self.queue_path+state+'/'+name+'.json'
+
+    def write(self, state, name, data):
+        # Other workers never read a partially written file
+        file_name = self.get_file(state, name)
+        part_name = file_name+'.'+self.worker+'.part'
+        with open(part_name, 'w') as f:
+            json.dump(data, f)
+        os.replace(part_name, file_name)
+
+    def names(self, state):
+        return set(name[:-5] for name in os.listdir(self.queue_path+state) if name.endswith('.json'))
+
+    def submit(self, jobs, stale):
+        # Add jobs to the queue; the ones that are up to date are marked as done
+        submitted = time.time()
+        for index, job in enumerate(jobs):
+            name = job['name']
+            self.write('jobs', name, dict(job, order=[submitted, index]))
+            for state in ('done', 'failed'):
+                if os.path.isfile(self.get_file(state, name)):
+                    os.remove(self.get_file(state, name))
+            if name not in stale:
+                self.write('done', name, {'worker': self.worker, 'up_to_date': True})
+        logging.info(f'{len(jobs)} jobs submitted, {len(stale)} to run\n')
+
+    def load_jobs(self):
+        jobs = []
+        for name in self.names('jobs'):
+            try:
+                with open(self.get_file('jobs', name)) as f:
+                    jobs.append(json.load(f))
+            except (OSError, ValueError): # Replaced while reading it
+                continue
+        return sorted(jobs, key=lambda job: job['order']) # Dependencies first
+
+    def now(self):
+        # Clock of the shared filesystem, the one setting the times of the claims
+        clock_file = self.get_file('clock', self.worker)
+        with open(clock_file, 'w'):
+            pass
+        return os.path.getmtime(clock_file)
+
+    def claim(self, name):
+        # Only one worker can create the claim file
+        try:
+            fd = os.open(self.get_file('claims', name), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.worker)
+        return True
+
+    def owns(self, name):
+        try:
+            with open(self.get_file('claims', name)) as f:
+                return f.read() == self.worker
+        except OSError:
+            return False
+
+    def release(self, name):
+        if self.owns(name):
+            os.remove(self.get_file('claims', name))
+
+    def requeue_stale(self):
+        # Claims of workers that stopped sending heartbeats are removed, so the jobs can be claimed again
+        now = self.now()
+        for name in self.names('claims'):
+            claim_file = self.get_file('claims', name)
+            try:
+                if now-os.path.getmtime(claim_file) < self.timeout:
+                    continue
+                stale_file = claim_file+'.'+self.worker+'.stale'
+                os.rename(claim_file, stale_file) # Only one worker succeeds
+                if now-os.path.getmtime(stale_file) < self.timeout:
+                    # Requeued and claimed again by others since it was checked: the fresh claim is put back
+                    try:
+                        os.link(stale_file, claim_file)
+                    except FileExistsError:
+                        logging.info(f'Claim of {name} was lost while checking it\n')
+                    os.remove(stale_file)
+                    continue
+            except OSError:
+                continue
+            os.remove(stale_file)
+            logging.info(f'Requeued {name}: no heartbeat for {self.timeout} seconds\n')
+
+    def work(self, paths, poll=5):
+        # Run jobs until all of them are finished or failed
+        logging.info(f'Worker {self.worker} started\n')
+        while True:
+            jobs = self.load_jobs()
+            done = self.names('done')
+            failed = self.names('failed')
+            if all((job['name'] in done) or (job['name'] in failed) for job in jobs):
+                break
+            self.requeue_stale()
+
+            # Jobs depending on a failed one are not run
+            for job in jobs:
+                if (job['name'] not in done) and (job['name'] not in failed) and any(dep in failed for dep in job['deps']):
+                    self.write('failed', job['name'], {'worker': self.worker, 'error': 'A dependency failed'})
+                    failed.add(job['name'])
+
+            claimed = self.names('claims')
+            to_run = set(job['name'] for job in jobs if (job['name'] not in done) and (job['name'] not in failed))
+            ranks = batch.get_ranks(jobs=jobs, stale=to_run)
+            ready = [job for job in jobs if (job['name'] in to_run) and (job['name'] not in claimed) and all(dep in done for dep in job['deps'])]
+            job = None
+            for candidate in sorted(ready, key=lambda job: ranks[job['name']], reverse=True):
+                if self.claim(candidate['name']):
+                    job = candidate
+                    break
+            if job is None: # Jobs running on other workers
+                time.sleep(poll)
+                continue
+            if os.path.isfile(self.get_file('done', job['name'])): # Finished by another worker before the claim
+                self.release(job['name'])
+                continue
+            self.run(paths=paths, job=job)
+        if os.path.isfile(self.get_file('clock', self.worker)):
+            os.remove(self.get_file('clock', self.worker))
+        logging.info(f'Worker {self.worker} finished: no jobs left\n')
+
+    def run(self, paths, job):
+        # The job runs in a child process, stopped if another worker takes the claim; the claim gets a heartbeat meanwhile
+        name = job['name']
+        logging.info(f'Starting {name}\n')
+        errors = Queue()
+        process = Process(target=run_job, args=(paths, job, errors))
+        process.start()
+        while True:
+            process.join(self.heartbeat)
+            if not process.is_alive():
+                break
+            if not self.owns(name):
+                logging.info(f'Claim of {name} was taken by another worker, stopping the job\n')
+                process.terminate()
+                process.join()
+                return
+            os.utime(self.get_file('claims', name))
+
+        if not self.owns(name): # Taken over while finishing: the new owner reports it
+            logging.info(f'Claim of {name} was taken by another worker\n')
+            return
+        if process.exitcode == 0:
+            self.write('done', name, {'worker': self.worker})
+            logging.info(f'Finished {name}\n')
+        else:
+            try:
+                error = errors.get(timeout=1)
+            except Empty: # Killed before reporting
+                error = 'Exit code '+str(process.exitcode)
+            self.write('failed', name, {'worker': self.worker, 'error': error})
+            logging.info(f'Job {name} failed: {error}\n')
+        self.release(name)
+
+    def status(self):
+        jobs = self.load_jobs()
+        done = self.names('done')
+        failed = self.names('failed')
+        claimed = self.names('claims')-done-failed
+        logging.info(f'{len(jobs)} jobs: {len(done)} done, {len(failed)} failed, {len(claimed)} running, {len(jobs)-len(done)-len(failed)-len(claimed)} waiting\n')
+        for name in sorted(failed):
+            with open(self.get_file('failed', name)) as f:
+                logging.info(f'{name}: {json.load(f)["error"]}\n')
+
+
+def run_job(paths, job, errors):
+    # Child process of a job: the error, if any, is sent back to the worker
+    try:
+        batch.run_job(paths, job)
+    except Exception as e:
+        errors.put(repr(e))
+        sys.exit(1)
+
+def get_queue_path(output_path):
+    return output_path+'queue/'
+
+def start_worker(paths, heartbeat, timeout):
+    WorkQueue(get_queue_path(paths['output_path']), heartbeat=heartbeat, timeout=timeout).work(paths)
+
+def main(paths, mode, grid=None, processes=1, heartbeat=30, timeout=300):
+    output_path = paths['output_path']
+    if not os.path.isdir(output_path):
+        logging.info('Output directory does not exist\n')
+        sys.exit()
+    queue = WorkQueue(get_queue_path(output_path), heartbeat=heartbeat, timeout=timeout)
+
+    if mode == 'submit':
+        methods, days, cameras, params, initial_frame, num_frames = grid
+        num_frames = min(num_frames, 36000-initial_frame)
+        batch.prepare_output(paths=paths, methods=methods, days=days)
+        jobs = batch.get_jobs(paths=paths, methods=methods, days=days, cameras=cameras, params=params, initial_frame=initial_frame, num_frames=num_frames)
+        queue.submit(jobs=jobs, stale=batch.get_stale_jobs(jobs))
+    elif mode == 'worker':
+        workers = [Process(target=start_worker, args=(paths, heartbeat, timeout)) for i in range(processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    queue.status()
+
+if __name__ == '__main__':
+
+    try:
+        mode = sys.argv[1]
+        grid = None
+        if mode == 'submit':
+            grid = (sys.argv[2].split(','), batch.get_list(sys.argv[3]), batch.get_list(sys.argv[4]), batch.get_list(sys.argv[5]), int(sys.argv[6]), int(sys.argv[7]))
+            options = read.read_options(sys.argv[8:], {})
+        elif mode == 'worker':
+            options = read.read_options(sys.argv[2:], {'processes': 1, 'heartbeat': 30, 'timeout': 300})
+        elif mode == 'status':
+            options = read.read_options(sys.argv[2:], {})
+        else:
+            raise ValueError(mode)
+    except:
+        print('Parameters not given correctly\n')
+        print('Usage:\n\tpython3 work_queue.py submit methods days cameras params initial_frame num_frames\n\tpython3 work_queue.py worker [--processes n] [--heartbeat seconds] [--timeout seconds]\n\tpython3 work_queue.py status\n')
+        print('Example:\n\tpython3 work_queue.py submit tracker 1,2,3 1,2,3 0,1,2 0 36000\n\tpython3 work_queue.py worker --processes 8\n')
+        sys.exit()
+
+    paths = read.read_paths()
+
+    main(paths, mode, grid, **options)